@@ -0,0 +1,656 @@
+import atexit
+import datetime
+import log_config
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import simpleTeensyComs
+
+from channels import CommandQueue, SPSCRing
+from device_registry import DeviceTable
+from perf import stats as perf_stats
+from polling import DEFAULT_REPORT_INTERVAL, PollingScheduler
+from recorder import SESSION_FORMAT, SessionReader, SessionRecorder
+from replay import ReplayDevice, ReplaySource
+from sample_bus import SampleBus, unique_bus_name
+from teensy_sim import FIRST_SIM_SERIAL, TeensySimulator
+
+STATUS_CONNECTION_FAIL = "Disconnected"
+STATUS_CONNECTION_SUCCESS = "Connected"
+
+TIME_FORMAT = "%Y-%m-%d-%H:%M:%S"
+
+# failed bulk reads before a node is treated as lacking bulk read support
+BULK_PROBE_ATTEMPTS = 3
+
+# fade command batches a node's channel holds, learner to node poller
+# each batch is a list of (byte string, value) of the actuators whose target changed
+FADE_QUEUE_SIZE = 8
+# seconds a forwarded batch may wait for room in a full channel before it is dropped
+FADE_PUSH_TIMEOUT = 0.5
+
+# events reported by the pollers as (event, teensy serial number, payload)
+EVENT_STATUS = 'status'
+EVENT_MESSAGE = 'message'
+EVENT_CONNECTED = 'connected'
+EVENT_DEVICES = 'devices'
+EVENT_RATES = 'rates'
+EVENT_READY = 'ready'
+# perf.PerfStats.take() of the acquisition process, once per report interval
+EVENT_PERF = 'perf'
+
+# commands to the acquisition process as (command, args)
+CMD_CONNECT = 'connect'
+CMD_DISCONNECT = 'disconnect'
+CMD_FADE = 'fade'
+CMD_RECORD_START = 'record_start'
+CMD_RECORD_STOP = 'record_stop'
+CMD_RECORD_ACTUATORS = 'record_actuators'
+CMD_RECORD_CBLA = 'record_cbla'
+CMD_STOP = 'stop'
+
+# config entries that choose and drive the nodes, sent with every CMD_CONNECT so the
+# acquisition process connects with the settings of the moment rather than those it started with
+CONNECT_OPTIONS = ('serial_number', 'com_port', 'com_serial', 'replay_session', 'replay_speed',
+    'sim_nodes', 'sim_sensors', 'sim_actuators', 'sim_latency', 'sim_jitter', 'sim_failure_rate',
+    'bulk_read', 'bulk_fade', 'poll_period', 'rescan_period')
+
+# statistics of the acquisition process are merged under this source, see perf.PerfStats.merge
+PERF_SOURCE = 'acquisition'
+
+# seconds between heartbeats of the acquisition process, and to wait for it to come up
+HEARTBEAT_INTERVAL = 0.1
+START_TIMEOUT = 30.0
+
+acq_log = logging.getLogger(log_config.ACQUISITION)
+acq_sample_log = logging.getLogger(log_config.ACQUISITION_SAMPLES)
+
+def time_stamp():
+    return datetime.datetime.now().strftime(TIME_FORMAT)
+
+# list of (teensy serial number, com port) pairs
+# serial_number and com_port accept comma separated lists, one entry per node
+def get_nodes(config):
+    serials = [int(sn) for sn in str(config['serial_number']).split(',') if sn.strip()]
+    ports = [port.strip() for port in str(config['com_port']).split(',') if port.strip()]
+    return list(zip(serials, ports))
+
+# teensy serial numbers get_coms connects to, without opening any port
+def configured_nodes(config):
+    if (config['replay_session']):
+        try:
+            return sorted(set(key[0] for key in SessionReader(config['replay_session']).device_keys))
+        except (OSError, ValueError):
+            return []
+    if (int(config['sim_nodes']) > 0):
+        return [FIRST_SIM_SERIAL + i for i in range(int(config['sim_nodes']))]
+    return [teensy_serial for teensy_serial, com_port in get_nodes(config)]
+
+# communication backend and its nodes
+# plays back config['replay_session'] or simulates config['sim_nodes'] nodes
+# instead of using the serial ports if either is set
+def get_coms(config):
+    if (config['replay_session']):
+        source = ReplaySource(config['replay_session'], float(config['replay_speed']))
+        return source, source.get_nodes()
+    if (int(config['sim_nodes']) > 0):
+        sim = TeensySimulator(int(config['sim_nodes']), int(config['sim_sensors']), int(config['sim_actuators']),
+            float(config['sim_latency']), float(config['sim_jitter']), failure_rate=float(config['sim_failure_rate']))
+        return sim, sim.get_nodes()
+    return simpleTeensyComs, get_nodes(config)
+
+# (address, type, port) of a device, picklable unlike the device objects of the comms modules
+def device_record(dev):
+    return (dev.address, dev.type, dev.port)
+
+def device_from_record(record):
+    return ReplayDevice(*record)
+
+'''
+    reader for a single Teensy node, its loop runs on one thread per serial port
+    continuously sends the queued fade commands and reads the node's sensors into store;
+    connection changes and the device list are reported through notify(event, teensy serial, payload)
+'''
+class NodePoller(object):
+    # coms is simpleTeensyComs or an object with the same functions (e.g. replay.ReplaySource)
+    def __init__(self, teensy_serial, com_port, coms, config, store, notify, epoch=None):
+        self.teensy_serial = teensy_serial
+        self.com_port = com_port
+        self.coms = coms
+        self.config = config
+        self.store = store
+        self.notify = notify
+        self.com_serial = config['com_serial']
+        self.teensyComms = None
+        self.devices = None
+        # descriptor table of this node's devices, built with self.devices
+        self.device_table = DeviceTable()
+        # the devices are enumerated again at this time.monotonic(), see rescan
+        self.next_rescan = 0.0
+        # False while the user disconnected the port, a port closed by a failure is reopened
+        self.reconnect = False
+        # SessionRecorder the sweeps are recorded to, None when not recording
+        self.recorder = None
+
+        self.thread = None
+        self.running = True
+
+        # bulk reads are an optional extension of the serial protocol: simpleTeensyComs only
+        # has the per-device Read, so on the real nodes every sensor is read one by one;
+        # sources with a ReadMany (teensy_sim) are probed, None until probed,
+        # False if the source or its firmware does not answer bulk reads
+        self.bulk_read_supported = None if (getattr(coms, 'ReadMany', None) is not None) else False
+        self.bulk_probe_failures = 0
+        # batched fades are the same kind of extension, simpleTeensyComs only has the per-device
+        # Fade; sources with a FadeMany are probed, the others fade one actuator at a time
+        self.bulk_fade_supported = None if (getattr(coms, 'FadeMany', None) is not None) else False
+
+        # fade command batches from the learner, this poller is the only consumer
+        self.fade_channel = SPSCRing(FADE_QUEUE_SIZE)
+        # latest target per actuator, filled from the fade channel
+        self.commands = CommandQueue()
+        # a max speed source is polled back to back
+        self.scheduler = PollingScheduler(0 if getattr(coms, 'max_speed', False) else float(config['poll_period']), epoch)
+
+    def emit(self, event, payload=None):
+        self.notify(event, self.teensy_serial, payload)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="NodePoller-{}".format(self.teensy_serial))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def stop(self):
+        self.running = False
+
+    def connect_port(self):
+        self.reconnect = True
+        if (self.teensyComms is None):
+            try:
+                self.teensyComms = self.coms.initializeComms(self.com_port)
+                self.emit(EVENT_STATUS, STATUS_CONNECTION_SUCCESS)
+                self.emit(EVENT_MESSAGE, "{} Connected to port {}".format(time_stamp(), self.com_port))
+                self.emit(EVENT_CONNECTED)
+            except Exception as inst:
+                self.emit(EVENT_STATUS, STATUS_CONNECTION_FAIL)
+                stamp = time_stamp()
+                desc = "{} Failed to open port {}\n{} {}".format(stamp, self.com_port,
+                    "".ljust(len(stamp)), inst.args[0])
+                self.emit(EVENT_MESSAGE, desc)
+        else:
+            if (self.teensyComms.is_open == False):
+                self.reopen_port(True)
+
+    # reopen a closed port, failures are only reported if asked to
+    def reopen_port(self, report_failure):
+        try:
+            self.teensyComms.open()
+        except Exception as inst:
+            if (report_failure):
+                self.emit(EVENT_STATUS, STATUS_CONNECTION_FAIL)
+                self.emit(EVENT_MESSAGE, "{} Failed to reopen port {} {}".format(time_stamp(), self.com_port, inst))
+            return
+        # the node may have reset, resend every target
+        self.commands.invalidate()
+        self.emit(EVENT_STATUS, STATUS_CONNECTION_SUCCESS)
+        self.emit(EVENT_MESSAGE, "{} Reopened port {}".format(time_stamp(), self.com_port))
+        self.emit(EVENT_CONNECTED)
+
+    def disconnect_port(self):
+        self.reconnect = False
+        if (self.teensyComms is not None and self.teensyComms.is_open):
+            self.teensyComms.close()
+            self.emit(EVENT_MESSAGE, "{} Disconnected from port {}".format(time_stamp(), self.com_port))
+            self.emit(EVENT_STATUS, STATUS_CONNECTION_FAIL)
+
+    def run(self):
+        while(self.running):
+            # sleep until the next sweep deadline
+            self.scheduler.wait_next_sweep()
+            # sleep 500 ms if teensy connection is not established
+            while(self.teensyComms is None):
+                time.sleep(0.5)
+
+            if (self.teensyComms.is_open and self.devices is None):
+                self.get_devices()
+            elif (self.rescan_due()):
+                self.rescan()
+
+            for batch in self.fade_channel.drain():
+                self.commands.put_batch(batch)
+            if (self.teensyComms.is_open and len(self.commands) > 0):
+                start = time.perf_counter()
+                self.fade_values(self.commands.take())
+                perf_stats.record('fade', start)
+
+            if (self.teensyComms.is_open and self.devices is not None):
+                table = self.device_table
+                start = time.perf_counter()
+                vals = self.read_values(table.sensor_byte_strs)
+                perf_stats.record('serial_read', start)
+                read_keys = []
+                read_vals = []
+                # checked once per sweep so disabled per-sample logging costs nothing
+                debug_samples = acq_sample_log.isEnabledFor(logging.DEBUG)
+                for key, val in zip(table.sensor_keys, vals):
+                    # skip failed reads instead of storing empty samples
+                    if (val is None):
+                        continue
+                    self.store.append(key, val)
+                    self.scheduler.record(key)
+                    read_keys.append(key)
+                    read_vals.append(val)
+                    if (debug_samples):
+                        acq_sample_log.debug("current queue size: %s, appending value: %s", self.store.size(key), val)
+                self.scheduler.end_sweep()
+                perf_stats.count('samples', len(read_keys))
+
+                rec = self.recorder
+                if (rec is not None):
+                    rec.record_sensors(read_keys, read_vals)
+
+            self.scheduler.report_due()
+
+    # read all given sensors, in one framed exchange if the source supports it
+    def read_values(self, peripheral_byte_strs):
+        if (self.config['bulk_read'] and self.bulk_read_supported != False):
+            vals = self.read_bulk(peripheral_byte_strs)
+            if (vals is not None):
+                self.bulk_read_supported = True
+                return vals
+            if (self.bulk_read_supported is None):
+                self.bulk_probe_failures += 1
+            if (self.bulk_read_supported is None and self.bulk_probe_failures >= BULK_PROBE_ATTEMPTS):
+                self.bulk_read_supported = False
+                self.emit(EVENT_MESSAGE, "{} Bulk read not supported on port {}, reading devices one by one".format(
+                    time_stamp(), self.com_port))
+        return [self.read_value(byte_str) for byte_str in peripheral_byte_strs]
+
+    # request all values in one exchange with the source's ReadMany, None if unavailable
+    def read_bulk(self, peripheral_byte_strs):
+        if (len(peripheral_byte_strs) == 0):
+            return
+        try:
+            result = self.coms.ReadMany(self.teensyComms, self.teensy_serial, self.com_serial, peripheral_byte_strs, 0)
+        except:
+            return
+        if (result is None or len(result) != len(peripheral_byte_strs)):
+            return
+        return list(result)
+
+    # read sensor/actuator value given peripheral byte string
+    def read_value(self, peripheral_byte_str):
+        try:
+            acq_sample_log.debug("reading %s", peripheral_byte_str)
+            result = self.coms.Read(self.teensyComms, self.teensy_serial, self.com_serial, peripheral_byte_str, 0)
+            acq_sample_log.debug("reading success with %s", result)
+            return result
+        except:
+            return
+
+    # send fade commands, in one frame with the source's FadeMany if it has one
+    def fade_values(self, commands):
+        if (self.config['bulk_fade'] and self.bulk_fade_supported != False):
+            try:
+                result = self.coms.FadeMany(self.teensyComms, self.teensy_serial, self.com_serial, commands, 0)
+            except:
+                result = None
+            if (result is not None):
+                self.bulk_fade_supported = True
+                for byte_str, val in commands:
+                    self.commands.ack(byte_str, val)
+                return
+            if (self.bulk_fade_supported is None):
+                self.bulk_fade_supported = False
+        for byte_str, val in commands:
+            if (self.fade_value(byte_str, val) is None):
+                self.commands.retry(byte_str, val)
+            else:
+                self.commands.ack(byte_str, val)
+
+    # set actuator value
+    def fade_value(self, peripheral_byte_str, val):
+        try:
+            acq_sample_log.debug("fading %s with %s", peripheral_byte_str, val)
+            result = self.coms.Fade(self.teensyComms, self.teensy_serial, self.com_serial, peripheral_byte_str, val, 0)
+            acq_sample_log.debug("fading success with %s", result)
+            return result
+        except:
+            return
+
+    def rescan_due(self):
+        period = float(self.config['rescan_period'])
+        return period > 0 and time.monotonic() >= self.next_rescan
+
+    # re-enumerate the devices to pick up hot-plugged or unplugged ones, and reopen a
+    # port that was closed by a failure (e.g. a USB node dropping off and coming back)
+    def rescan(self):
+        self.next_rescan = time.monotonic() + float(self.config['rescan_period'])
+        if (not self.teensyComms.is_open):
+            if (self.reconnect):
+                self.reopen_port(False)
+            return
+        start = time.perf_counter()
+        self.get_devices()
+        perf_stats.record('rescan', start)
+
+    # get the device list of this node, register its sensors and report it
+    # a list equal to the current one is not reported again, a changed one only
+    # adds and removes the store slots of the devices that changed
+    def get_devices(self):
+        devList = None
+        try:
+            devList = self.coms.QueryIDs(self.teensyComms, self.teensy_serial, self.com_serial)
+        except ConnectionError as err:
+            self.emit(EVENT_MESSAGE, "{} {}".format(time_stamp(), err.args[0]))
+            self.teensyComms.close()
+        except Exception as err:
+            # the current device list is kept, retried on the next rescan
+            acq_log.warning("Enumerating the devices of node %s failed: %s", self.teensy_serial, err)
+        self.next_rescan = time.monotonic() + float(self.config['rescan_period'])
+        if (devList is None):
+            return
+
+        table = DeviceTable([(self.teensy_serial, devList)])
+        if (self.devices is not None):
+            added, removed = table.changes(self.device_table)
+            if (len(added) == 0 and len(removed) == 0):
+                return
+            self.emit(EVENT_MESSAGE, "{} Devices of node {} changed: {} added, {} removed".format(
+                time_stamp(), self.teensy_serial, len(added), len(removed)))
+            self.store.unregister(removed)
+            self.commands.discard([key[1] for key in removed])
+        self.device_table = table
+        self.devices = devList
+        self.store.register(table.sensor_keys)
+        self.emit(EVENT_DEVICES, devList)
+
+'''
+    acquisition of all configured nodes, one NodePoller per node, without Qt
+    the events of every poller are collected in one queue for the owner to dispatch;
+    records_devices sends device lists as (address, type, port) records so they can
+    cross a process boundary
+'''
+class Acquisition(object):
+    def __init__(self, config, store, epoch=None, events=None, records_devices=False):
+        self.config = config
+        self.store = store
+        self.epoch = epoch
+        self.events = queue.Queue() if events is None else events
+        self.records_devices = records_devices
+
+        # teensy serial number -> NodePoller
+        self.pollers = {}
+        self.recorder = None
+        self.next_report = time.time() + DEFAULT_REPORT_INTERVAL
+
+    def notify(self, event, teensy_serial, payload=None):
+        if (event == EVENT_DEVICES and self.records_devices):
+            payload = [device_record(dev) for dev in payload]
+        self.events.put((event, teensy_serial, payload))
+
+    def start(self):
+        pass
+
+    def connect(self):
+        acq_log.info("Connecting Teensy")
+        try:
+            coms, nodes = get_coms(self.config)
+        except (OSError, ValueError) as err:
+            self.notify(EVENT_MESSAGE, None, "{} Failed to open replay session {}".format(time_stamp(), err))
+            return
+        for teensy_serial, com_port in nodes:
+            poller = self.pollers.get(teensy_serial)
+            if (poller is None):
+                poller = NodePoller(teensy_serial, com_port, coms, self.config, self.store, self.notify, self.epoch)
+                poller.recorder = self.recorder
+                self.pollers[teensy_serial] = poller
+            poller.connect_port()
+            if (poller.teensyComms is not None and not poller.is_running()):
+                poller.start()
+
+    def disconnect(self):
+        acq_log.info("disconnect signal triggered")
+        for poller in self.pollers.values():
+            poller.disconnect_port()
+
+    # command channel of a node, None until the node is known
+    def fade_channel(self, teensy_serial):
+        poller = self.pollers.get(teensy_serial)
+        return None if poller is None else poller.fade_channel
+
+    # hand a fade batch to a node's poller from a thread other than the learner,
+    # waiting up to timeout for room in the channel
+    def push_fades(self, teensy_serial, batch, timeout=FADE_PUSH_TIMEOUT):
+        channel = self.fade_channel(teensy_serial)
+        if (channel is None):
+            return False
+        deadline = time.time() + timeout
+        while (not channel.push(batch)):
+            if (time.time() > deadline):
+                return False
+            time.sleep(0.001)
+        return True
+
+    # achieved samples/sec per (teensy serial number, byte string) over all nodes
+    def get_rates(self):
+        rates = {}
+        for poller in list(self.pollers.values()):
+            rates.update(poller.scheduler.get_rates())
+        return rates
+
+    # True once per report interval
+    def report_due(self):
+        now = time.time()
+        if (now < self.next_report):
+            return False
+        self.next_report = now + DEFAULT_REPORT_INTERVAL
+        return True
+
+    # next (event, teensy serial number, payload), None if nothing arrived within timeout
+    # the polling rates are reported as an EVENT_RATES once per report interval
+    def next_event(self, timeout):
+        if (self.report_due()):
+            return (EVENT_RATES, None, self.get_rates())
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def set_recorder(self, rec):
+        self.recorder = rec
+        for poller in list(self.pollers.values()):
+            poller.recorder = rec
+
+    def start_recording(self, root, name=None):
+        rec = SessionRecorder(root, name)
+        rec.start()
+        self.set_recorder(rec)
+        return rec
+
+    def stop_recording(self):
+        rec = self.recorder
+        self.set_recorder(None)
+        if (rec is not None):
+            rec.close()
+
+    def close(self):
+        for poller in self.pollers.values():
+            poller.stop()
+        self.disconnect()
+        self.stop_recording()
+
+# entry point of the acquisition process
+# polls the nodes into a new SampleBus and serves the commands of the GUI process until CMD_STOP;
+# the bus is named after this process, its name is sent with EVENT_READY
+def run_acquisition(config, capacity, epoch, commands, events):
+    log_config.setup_logging(config['log_levels'])
+    bus = SampleBus(unique_bus_name(config['bus_name']), capacity, int(config['bus_sensors']), create=True)
+    acq = Acquisition(config, bus, epoch, events, records_devices=True)
+    events.put((EVENT_READY, None, bus.name))
+    acq_log.info("Acquisition process publishing to %s", bus.name)
+    try:
+        while (True):
+            bus.beat()
+            if (acq.report_due()):
+                events.put((EVENT_RATES, None, acq.get_rates()))
+                # the stages timed here are shown by the GUI's performance panel
+                events.put((EVENT_PERF, None, perf_stats.take()))
+            try:
+                cmd, args = commands.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                continue
+
+            if (cmd == CMD_STOP):
+                break
+            elif (cmd == CMD_CONNECT):
+                # the pollers share acq.config, running nodes pick up e.g. bulk_read as well
+                acq.config.update(args)
+                acq.connect()
+            elif (cmd == CMD_DISCONNECT):
+                acq.disconnect()
+            elif (cmd == CMD_FADE):
+                teensy_serial, batch = args
+                if (not acq.push_fades(teensy_serial, batch)):
+                    acq_log.warning("Fade queue of node %s is full, dropping commands", teensy_serial)
+            elif (cmd == CMD_RECORD_START):
+                acq.start_recording(*args)
+            elif (cmd == CMD_RECORD_STOP):
+                acq.stop_recording()
+            elif (cmd == CMD_RECORD_ACTUATORS):
+                if (acq.recorder is not None):
+                    acq.recorder.record_actuators(*args)
+            elif (cmd == CMD_RECORD_CBLA):
+                if (acq.recorder is not None):
+                    acq.recorder.record_cbla(*args)
+    finally:
+        acq.close()
+        bus.close()
+
+''' fade channel of a node in the acquisition process, same push() as SPSCRing '''
+class RemoteFadeChannel(object):
+    def __init__(self, commands, teensy_serial):
+        self.commands = commands
+        self.teensy_serial = teensy_serial
+
+    # the acquisition process waits for room in the node's channel, so the batch is never refused here
+    def push(self, batch):
+        self.commands.put((CMD_FADE, (self.teensy_serial, batch)))
+        return True
+
+'''
+    session recorded by the acquisition process, same interface as SessionRecorder
+    sensors are recorded where they are read, actuator commands and learner
+    metrics are forwarded to the acquisition process
+'''
+class RemoteRecorder(object):
+    def __init__(self, commands, root, name=None):
+        if (name is None):
+            name = datetime.datetime.now().strftime(SESSION_FORMAT)
+        self.commands = commands
+        self.path = os.path.join(root, name)
+        self.commands.put((CMD_RECORD_START, (root, name)))
+
+    def record_actuators(self, keys, vals, timestamp=None):
+        if (timestamp is None):
+            timestamp = time.time()
+        self.commands.put((CMD_RECORD_ACTUATORS, (list(keys), list(vals), timestamp)))
+
+    def record_cbla(self, expert_number, prediction_error, max_action_value, timestamp=None):
+        if (timestamp is None):
+            timestamp = time.time()
+        self.commands.put((CMD_RECORD_CBLA, (float(expert_number), float(prediction_error), float(max_action_value), timestamp)))
+
+    def close(self, timeout=None):
+        self.commands.put((CMD_RECORD_STOP, None))
+
+'''
+    acquisition in a separate headless process, same interface as Acquisition
+    the process polls the nodes and publishes every reading to a SampleBus, which
+    store attaches read-only; a slow GUI can never hold up serial polling.
+    Commands and events travel over two queues
+'''
+class AcquisitionProcess(object):
+    def __init__(self, config, capacity, epoch=None):
+        # spawn keeps the child free of the GUI process' threads and Qt state
+        self.ctx = multiprocessing.get_context('spawn')
+        self.config = config
+        self.capacity = capacity
+        self.epoch = epoch
+        self.commands = self.ctx.Queue()
+        self.events = self.ctx.Queue()
+        self.proc = None
+        self.store = None
+
+        # teensy serial number -> RemoteFadeChannel
+        self.channels = {}
+        self.recorder = None
+
+    # start the process and attach to its bus
+    def start(self):
+        if (self.proc is not None):
+            return
+        self.proc = self.ctx.Process(target=run_acquisition, name="Acquisition",
+            args=(dict(self.config), self.capacity, self.epoch, self.commands, self.events), daemon=True)
+        self.proc.start()
+        event, _, bus_name = self.events.get(timeout=START_TIMEOUT)
+        if (event != EVENT_READY):
+            raise RuntimeError("Acquisition process failed to start")
+        self.store = SampleBus(bus_name, child_writer=True)
+        atexit.register(self.close)
+
+    # the Configuration panel edits self.config in place, the current connection settings go along
+    def connect(self):
+        self.commands.put((CMD_CONNECT, {name: self.config[name] for name in CONNECT_OPTIONS}))
+
+    def disconnect(self):
+        self.commands.put((CMD_DISCONNECT, None))
+
+    def fade_channel(self, teensy_serial):
+        channel = self.channels.get(teensy_serial)
+        if (channel is None):
+            channel = RemoteFadeChannel(self.commands, teensy_serial)
+            self.channels[teensy_serial] = channel
+        return channel
+
+    # device lists arrive as records and are turned back into device objects,
+    # the process' stage timings are merged into this process' statistics
+    def next_event(self, timeout):
+        try:
+            event, teensy_serial, payload = self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if (event == EVENT_PERF):
+            perf_stats.merge(PERF_SOURCE, payload)
+            return None
+        if (event == EVENT_DEVICES):
+            payload = [device_from_record(record) for record in payload]
+        return (event, teensy_serial, payload)
+
+    def start_recording(self, root, name=None):
+        self.recorder = RemoteRecorder(self.commands, root, name)
+        return self.recorder
+
+    def stop_recording(self):
+        if (self.recorder is not None):
+            self.recorder.close()
+            self.recorder = None
+
+    def close(self):
+        if (self.proc is None):
+            return
+        self.commands.put((CMD_STOP, None))
+        self.proc.join(2.0)
+        if (self.proc.is_alive()):
+            self.proc.terminate()
+        self.proc = None
+        if (self.store is not None):
+            self.store.close()
+            self.store = None
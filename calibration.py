@@ -0,0 +1,89 @@
+import numpy as np
+
+# 10 bit ADC of the Teensy nodes, 5 V reference
+ADC_MAX = 1023
+ADC_VOLTS = 5.0 / (ADC_MAX + 1)
+
+DEFAULT_CALIBRATION = 'linear'
+
+'''
+    conversion of the raw readings of one kind of sensor
+    the physical value of every raw ADC code is tabulated once from a curve, so converting
+    is a table lookup instead of evaluating the curve per reading; lo maps to 0 and hi to 1
+    in the normalized table handed to the learner (lo > hi inverts the direction)
+'''
+class Calibration(object):
+    def __init__(self, name, curve, lo, hi, unit=''):
+        self.name = name
+        self.unit = unit
+        self.lo = lo
+        self.hi = hi
+
+        raw = np.arange(ADC_MAX + 1, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            units = curve(raw)
+        # codes outside the curve's range (e.g. 0 V for a power law) saturate at its ends
+        self.units = np.clip(np.nan_to_num(units, nan=lo, posinf=max(lo, hi), neginf=min(lo, hi)), min(lo, hi), max(lo, hi))
+        self.normalized = (self.units - lo) / (hi - lo)
+
+    # physical values of raw readings, same shape as raw
+    def to_units(self, raw):
+        return self.units[adc_codes(raw)]
+
+    def normalize(self, raw):
+        return self.normalized[adc_codes(raw)]
+
+# table indices of raw readings
+def adc_codes(raw):
+    return np.clip(np.rint(np.asarray(raw, dtype=np.float64)), 0, ADC_MAX).astype(np.intp)
+
+# raw reading as is, normalized over the full ADC range
+def linear_curve(raw):
+    return raw
+
+# Sharp IR proximity sensor, distance in cm from the output voltage
+def ir_distance_curve(raw):
+    return 65 * np.power(raw * ADC_VOLTS, -1.10)
+
+# photo resistor, perceived brightness grows with the log of the reading
+def ambient_light_curve(raw):
+    return np.log1p(raw) / np.log1p(ADC_MAX)
+
+# available calibrations by name, see config['sensor_calibration']
+CALIBRATIONS = {
+    'linear': Calibration('linear', linear_curve, 0, ADC_MAX),
+    # 80 cm (far) normalizes to 0 and 10 cm (near) to 1, like the raw reading
+    'ir_distance': Calibration('ir_distance', ir_distance_curve, 80.0, 10.0, 'cm'),
+    'ambient_light': Calibration('ambient_light', ambient_light_curve, 0.0, 1.0),
+}
+
+'''
+    calibration of a whole sensor vector, one Calibration per device type
+    the tables of all calibrations in use are stacked into one (calibrations, ADC_MAX + 1)
+    array and every sensor knows its row, so a cycle's readings convert in one fancy index
+'''
+class SensorCalibration(object):
+    # types: device type of every sensor, by_type: device type -> calibration name
+    def __init__(self, types, by_type=None):
+        by_type = {} if by_type is None else {int(t): name for t, name in by_type.items()}
+        names = [by_type.get(int(t), DEFAULT_CALIBRATION) for t in types]
+        used = sorted(set(names) | set([DEFAULT_CALIBRATION]))
+        unknown = [name for name in used if name not in CALIBRATIONS]
+        if (len(unknown) > 0):
+            raise ValueError("Unknown sensor calibration {}".format(", ".join(unknown)))
+
+        self.calibrations = [CALIBRATIONS[name] for name in used]
+        self.rows = np.array([used.index(name) for name in names], dtype=np.intp)
+        self.units = np.stack([cal.units for cal in self.calibrations])
+        self.normalized = np.stack([cal.normalized for cal in self.calibrations])
+
+    def __len__(self):
+        return len(self.rows)
+
+    # normalized value of every sensor, raw holds one reading per sensor
+    def normalize(self, raw):
+        return self.normalized[self.rows, adc_codes(raw)]
+
+    # physical value of every sensor
+    def to_units(self, raw):
+        return self.units[self.rows, adc_codes(raw)]
@@ -0,0 +1,106 @@
+DEFAULT_CAPACITY = 64
+
+'''
+    lock-free single-producer/single-consumer ring
+    tail is only written by the producer and head only by the consumer;
+    a slot is filled before tail is published, so under the GIL the consumer
+    never sees a half written item and neither side has to take a lock
+'''
+class SPSCRing(object):
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        # one slot stays empty to tell a full ring from an empty one
+        self.size = capacity + 1
+        self.slots = [None] * self.size
+        self.head = 0
+        self.tail = 0
+        # items rejected because the ring was full, written by the producer
+        self.dropped = 0
+
+    def __len__(self):
+        return (self.tail - self.head) % self.size
+
+    def empty(self):
+        return self.head == self.tail
+
+    # producer side, returns False if the ring is full
+    def push(self, item):
+        tail = self.tail
+        next_tail = (tail + 1) % self.size
+        if (next_tail == self.head):
+            self.dropped += 1
+            return False
+        self.slots[tail] = item
+        self.tail = next_tail
+        return True
+
+    # consumer side, returns None if the ring is empty
+    def pop(self):
+        head = self.head
+        if (head == self.tail):
+            return None
+        item = self.slots[head]
+        self.slots[head] = None
+        self.head = (head + 1) % self.size
+        return item
+
+    # consumer side, pop everything currently queued
+    def drain(self):
+        items = []
+        item = self.pop()
+        while (item is not None):
+            items.append(item)
+            item = self.pop()
+        return items
+
+'''
+    actuator commands of one node, owned by the node reader
+    keyed by actuator byte string: only the latest target is kept (last write wins)
+    and targets equal to the last acknowledged value are not sent again
+'''
+class CommandQueue(object):
+    def __init__(self):
+        self.pending = {}
+        self.acked = {}
+
+        self.sent = 0
+        self.suppressed = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def put(self, byte_str, val):
+        if (self.acked.get(byte_str) == val):
+            # a newer target cancels an older pending one
+            self.pending.pop(byte_str, None)
+            self.suppressed += 1
+            return
+        self.pending[byte_str] = val
+
+    def put_batch(self, commands):
+        for byte_str, val in commands:
+            self.put(byte_str, val)
+
+    # take every pending (byte string, value) command
+    def take(self):
+        commands = list(self.pending.items())
+        self.pending = {}
+        return commands
+
+    # record a command the node confirmed
+    def ack(self, byte_str, val):
+        self.acked[byte_str] = val
+        self.sent += 1
+
+    # requeue a failed command unless a newer target arrived meanwhile
+    def retry(self, byte_str, val):
+        self.pending.setdefault(byte_str, val)
+
+    # forget acknowledged values, e.g. after the node reconnected
+    def invalidate(self):
+        self.acked.clear()
+
+    # drop everything about actuators that are gone, e.g. unplugged from the node
+    def discard(self, byte_strs):
+        for byte_str in byte_strs:
+            self.pending.pop(byte_str, None)
+            self.acked.pop(byte_str, None)
@@ -0,0 +1,128 @@
+import argparse
+import log_config
+import logging
+import signal
+import threading
+
+from acquisition import EVENT_DEVICES, EVENT_MESSAGE
+from learning import CBLALoop
+from remote import AUTHKEY_ENV, EVENT_ACTUATORS, EVENT_CBLA, EVENT_CYCLE_STATS, DaemonServer, daemon_address, server_authkey
+from runtime import Runtime, config
+
+daemon_log = logging.getLogger(log_config.DAEMON)
+
+'''
+    acquisition and CBLA learning without a GUI, for sculptures left running unattended
+    no Qt or pyqtgraph is imported; GUI clients attach over a local socket
+    (qtgui_test.py --attach) to watch the live readings, actuators and learner metrics
+'''
+class Daemon(object):
+    def __init__(self, runtime, learn=True, record=False):
+        self.runtime = runtime
+        self.learn = learn
+        self.record = record
+        self.running = True
+        self.loop = None
+        self.server = None
+
+    def run(self):
+        runtime = self.runtime
+        # checked before anything starts, a non-loopback address needs an explicit key
+        authkey = server_authkey(runtime.config)
+        acquisition = runtime.create_acquisition()
+        runtime.start_acquisition()
+        acquisition.connect()
+
+        address = daemon_address(runtime.config)
+        self.server = DaemonServer(runtime, address, authkey)
+        self.server.start()
+        daemon_log.info("Listening for GUI clients on %s:%s", address[0], address[1])
+
+        if (self.record):
+            daemon_log.info("Recording session to %s", runtime.start_recording())
+
+        if (self.learn):
+            self.loop = CBLALoop(runtime,
+                on_actuator_vals=lambda vals: self.server.broadcast((EVENT_ACTUATORS, None, vals)),
+                on_cycle_stats=lambda stats: self.server.broadcast((EVENT_CYCLE_STATS, None, stats)),
+                on_metrics=lambda metrics: self.server.broadcast((EVENT_CBLA, None, metrics)))
+            thread = threading.Thread(target=self.loop.run, name="CBLALoop")
+            thread.daemon = True
+            thread.start()
+
+        while (self.running):
+            event = acquisition.next_event(0.5)
+            if (event is None):
+                continue
+            if (event[0] == EVENT_DEVICES):
+                runtime.register_node(event[1], event[2])
+            elif (event[0] == EVENT_MESSAGE):
+                # nobody may be watching, connection messages go to the log
+                daemon_log.info("%s", event[2])
+            self.server.broadcast(event)
+
+    def stop(self):
+        self.running = False
+        if (self.loop is not None):
+            self.loop.stop()
+        if (self.server is not None):
+            self.server.close()
+        self.runtime.stop_recording()
+        acquisition = self.runtime.acquisition
+        if (acquisition is not None):
+            acquisition.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Run Teensy acquisition and CBLA learning without the GUI.')
+    parser.add_argument('--serial-number', help='Teensy serial number(s), comma separated [{}]'.format(config['serial_number']))
+    parser.add_argument('--com-port', help='COM port(s), comma separated [{}]'.format(config['com_port']))
+    parser.add_argument('--replay', help='Play back a recorded session instead of the serial ports')
+    parser.add_argument('--replay-speed', type=float, help='Replay speed, 0 = max [{}]'.format(config['replay_speed']))
+    parser.add_argument('--sim-nodes', type=int, help='Simulate this many nodes instead of the serial ports')
+    parser.add_argument('--cycle-time', type=int, help='Learner cycle time in ms, 0 = as fast as possible [{}]'.format(config['cycle_time']))
+    parser.add_argument('--learner-groups', choices=['node', 'port'], help='One learner process per node or port')
+    parser.add_argument('--no-learner', action='store_true', help='Only acquire, do not run the learner')
+    parser.add_argument('--record', action='store_true', help='Record the session to the record directory')
+    parser.add_argument('--record-dir', help='Directory of recorded sessions [{}]'.format(config['record_dir']))
+    parser.add_argument('--acquisition-process', action='store_true', help='Poll the nodes in a separate process')
+    parser.add_argument('--host', help='Address GUI clients attach to, other than loopback only with {} set [{}]'.format(
+        AUTHKEY_ENV, config['daemon_host']))
+    parser.add_argument('--port', type=int, help='Port GUI clients attach to [{}]'.format(config['daemon_port']))
+    args = parser.parse_args()
+
+    options = {
+        'serial_number': args.serial_number,
+        'com_port': args.com_port,
+        'replay_session': args.replay,
+        'replay_speed': args.replay_speed,
+        'sim_nodes': args.sim_nodes,
+        'cycle_time': args.cycle_time,
+        'learner_groups': args.learner_groups,
+        'record_dir': args.record_dir,
+        'daemon_host': args.host,
+        'daemon_port': args.port,
+    }
+    config.update({name: val for name, val in options.items() if val is not None})
+    # the daemon is already headless, polling in-process keeps it to one process
+    config['acquisition_process'] = args.acquisition_process
+    config['attach'] = False
+
+    log_config.setup_logging(config['log_levels'])
+    daemon = Daemon(Runtime(config), learn=not args.no_learner, record=args.record)
+
+    # SIGTERM stops the daemon like Ctrl-C
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, terminate)
+
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    except ValueError as err:
+        daemon_log.error("%s", err)
+    finally:
+        daemon.stop()
+
+if __name__ == '__main__':
+    main()
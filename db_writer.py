@@ -0,0 +1,99 @@
+import queue
+import threading
+import time
+
+DEFAULT_MAX_QUEUE = 10000
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 1.0
+# fraction of the queue above which writes count as backpressured
+HIGH_WATERMARK = 0.8
+
+'''
+    background writer for a MongoDB collection
+    records are queued without blocking the caller and flushed with insert_many
+    once batch_size records are pending or flush_interval seconds have passed
+    when the bounded queue is full new records are dropped and counted
+'''
+class BatchedWriter(threading.Thread):
+    def __init__(self, collection, max_queue=DEFAULT_MAX_QUEUE, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        super(BatchedWriter, self).__init__(name="BatchedWriter")
+        self.daemon = True
+
+        self.collection = collection
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.running = True
+
+        # counters, only written by one side each
+        self.queued = 0
+        self.dropped = 0
+        self.backpressured = 0
+        self.written = 0
+        self.flushes = 0
+        self.failed = 0
+
+    # queue one record, never blocks; returns False if it was dropped
+    def put(self, record):
+        if (self.queue.qsize() >= HIGH_WATERMARK * self.max_queue):
+            self.backpressured += 1
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.queued += 1
+        return True
+
+    # True while the queue is above the high watermark
+    def is_backpressured(self):
+        return self.queue.qsize() >= HIGH_WATERMARK * self.max_queue
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def get_stats(self):
+        return {
+            'queued': self.queued,
+            'pending': self.pending(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'backpressured': self.backpressured,
+            'flushes': self.flushes,
+            'failed': self.failed,
+        }
+
+    def run(self):
+        batch = []
+        deadline = time.time() + self.flush_interval
+        while (self.running or not self.queue.empty()):
+            timeout = max(0.0, deadline - time.time())
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+
+            if (len(batch) >= self.batch_size or time.time() >= deadline):
+                self.flush(batch)
+                batch = []
+                deadline = time.time() + self.flush_interval
+        self.flush(batch)
+
+    def flush(self, batch):
+        if (len(batch) == 0):
+            return
+        try:
+            self.collection.insert_many(batch, ordered=False)
+            self.written += len(batch)
+        except Exception as err:
+            self.failed += len(batch)
+            print('Failed to write {} records: {}'.format(len(batch), err))
+        self.flushes += 1
+
+    # stop the writer after flushing everything still queued
+    def close(self, timeout=None):
+        self.running = False
+        self.join(timeout)
@@ -0,0 +1,229 @@
+import numpy as np
+import threading
+
+# samples per bucket of the next level
+DECIMATION_FACTOR = 4
+# levels including the raw samples, the top level spans capacity * factor^(levels - 1) samples;
+# PlotHistory users size it with history_levels
+DECIMATION_LEVELS = 4
+# entries kept per level, about the widest plot in pixels
+DECIMATION_CAPACITY = 1024
+# plot spans of history the top level keeps for zooming out
+HISTORY_SPANS = 30
+
+# fewest levels whose top level covers HISTORY_SPANS plot spans of span seconds
+# sampled every period ms
+def history_levels(span, period, capacity=DECIMATION_CAPACITY, factor=DECIMATION_FACTOR):
+    samples = HISTORY_SPANS * float(span) * 1000.0 / max(float(period), 1.0)
+    levels = 2
+    while (capacity * factor ** (levels - 1) < samples):
+        levels += 1
+    return levels
+
+# min/max envelope of (times, lo, hi) entries in num equal time buckets between t0 and t1,
+# (times, lo, hi) of the non-empty buckets; times are the bucket starts
+def bucket_envelope(times, lo, hi, t0, t1, num):
+    num = max(1, int(num))
+    times = np.asarray(times, dtype=np.float64)
+    width = max(t1 - t0, 1e-9) / num
+    buckets = np.clip(((times - t0) / width).astype(np.intp), 0, num - 1)
+    b_lo = np.full(num, np.inf)
+    b_hi = np.full(num, -np.inf)
+    np.minimum.at(b_lo, buckets, lo)
+    np.maximum.at(b_hi, buckets, hi)
+    used = np.flatnonzero(b_lo <= b_hi)
+    return t0 + used * width, b_lo[used], b_hi[used]
+
+# envelope entries as one polyline, every entry drawn as a vertical stroke from min to max
+def envelope_line(times, lo, hi):
+    x = np.repeat(times, 2)
+    y = np.empty(2 * len(times), dtype=np.float64)
+    y[0::2] = lo
+    y[1::2] = hi
+    return x, y
+
+'''
+    ring of (time, min, max) entries of one pyramid level
+    the readings are ADC codes, so their min and max are exact in float32; the ring is
+    not mirrored, the latest entries are a view unless they wrap around its end
+'''
+class EnvelopeRing(object):
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.times = np.zeros(self.capacity, dtype=np.float64)
+        self.lo = np.zeros(self.capacity, dtype=np.float32)
+        self.hi = np.zeros(self.capacity, dtype=np.float32)
+        self.cursor = 0
+        self.count = 0
+
+    # append a batch of entries, only the latest capacity are kept
+    def extend(self, times, lo, hi):
+        n = len(times)
+        if (n > self.capacity):
+            times, lo, hi = times[n - self.capacity:], lo[n - self.capacity:], hi[n - self.capacity:]
+            n = self.capacity
+        pos = self.cursor
+        # first part up to the end of the ring, the rest wraps to the start
+        first = min(n, self.capacity - pos)
+        for arr, vals in ((self.times, times), (self.lo, lo), (self.hi, hi)):
+            arr[pos:pos + first] = vals[:first]
+            arr[:n - first] = vals[first:]
+        self.cursor = (pos + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+
+    # latest n entries (oldest first), views unless they wrap around the end of the ring
+    def latest(self, n=None):
+        n = self.count if n is None else min(int(n), self.count)
+        first = self.cursor - n
+        if (first >= 0):
+            return self.times[first:self.cursor], self.lo[first:self.cursor], self.hi[first:self.cursor]
+        rows = np.arange(first, self.cursor) % self.capacity
+        return self.times[rows], self.lo[rows], self.hi[rows]
+
+    def oldest_time(self):
+        return self.times[self.cursor if (self.count == self.capacity) else 0]
+
+    # number of entries at or after time t, searched in place: the ring holds two sorted
+    # runs, the older one from the cursor to the end once it is full
+    def count_since(self, t):
+        n = self.cursor - int(np.searchsorted(self.times[:self.cursor], t, side='left'))
+        if (self.count > self.cursor):
+            older = self.times[self.cursor:]
+            n += len(older) - int(np.searchsorted(older, t, side='left'))
+        return n
+
+    def clear(self):
+        self.cursor = 0
+        self.count = 0
+
+'''
+    multi-resolution min/max history of one sensor
+    level 0 holds the raw readings, every entry of level k + 1 is the min/max envelope of
+    factor entries of level k; appending updates the levels incrementally (amortized O(1)
+    per sample) and a plot picks the finest level with at most one entry per pixel, so a
+    redraw costs about the pixel width however long the history is
+'''
+class MinMaxPyramid(object):
+    def __init__(self, capacity=DECIMATION_CAPACITY, factor=DECIMATION_FACTOR, levels=DECIMATION_LEVELS):
+        self.factor = int(factor)
+        self.levels = [EnvelopeRing(capacity) for i in range(levels)]
+        # pending[k]: entries of level k not yet folded into a bucket of level k + 1
+        self.pending = [(np.zeros(0), np.zeros(0), np.zeros(0)) for i in range(levels - 1)]
+
+    # number of raw readings one entry of a level stands for
+    def bucket_size(self, level):
+        return self.factor ** level
+
+    def append(self, val, timestamp):
+        self.extend(np.array([timestamp], dtype=np.float64), np.array([val], dtype=np.float64))
+
+    # append readings (oldest first), buckets are folded for a whole batch at once
+    def extend(self, times, vals):
+        times = np.asarray(times, dtype=np.float64)
+        lo = hi = np.asarray(vals, dtype=np.float64)
+        for k in range(len(self.levels)):
+            if (len(times) == 0):
+                return
+            self.levels[k].extend(times, lo, hi)
+            if (k == len(self.pending)):
+                return
+            # complete buckets move up a level, the remainder waits for the next batch
+            p_times, p_lo, p_hi = self.pending[k]
+            times = np.concatenate((p_times, times))
+            lo = np.concatenate((p_lo, lo))
+            hi = np.concatenate((p_hi, hi))
+            done = (len(times) // self.factor) * self.factor
+            self.pending[k] = (times[done:], lo[done:], hi[done:])
+            times = times[:done:self.factor]
+            lo = lo[:done].reshape(-1, self.factor).min(axis=1)
+            hi = hi[:done].reshape(-1, self.factor).max(axis=1)
+
+    # envelope of the entries below a level not yet folded into it, None if there are none
+    def tail(self, level):
+        parts = [self.pending[k] for k in range(level) if len(self.pending[k][0]) > 0]
+        if (len(parts) == 0):
+            return None
+        # higher levels hold the older pending entries
+        t = parts[-1][0][0]
+        return t, min(p[1].min() for p in parts), max(p[2].max() for p in parts)
+
+    # finest level covering the readings since time start with at most max_points entries
+    def select_level(self, start, max_points):
+        for k, ring in enumerate(self.levels):
+            # a full ring may already have dropped readings after start
+            covers = (ring.count < ring.capacity or ring.oldest_time() <= start)
+            if (covers and ring.count_since(start) <= max_points):
+                return k
+        return len(self.levels) - 1
+
+    # (times, lo, hi) of the readings since time start, about max_points entries, oldest first;
+    # coarse levels end with one partial bucket so the newest readings are always shown
+    def envelope(self, start, max_points):
+        k = self.select_level(start, max(1, int(max_points)))
+        ring = self.levels[k]
+        times, lo, hi = ring.latest(ring.count_since(start))
+        tail = self.tail(k) if (k > 0) else None
+        if (tail is None):
+            return times, lo, hi
+        return np.append(times, tail[0]), np.append(lo, tail[1]), np.append(hi, tail[2])
+
+    # envelope as one polyline, see envelope_line
+    def envelope_line(self, start, max_points):
+        return envelope_line(*self.envelope(start, max_points))
+
+    def latest_time(self):
+        times, _, _ = self.levels[0].latest(1)
+        return times[0] if (len(times) > 0) else None
+
+    def clear(self):
+        for ring in self.levels:
+            ring.clear()
+        self.pending = [(np.zeros(0), np.zeros(0), np.zeros(0)) for i in range(len(self.pending))]
+
+'''
+    MinMaxPyramid of every sensor, keyed like the sample store
+    fed by one thread, read by the GUI thread; the lock only keeps a redraw from seeing
+    a half folded batch and is held for one pyramid at a time
+'''
+class PlotHistory(object):
+    def __init__(self, capacity=DECIMATION_CAPACITY, factor=DECIMATION_FACTOR, levels=DECIMATION_LEVELS):
+        self.capacity = capacity
+        self.factor = factor
+        self.levels = levels
+        self.pyramids = {}
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self.pyramids
+
+    def pyramid(self, key):
+        pyramid = self.pyramids.get(key)
+        if (pyramid is None):
+            pyramid = MinMaxPyramid(self.capacity, self.factor, self.levels)
+            # copy-on-write so readers never see a changing dict
+            pyramids = dict(self.pyramids)
+            pyramids[key] = pyramid
+            self.pyramids = pyramids
+        return pyramid
+
+    def extend(self, key, times, vals):
+        pyramid = self.pyramid(key)
+        with self.lock:
+            pyramid.extend(times, vals)
+
+    # polyline of a sensor's readings since time start, see MinMaxPyramid.envelope_line
+    def envelope_line(self, key, start, max_points):
+        pyramid = self.pyramids.get(key)
+        if (pyramid is None):
+            return np.zeros(0), np.zeros(0)
+        with self.lock:
+            return pyramid.envelope_line(start, max_points)
+
+    def latest_time(self, key):
+        pyramid = self.pyramids.get(key)
+        return None if (pyramid is None) else pyramid.latest_time()
+
+    def clear(self):
+        with self.lock:
+            for pyramid in self.pyramids.values():
+                pyramid.clear()
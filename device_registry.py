@@ -0,0 +1,83 @@
+import numpy as np
+
+# peripheral byte string of a device, same bytes as genByteStr of the simpleTeensyComs devices
+def device_byte_str(address, type, port):
+    return bytes((address, type, port))
+
+'''
+    descriptor table of the devices of one or more nodes, built once when the nodes
+    report their devices and shared by the pollers, the learner and the views
+    row i describes devices[i]: addresses, types and ports are arrays, byte strings and
+    (teensy serial number, byte string) keys are precomputed, index maps a key to its row;
+    the table is never changed after it is built except for the active mask, a new device
+    list makes a new table (copy-on-write)
+'''
+class DeviceTable(object):
+    # node_devices: (teensy serial number, device list) pairs, inactive: keys of deactivated actuators
+    def __init__(self, node_devices=(), inactive=()):
+        self.nodes = []
+        self.devices = []
+        self.node_of = []
+        for teensy_serial, devList in node_devices:
+            self.nodes.append(teensy_serial)
+            for dev in devList:
+                self.devices.append(dev)
+                self.node_of.append(teensy_serial)
+
+        self.addresses = np.array([dev.address for dev in self.devices], dtype=np.uint8)
+        self.types = np.array([dev.type for dev in self.devices], dtype=np.uint8)
+        self.ports = np.array([dev.port for dev in self.devices], dtype=np.uint8)
+        self.byte_strs = [device_byte_str(a, t, p) for a, t, p in zip(self.addresses.tolist(), self.types.tolist(), self.ports.tolist())]
+        self.keys = list(zip(self.node_of, self.byte_strs))
+        self.index = {key: i for i, key in enumerate(self.keys)}
+
+        # even device types are sensors, odd types actuators
+        self.is_sensor = (self.types % 2 == 0)
+        self.sensor_rows = np.flatnonzero(self.is_sensor)
+        self.actuator_rows = np.flatnonzero(~self.is_sensor)
+        self.sensor_keys = [self.keys[i] for i in self.sensor_rows]
+        self.sensor_byte_strs = [self.byte_strs[i] for i in self.sensor_rows]
+        self.actuator_keys = [self.keys[i] for i in self.actuator_rows]
+
+        # rows of every node, in report order
+        node_of = np.array([self.nodes.index(node) for node in self.node_of], dtype=np.intp)
+        self.node_rows = {node: np.flatnonzero(node_of == i) for i, node in enumerate(self.nodes)}
+
+        # deactivated actuators are faded to 0 by the learner
+        self.active = np.ones(len(self.devices), dtype=bool)
+        for key in inactive:
+            self.set_active(key, False)
+
+    def __len__(self):
+        return len(self.devices)
+
+    # (added, removed) keys compared to an older table
+    def changes(self, previous):
+        added = [key for key in self.keys if key not in previous.index]
+        removed = [key for key in previous.keys if key not in self.index]
+        return added, removed
+
+    def row(self, key):
+        return self.index.get(key)
+
+    def set_active(self, key, active):
+        i = self.index.get(key)
+        if (i is not None):
+            self.active[i] = active
+
+    def is_active(self, key):
+        i = self.index.get(key)
+        return i is not None and bool(self.active[i])
+
+    # (teensy serial number, device) pairs of the given rows
+    def pairs(self, rows):
+        return [(self.node_of[i], self.devices[i]) for i in rows]
+
+    # rows of the devices on one port of a node, in report order
+    def port_rows(self, node):
+        rows = self.node_rows[node]
+        ports = []
+        for port in self.ports[rows].tolist():
+            if (port not in ports):
+                ports.append(port)
+        return [(port, rows[self.ports[rows] == port]) for port in ports]
@@ -0,0 +1,177 @@
+import atexit
+import multiprocessing
+import numpy as np
+import threading
+
+from multiprocessing import shared_memory
+
+# partitions of the devices, one Learner per group
+GROUP_BY_NODE = 'node'
+GROUP_BY_PORT = 'port'
+
+# expert count, prediction error, max action value
+NUM_METRICS = 3
+STEP_TIMEOUT = 30.0
+
+''' devices handled by one learner, as indices into the full sensor/actuator lists '''
+class LearnerGroup(object):
+    def __init__(self, name, sens_idx, act_idx):
+        self.name = name
+        self.sens_idx = np.asarray(sens_idx, dtype=np.int64)
+        self.act_idx = np.asarray(act_idx, dtype=np.int64)
+
+# split (node, device) sensor and actuator lists into learner groups
+# groups without sensors or without actuators are left out, their actuators stay idle
+def partition_devices(sens_list, acts_list, group_by=GROUP_BY_NODE):
+    def group_key(node, dev):
+        return node if (group_by == GROUP_BY_NODE) else (node, dev.port)
+
+    sens = {}
+    acts = {}
+    for i, (node, dev) in enumerate(sens_list):
+        sens.setdefault(group_key(node, dev), []).append(i)
+    for i, (node, dev) in enumerate(acts_list):
+        acts.setdefault(group_key(node, dev), []).append(i)
+
+    groups = []
+    for key in sens:
+        if (key in acts):
+            groups.append(LearnerGroup(key, sens[key], acts[key]))
+    return groups
+
+# float64 shared block: sensors | previous actions | next actions | metrics
+def block_size(num_sens, num_acts):
+    return (num_sens + 2 * num_acts + NUM_METRICS) * 8
+
+def block_views(shm, num_sens, num_acts):
+    buf = np.ndarray((num_sens + 2 * num_acts + NUM_METRICS,), dtype=np.float64, buffer=shm.buf)
+    sens = buf[:num_sens]
+    prev_acts = buf[num_sens:num_sens + num_acts]
+    next_acts = buf[num_sens + num_acts:num_sens + 2 * num_acts]
+    metrics = buf[num_sens + 2 * num_acts:]
+    return sens, prev_acts, next_acts, metrics
+
+# mean of a learner statistic that may be a scalar, a sequence or None
+def metric_value(val):
+    if (val is None):
+        return np.nan
+    return float(np.mean(val))
+
+# runs one Learner in its own process, one learn/select step per sense_ready event
+def learner_worker(shm_name, num_sens, num_acts, config, sense_ready, act_ready, stop):
+    from cbla_learner import Learner
+
+    # the worker shares the resource tracker of the pool's process (spawn hands it down), where
+    # the block is registered once however many processes attach; it stays registered until
+    # the pool unlinks it, unregistering here would make that unlink a second, failing one
+    # (same as a SampleBus attached with child_writer)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    sens, prev_acts, next_acts, metrics = block_views(shm, num_sens, num_acts)
+    lrnr = Learner(tuple([0]*num_sens), tuple([0]*num_acts), **config)
+    try:
+        while (not stop.is_set()):
+            if (not sense_ready.wait(0.5)):
+                continue
+            sense_ready.clear()
+
+            lrnr.learn(tuple(sens), tuple(prev_acts))
+            next_acts[:] = lrnr.select_action()
+
+            metrics[0] = lrnr.expert.get_num_experts()
+            metrics[1] = metric_value(lrnr.expert.rewards_history)
+            metrics[2] = metric_value(lrnr.expert.get_largest_action_value())
+            act_ready.set()
+    finally:
+        del sens, prev_acts, next_acts, metrics
+        shm.close()
+
+''' shared block, events and process of one group's learner '''
+class LearnerWorker(object):
+    def __init__(self, group, shm, views, sense_ready, act_ready, stop, proc):
+        self.group = group
+        self.shm = shm
+        self.views = views
+        self.sense_ready = sense_ready
+        self.act_ready = act_ready
+        self.stop = stop
+        self.proc = proc
+
+'''
+    one learner process per device group
+    sensor vectors go in and actions come out through one shared memory block per group;
+    all groups learn in parallel, step() returns once every group has answered
+'''
+class LearnerPool(object):
+    def __init__(self, groups, config):
+        # spawn keeps the workers free of the GUI process' threads and Qt state
+        self.ctx = multiprocessing.get_context('spawn')
+        self.groups = groups
+        self.config = dict(config)
+        self.workers = []
+        # close() runs on the learning thread and at exit, the first one frees the blocks
+        self.close_lock = threading.Lock()
+
+    def start(self):
+        # the blocks are unlinked even if the learning thread never gets to close the pool
+        # (e.g. the GUI quits mid-run), otherwise the resource tracker reports them as leaked
+        atexit.register(self.close)
+        for group in self.groups:
+            num_sens = len(group.sens_idx)
+            num_acts = len(group.act_idx)
+            shm = shared_memory.SharedMemory(create=True, size=block_size(num_sens, num_acts))
+            views = block_views(shm, num_sens, num_acts)
+            for view in views:
+                view[:] = 0
+            sense_ready = self.ctx.Event()
+            act_ready = self.ctx.Event()
+            stop = self.ctx.Event()
+            proc = self.ctx.Process(target=learner_worker, name="Learner-{}".format(group.name),
+                args=(shm.name, num_sens, num_acts, self.config, sense_ready, act_ready, stop), daemon=True)
+            proc.start()
+            self.workers.append(LearnerWorker(group, shm, views, sense_ready, act_ready, stop, proc))
+
+    # one learning cycle over all groups
+    # returns the next actions (full actuator vector) and the (expert count, prediction error, max action value)
+    # aggregated over the groups; actuators outside any group keep their value
+    def step(self, norm_sens, act_vals):
+        norm_sens = np.asarray(norm_sens, dtype=np.float64)
+        next_vals = np.array(act_vals, dtype=np.float64)
+
+        for worker in self.workers:
+            sens, prev_acts, _, _ = worker.views
+            sens[:] = norm_sens[worker.group.sens_idx]
+            prev_acts[:] = next_vals[worker.group.act_idx]
+            worker.act_ready.clear()
+            worker.sense_ready.set()
+
+        num_experts = 0
+        errors = []
+        max_action = np.nan
+        for worker in self.workers:
+            if (not worker.act_ready.wait(STEP_TIMEOUT)):
+                raise RuntimeError("Learner for group {} did not answer (alive: {})".format(
+                    worker.group.name, worker.proc.is_alive()))
+            _, _, next_acts, metrics = worker.views
+            next_vals[worker.group.act_idx] = next_acts
+            num_experts += metrics[0]
+            errors.append(metrics[1])
+            max_action = np.fmax(max_action, metrics[2])
+
+        return next_vals, (num_experts, float(np.nanmean(errors)) if len(errors) > 0 else np.nan, max_action)
+
+    def close(self):
+        # a learning thread still closing at exit is waited for here, daemon threads are
+        # only stopped after the exit handlers
+        with self.close_lock:
+            for worker in self.workers:
+                worker.stop.set()
+            for worker in self.workers:
+                worker.proc.join(2.0)
+                if (worker.proc.is_alive()):
+                    worker.proc.terminate()
+                # views must be released before the block can be closed
+                worker.views = None
+                worker.shm.close()
+                worker.shm.unlink()
+            self.workers = []
+        atexit.unregister(self.close)
@@ -0,0 +1,229 @@
+import log_config
+import logging
+import numpy as np
+import time
+
+from acquisition import configured_nodes
+from calibration import SensorCalibration
+from cbla_learner import Learner
+from learner_pool import GROUP_BY_NODE, GROUP_BY_PORT, LearnerPool, metric_value, partition_devices
+from perf import stats as perf_stats
+from polling import DeadlineScheduler, align_period
+from runtime import CBLAPlots
+
+# learner cycles between cycle_stats reports
+CYCLE_STATS_INTERVAL = 20
+# seconds to wait for all configured nodes before the learner starts with those that reported
+NODE_WAIT_TIMEOUT = 10.0
+
+learner_log = logging.getLogger(log_config.LEARNER)
+learner_sample_log = logging.getLogger(log_config.LEARNER_SAMPLES)
+
+'''
+    the CBLA learning cycle, free of Qt
+    senses from the runtime's sample store, learns and hands the next actions to the
+    node pollers; the actuator values, scheduler statistics and learner metrics of each
+    cycle are passed to the optional callbacks
+'''
+class CBLALoop(object):
+    def __init__(self, runtime, on_actuator_vals=None, on_cycle_stats=None, on_metrics=None):
+        self.runtime = runtime
+        self.config = runtime.config
+        self.on_actuator_vals = on_actuator_vals
+        self.on_cycle_stats = on_cycle_stats
+        self.on_metrics = on_metrics
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        # sleep 500 ms if device list is not ready
+        while(self.runtime.devices is None):
+            if (not self.running):
+                return
+            time.sleep(0.5)
+        self.wait_for_nodes()
+
+        # a learner is built for the devices of the current table and rebuilt whenever
+        # devices are added or removed (late nodes, hot-plug), see learn_loop
+        while (self.running):
+            table = self.runtime.device_table
+            if (len(table.sensor_rows) == 0 or len(table.actuator_rows) == 0):
+                # nothing to learn until devices come back
+                time.sleep(0.5)
+                continue
+            self.learn_devices(table)
+
+    # wait until every configured node reported its devices, at most NODE_WAIT_TIMEOUT seconds
+    # so one node that fails to connect does not hold up the others
+    def wait_for_nodes(self):
+        expected = set(configured_nodes(self.config))
+        deadline = time.time() + NODE_WAIT_TIMEOUT
+        while (self.running and not expected.issubset(self.runtime.devices)):
+            if (time.time() > deadline):
+                learner_log.info("Starting the learner without nodes %s, they are added when they report",
+                    sorted(expected.difference(self.runtime.devices)))
+                return
+            time.sleep(0.1)
+
+    # learn with the devices of table until they change or the loop is stopped
+    def learn_devices(self, table):
+        for dev in table.devices:
+            learner_log.debug("%s", dev.pr())
+
+        # (teensy serial number, device) pairs over all nodes
+        SensList = table.pairs(table.sensor_rows)
+        ActsList = table.pairs(table.actuator_rows)
+        numSens = len(SensList)
+        numActs = len(ActsList)
+        actValues = [0] * numActs
+
+        # latest raw reading of every sensor, normalized per device type each cycle
+        sensValues = np.zeros(numSens, dtype=np.float64)
+        self.calibration = SensorCalibration(table.types[table.sensor_rows], self.config['sensor_calibration'])
+
+        lrnr = None
+        pool = None
+        if (self.config['learner_groups'] in (GROUP_BY_NODE, GROUP_BY_PORT)):
+            groups = partition_devices(SensList, ActsList, self.config['learner_groups'])
+            learner_log.info("Starting %d learner processes grouped by %s", len(groups), self.config['learner_groups'])
+            pool = LearnerPool(groups, self.config)
+            pool.start()
+        else:
+            learner_log.info("Starting the learner with %d sensors and %d actuators", numSens, numActs)
+            lrnr = Learner(tuple([0]*numSens),tuple([0]*numActs), **self.config)
+
+        try:
+            self.learn_loop(lrnr, pool, table, sensValues, actValues)
+        finally:
+            if (pool is not None):
+                pool.close()
+
+    # table: the device table the learner was built for
+    def learn_loop(self, lrnr, pool, table, sensValues, actValues):
+        runtime = self.runtime
+        sens_keys = table.sensor_keys
+        act_keys = table.actuator_keys
+        # the latest table, rebuilt by every device report; its active mask changes in place
+        act_table = table
+        iterNum = 0
+        expert_number = 1
+        # last target handed to the node pollers per actuator key
+        last_targets = {}
+        # last value of every metric, reused each cycle
+        metrics = np.zeros(len(CBLAPlots), dtype=np.float64)
+        metrics[CBLAPlots.plot_expert_number.value - 1] = expert_number
+        # learner ticks on the acquisition grid, learner_phase of a poll period after each sweep starts
+        scheduler = DeadlineScheduler(self.cycle_period(), runtime.cycle_epoch, self.cycle_offset())
+        while (self.running):
+            scheduler.set_period(self.cycle_period(), self.cycle_offset())
+            scheduler.wait()
+            # checked once per cycle so disabled per-sample logging costs nothing
+            debug_samples = learner_sample_log.isEnabledFor(logging.DEBUG)
+            if (iterNum % CYCLE_STATS_INTERVAL == 0 and self.on_cycle_stats is not None):
+                self.on_cycle_stats(scheduler.get_stats())
+            if (runtime.device_table is not act_table):
+                act_table = runtime.device_table
+                # a node reporting the same devices again keeps the learner
+                if (act_table.sensor_keys != sens_keys or act_table.actuator_keys != act_keys):
+                    learner_log.info("Devices changed, rebuilding the learner")
+                    return
+            if iterNum > 0:
+                active = act_table.active[act_table.actuator_rows]
+                batches = {}
+                act_vals = {}
+                for i in range(0,len(act_keys)):
+                    key = act_keys[i]
+                    if (active[i]):
+                        fade_val = int(actValues[i])
+                    else:
+                        fade_val = 0
+                    act_vals[key] = fade_val
+                    # only changed targets go to the node
+                    if (last_targets.get(key) != fade_val):
+                        fade_command = (key[1], fade_val)
+                        batches.setdefault(key[0], []).append(fade_command)
+                    if (debug_samples):
+                        learner_sample_log.debug("Command Actuator %d to Value %d", i, fade_val)
+
+                for node, batch in batches.items():
+                    channel = runtime.fade_commands.get(node)
+                    if (channel is not None and channel.push(batch)):
+                        for byte_str, fade_val in batch:
+                            last_targets[(node, byte_str)] = fade_val
+                    else:
+                        # retried next cycle since last_targets is unchanged
+                        learner_log.warning("Fade queue of node %s is full, delaying commands", node)
+                if (self.on_actuator_vals is not None):
+                    start = time.perf_counter()
+                    self.on_actuator_vals(act_vals)
+                    perf_stats.record('emit_actuator_values', start)
+
+                rec = runtime.recorder
+                if (rec is not None):
+                    rec.record_actuators(list(act_vals.keys()), list(act_vals.values()))
+
+            #Sense:  Read all the sensors
+            for i in range(0,len(sens_keys)):
+                val = runtime.sample_store.latest(sens_keys[i])
+                if (val is not None):
+                    sensValues[i] = val
+                    if (debug_samples):
+                        learner_sample_log.debug("reading sensor %d value: %s", i, val)
+
+            if (pool is None):
+                #Learn:
+                start = time.perf_counter()
+                lrnr.learn(tuple(self.calibration.normalize(sensValues).tolist()),tuple(actValues))
+                perf_stats.record('learn', start)
+
+                #Select Next action to perform
+                start = time.perf_counter()
+                actValues = lrnr.select_action()
+                perf_stats.record('select_action', start)
+
+                # reduced like in the learner processes, the statistics may be scalars or sequences
+                cycle_metrics = (lrnr.expert.get_num_experts(), metric_value(lrnr.expert.rewards_history),
+                    metric_value(lrnr.expert.get_largest_action_value()))
+            else:
+                #Learn and select next action in every group's process
+                start = time.perf_counter()
+                actValues, cycle_metrics = pool.step(self.calibration.normalize(sensValues), actValues)
+                perf_stats.record('learn_pool', start)
+
+            numExperts, reduced_mean_error, max_action_val = [None if np.isnan(m) else m for m in cycle_metrics]
+            perf_stats.count('learner_cycles')
+
+            if numExperts > 1:
+                expert_number = expert_number + 1
+                learner_log.debug("increased expert number to %d", expert_number)
+
+            # metrics keep their previous value when the learner has none to report
+            metrics[CBLAPlots.plot_expert_number.value - 1] = expert_number
+            if (reduced_mean_error is not None):
+                metrics[CBLAPlots.plot_prediction_error.value - 1] = reduced_mean_error
+            if (max_action_val is not None):
+                metrics[CBLAPlots.plot_max_action_value.value - 1] = max_action_val
+
+            # plots are drawn by the GUI thread, see qtgui.CBLAPlotModel
+            runtime.cbla_metrics.push(metrics)
+            if (self.on_metrics is not None):
+                self.on_metrics(metrics.copy())
+
+            rec = runtime.recorder
+            if (rec is not None):
+                rec.record_cbla(*metrics)
+
+            #Report the action value and the number of experts currently in the system
+            #print('Current max action value is ', lrnr.expert.get_largest_action_value())
+            #print('Current number of experts is', lrnr.expert.get_num_experts())
+
+            iterNum += 1
+
+    # learning period in ms, a whole multiple of the polling period
+    def cycle_period(self):
+        return align_period(float(self.config['cycle_time']), float(self.config['poll_period']))
+
+    def cycle_offset(self):
+        return float(self.config['learner_phase']) * float(self.config['poll_period'])
@@ -0,0 +1,98 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import time
+
+LOG_FORMAT = '(%(threadName)-10s) %(name)s %(message)s'
+
+# subsystem loggers, per-sample events go to the *.samples children
+ACQUISITION = 'cbla.acquisition'
+ACQUISITION_SAMPLES = 'cbla.acquisition.samples'
+LEARNER = 'cbla.learner'
+LEARNER_SAMPLES = 'cbla.learner.samples'
+PLOT = 'cbla.plot'
+DAEMON = 'cbla.daemon'
+
+# production verbosity: nothing below INFO, per-sample events off
+DEFAULT_LEVELS = {
+    'cbla': 'INFO',
+    ACQUISITION_SAMPLES: 'WARNING',
+    LEARNER_SAMPLES: 'WARNING',
+}
+
+# per-sample records allowed per second and message template when enabled
+SAMPLE_RATE_LIMIT = 5.0
+SAMPLE_BURST = 20
+
+'''
+    token bucket per message template
+    runs before the message is formatted, so dropped records cost no formatting
+'''
+class RateLimitFilter(logging.Filter):
+    def __init__(self, rate=SAMPLE_RATE_LIMIT, burst=SAMPLE_BURST):
+        super(RateLimitFilter, self).__init__()
+        self.rate = rate
+        self.burst = burst
+        # template -> [tokens, last refill time, suppressed count]
+        self.buckets = {}
+
+    def filter(self, record):
+        now = time.time()
+        bucket = self.buckets.get(record.msg)
+        if (bucket is None):
+            bucket = [self.burst, now, 0]
+            self.buckets[record.msg] = bucket
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if (bucket[0] < 1.0):
+            bucket[2] += 1
+            return False
+        bucket[0] -= 1.0
+        if (bucket[2] > 0):
+            record.msg = "{} ({} similar suppressed)".format(record.msg, bucket[2])
+            bucket[2] = 0
+        return True
+
+'''
+    queue handler that hands records over unformatted
+    the stock QueueHandler formats in the calling thread; here the listener thread
+    does it, the caller only enqueues (message arguments must not be mutated afterwards)
+'''
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record
+
+listener = None
+
+# install a non-blocking queue handler on the cbla loggers and set per-subsystem levels
+# levels maps logger names to level names or numbers and overrides DEFAULT_LEVELS
+def setup_logging(levels=None):
+    global listener
+    if (listener is not None):
+        set_levels(levels)
+        return
+
+    log_queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    # formatting and stderr writes happen on the listener thread
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger('cbla')
+    root.addHandler(LazyQueueHandler(log_queue))
+    root.propagate = False
+
+    for name in (ACQUISITION_SAMPLES, LEARNER_SAMPLES):
+        logging.getLogger(name).addFilter(RateLimitFilter())
+
+    set_levels(levels)
+
+def set_levels(levels=None):
+    merged = dict(DEFAULT_LEVELS)
+    if (levels is not None):
+        merged.update(levels)
+    for name, level in merged.items():
+        logging.getLogger(name).setLevel(level)
@@ -0,0 +1,184 @@
+import csv
+import json
+import math
+import numpy as np
+import threading
+import time
+
+# latency histogram covers 1 us to 100 s with 20 log-spaced buckets per decade
+MIN_LATENCY = 1e-6
+BUCKETS_PER_DECADE = 20
+NUM_BUCKETS = 8 * BUCKETS_PER_DECADE + 1
+
+EXPORT_FIELDS = ['stage', 'count', 'rate', 'mean_ms', 'p50_ms', 'p99_ms', 'max_ms']
+
+''' fixed log-bucket latency histogram, recording is O(1) and never allocates '''
+class LatencyHistogram(object):
+    def __init__(self):
+        self.counts = np.zeros(NUM_BUCKETS, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        if (seconds <= MIN_LATENCY):
+            bucket = 0
+        else:
+            bucket = min(NUM_BUCKETS - 1, int(math.log10(seconds / MIN_LATENCY) * BUCKETS_PER_DECADE) + 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if (seconds > self.max):
+            self.max = seconds
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    # upper edge of the bucket holding the q-th percentile, in seconds
+    def percentile(self, q):
+        if (self.count == 0):
+            return 0.0
+        rank = q / 100.0 * self.count
+        bucket = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(self.max, MIN_LATENCY * 10 ** (bucket / BUCKETS_PER_DECADE))
+
+'''
+    per-stage latency histograms and throughput counters
+    every thread records into its own histograms, so recording never takes a lock;
+    snapshot() merges them. The statistics of another process (the acquisition process)
+    are taken there and merged here under the name of their source
+'''
+class PerfStats(object):
+    def __init__(self):
+        self.enabled = True
+        self.started = time.time()
+        # (stage, thread id) -> LatencyHistogram, (counter, thread id) -> [count]
+        self.histograms = {}
+        self.counters = {}
+        self.register_lock = threading.Lock()
+
+    def reset(self):
+        with self.register_lock:
+            self.histograms = {}
+            self.counters = {}
+            self.started = time.time()
+
+    # histogram of a stage for the calling thread, or for a source merged from another process
+    def histogram(self, stage, source=None):
+        key = (stage, threading.get_ident() if source is None else source)
+        hist = self.histograms.get(key)
+        if (hist is None):
+            with self.register_lock:
+                hist = LatencyHistogram()
+                histograms = dict(self.histograms)
+                histograms[key] = hist
+                self.histograms = histograms
+        return hist
+
+    # record the duration of a stage that started at perf_counter() value start
+    def record(self, stage, start):
+        if (self.enabled):
+            self.histogram(stage).record(time.perf_counter() - start)
+
+    def timer(self, stage):
+        return StageTimer(self, stage)
+
+    # add n to a throughput counter
+    def count(self, name, n=1):
+        if (not self.enabled):
+            return
+        self.counter(name)[0] += n
+
+    def counter(self, name, source=None):
+        key = (name, threading.get_ident() if source is None else source)
+        counter = self.counters.get(key)
+        if (counter is None):
+            with self.register_lock:
+                counter = [0]
+                counters = dict(self.counters)
+                counters[key] = counter
+                self.counters = counters
+        return counter
+
+    # ({stage: LatencyHistogram}, {counter: total}) recorded since the last call, then start
+    # over; picklable, so another process can send them to be merged (see merge)
+    # a sample recorded while the tables are swapped may be lost
+    def take(self):
+        with self.register_lock:
+            histograms = self.histograms
+            counters = self.counters
+            self.histograms = {}
+            self.counters = {}
+        merged = {}
+        for (stage, _), hist in histograms.items():
+            merged.setdefault(stage, LatencyHistogram()).merge(hist)
+        totals = {}
+        for (name, _), counter in counters.items():
+            totals[name] = totals.get(name, 0) + counter[0]
+        return merged, totals
+
+    # add statistics taken in another process, source names it in place of a thread
+    def merge(self, source, taken):
+        histograms, totals = taken
+        for stage, hist in histograms.items():
+            self.histogram(stage, source).merge(hist)
+        for name, n in totals.items():
+            self.counter(name, source)[0] += n
+
+    # merged statistics, one row per stage or counter
+    def snapshot(self):
+        elapsed = max(1e-9, time.time() - self.started)
+        merged = {}
+        for (stage, _), hist in self.histograms.items():
+            merged.setdefault(stage, LatencyHistogram()).merge(hist)
+
+        rows = []
+        for stage in sorted(merged):
+            hist = merged[stage]
+            rows.append({
+                'stage': stage,
+                'count': hist.count,
+                'rate': hist.count / elapsed,
+                'mean_ms': 1000.0 * hist.total / hist.count if hist.count > 0 else 0.0,
+                'p50_ms': 1000.0 * hist.percentile(50),
+                'p99_ms': 1000.0 * hist.percentile(99),
+                'max_ms': 1000.0 * hist.max,
+            })
+
+        totals = {}
+        for (name, _), counter in self.counters.items():
+            totals[name] = totals.get(name, 0) + counter[0]
+        for name in sorted(totals):
+            rows.append({'stage': name, 'count': totals[name], 'rate': totals[name] / elapsed,
+                'mean_ms': '', 'p50_ms': '', 'p99_ms': '', 'max_ms': ''})
+        return rows
+
+    def export_csv(self, path):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.snapshot())
+
+    def export_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({'started': self.started, 'exported': time.time(), 'stages': self.snapshot()}, f, indent=2)
+
+''' times a with-block into a PerfStats stage '''
+class StageTimer(object):
+    def __init__(self, stats, stage):
+        self.stats = stats
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.record(self.stage, self.start)
+        return False
+
+# shared by all threads of the application
+stats = PerfStats()
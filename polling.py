@@ -0,0 +1,139 @@
+import math
+import numpy as np
+import time
+
+DEFAULT_REPORT_INTERVAL = 2.0
+
+# upper edges (ms) of the wake-up jitter histogram buckets, the last bucket is open ended
+JITTER_BUCKETS_MS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0)
+
+# period of a loop aligned to a base period, a whole multiple of base_ms
+# a period of 0 stays 0, the loop runs flat out (DeadlineScheduler does not wait)
+def align_period(period_ms, base_ms):
+    if (period_ms <= 0):
+        return 0
+    if (base_ms <= 0):
+        return period_ms
+    return max(1, int(round(period_ms / base_ms))) * base_ms
+
+'''
+    holds a loop on absolute deadlines epoch + offset + k * period
+    the period does not drift with the time spent working; loops sharing an epoch stay
+    aligned; cycles that overran are counted and the next deadline skips ahead
+'''
+class DeadlineScheduler(object):
+    def __init__(self, period_ms, epoch=None, offset_ms=0.0):
+        self.period = period_ms / 1000.0
+        self.epoch = time.time() if epoch is None else epoch
+        self.offset = offset_ms / 1000.0
+        self.deadline = None
+
+        self.cycles = 0
+        self.overruns = 0
+        self.missed = 0
+        self.max_jitter = 0.0
+        self.jitter_counts = np.zeros(len(JITTER_BUCKETS_MS) + 1, dtype=np.int64)
+
+    def set_period(self, period_ms, offset_ms=None):
+        period = period_ms / 1000.0
+        if (offset_ms is not None):
+            self.offset = offset_ms / 1000.0
+        if (period != self.period):
+            self.period = period
+            self.deadline = None
+
+    # first aligned deadline after now
+    def next_aligned(self, now):
+        start = self.epoch + self.offset
+        k = math.floor((now - start) / self.period) + 1
+        return start + k * self.period
+
+    # sleep until the next deadline, returns the wake-up jitter in seconds
+    def wait(self):
+        self.cycles += 1
+        if (self.period <= 0):
+            return 0.0
+
+        now = time.time()
+        if (self.deadline is None):
+            self.deadline = self.next_aligned(now)
+        elif (now > self.deadline):
+            # the last cycle overran its period, skip the deadlines already passed
+            self.overruns += 1
+            self.missed += int((now - self.deadline) / self.period) + 1
+            self.deadline = self.next_aligned(now)
+
+        delay = self.deadline - time.time()
+        if (delay > 0):
+            time.sleep(delay)
+
+        jitter = time.time() - self.deadline
+        self.record_jitter(jitter)
+        self.deadline += self.period
+        return jitter
+
+    def record_jitter(self, jitter):
+        jitter_ms = max(0.0, jitter * 1000.0)
+        self.jitter_counts[np.searchsorted(JITTER_BUCKETS_MS, jitter_ms)] += 1
+        if (jitter > self.max_jitter):
+            self.max_jitter = jitter
+
+    def get_stats(self):
+        return {
+            'period_ms': self.period * 1000.0,
+            'cycles': self.cycles,
+            'overruns': self.overruns,
+            'missed': self.missed,
+            'max_jitter_ms': self.max_jitter * 1000.0,
+            'jitter_buckets_ms': JITTER_BUCKETS_MS,
+            'jitter_counts': self.jitter_counts.tolist(),
+        }
+
+'''
+    keeps the acquisition sweep on absolute deadlines and measures
+    the achieved samples/sec of every polled device
+'''
+class PollingScheduler(object):
+    def __init__(self, period_ms, epoch=None, report_interval=DEFAULT_REPORT_INTERVAL):
+        self.deadline = DeadlineScheduler(period_ms, epoch)
+        self.report_interval = report_interval
+
+        self.window_start = time.time()
+        self.counts = {}
+        self.rates = {}
+        self.sweeps = 0
+        self.sweep_rate = 0.0
+
+    # sleep until the next sweep is due
+    def wait_next_sweep(self):
+        return self.deadline.wait()
+
+    # count one successful sample of a device
+    def record(self, byte_str, num=1):
+        self.counts[byte_str] = self.counts.get(byte_str, 0) + num
+
+    # count a finished sweep
+    def end_sweep(self):
+        self.sweeps += 1
+
+    # True once per report interval, refreshing the measured rates
+    def report_due(self):
+        now = time.time()
+        elapsed = now - self.window_start
+        if (elapsed < self.report_interval):
+            return False
+
+        self.rates = {key: count / elapsed for key, count in self.counts.items()}
+        self.sweep_rate = self.sweeps / elapsed
+        self.counts = {}
+        self.sweeps = 0
+        self.window_start = now
+        return True
+
+    # achieved samples/sec per device over the last report interval
+    def get_rates(self):
+        return dict(self.rates)
+
+    # total samples/sec over all devices
+    def total_rate(self):
+        return sum(self.rates.values())
@@ -1,14 +1,21 @@
-import collections
+import datetime
 import numpy as np
 import pyqtgraph as pg
+import time
 
 import qthreads
 
+from calibration import ADC_MAX, SensorCalibration
+from perf import stats as perf_stats
+from timeline import TimelineSession
+
 from PyQt4.QtGui import *
 from PyQt4.QtCore import *
 
 APP_TITLE = "CBLA Visualization"
 PLOT_TITLE = "CBLA Plots"
+PERF_TITLE = "Performance"
+TIMELINE_TITLE = "Timeline"
 
 MENU_CONFIG = "Configurations"
 
@@ -17,8 +24,23 @@ FONT_SIZE_TITLE = 12
 FONT_SIZE_CONFIG = 11
 FONT_SIZE_SUBTITLE = 11
 
-MAX_SENSOR_DATA_NUM = 100
 INIT_ACTUATOR_VAL = 30
+MAX_ACTUATOR_VAL = 255
+PERF_REFRESH_MS = 1000
+# delay between the last pan/zoom step and the timeline redraw
+TIMELINE_REDRAW_MS = 50
+
+# sensor grid: cells per row, rows shown at once and gap between cells (fraction of a cell)
+GRID_COLUMNS = 4
+GRID_VISIBLE_ROWS = 6
+GRID_GAP = 0.15
+
+# (cbla table column, plot title) of the learner metrics shown in the timeline
+TIMELINE_METRICS = [('expert_number', "Number of Experts"), ('prediction_error', "Learning Progress"),
+    ('max_action_value', "Max Action Value")]
+
+# (label, config['learner_groups'] value)
+LEARNER_GROUP_MODES = [("Single (in GUI process)", ''), ("One per Node", 'node'), ("One per Port", 'port')]
 
 COLOR_ACTIVE = QColor("black")
 COLOR_INACTIVE = QColor("red")
@@ -33,6 +55,9 @@ class VisualApp(QMainWindow):
     def __init__(self):
         super(VisualApp, self).__init__()
 
+        # timeline windows of recorded sessions opened from the bottom bar
+        self.timeline_windows = []
+
         # initialize UI
         self.initUI()
 
@@ -60,20 +85,38 @@ class VisualApp(QMainWindow):
         # update handle sensor/actuator widget
         self.sensorPlot.add_sensor.connect(self.add_sensor)
         self.sensorPlot.add_actuator.connect(self.add_actuator)
+        self.sensorPlot.remove_device.connect(self.remove_device)
 
         # update sensor/actuator layout
         self.sensorPlot.update_tab_physical.connect(self.update_tab_physical)
 
-        # update sensor plot
-        self.sensorPlot.update_sensor_plot.connect(self.update_sensor_plot)
+        # update sensor plots, one batch per tick
+        self.sensorPlot.update_sensor_plots.connect(self.update_sensor_plots)
+
+        # update actuator sliders and heatmap levels, one batch per cycle
+        self.cblathread.update_actuator_vals.connect(self.update_actuator_sliders)
+        self.cblathread.update_actuator_vals.connect(self.topright.heatmap.update_actuators)
+        self.bgthread.update_actuator_vals.connect(self.topright.heatmap.update_actuators)
+        # the same from an attached daemon's learner
+        self.bgthread.update_actuator_vals.connect(self.update_actuator_sliders)
 
-        # update actuator slider
-        self.cblathread.update_actuator_val.connect(self.update_actuator_slider)
+        # show achieved polling rate
+        self.bgthread.poll_rates.connect(self.update_poll_rates)
+
+        # show learner overruns and jitter
+        self.cblathread.cycle_stats.connect(self.update_cycle_stats)
+        self.bgthread.cycle_stats.connect(self.update_cycle_stats)
 
         self.bgthread.start()
 
         self.sensorPlot.start()
 
+        # redraw dirty sensor plots at a capped frame rate
+        self.renderer = RenderScheduler(self.topright.sensor_index, qthreads.config['render_fps'], self)
+        self.renderer.add_batched(self.topright.sensor_grid)
+        self.renderer.add_batched(self.topright.heatmap)
+        self.renderer.start()
+
     def initUI(self):
         self.central_widget = QWidget()
         self.central_layout = QGridLayout()
@@ -101,6 +144,10 @@ class VisualApp(QMainWindow):
 
         self.bottom = Bottom(self)
 
+        self.perf_dock_widget = QDockWidget(PERF_TITLE)
+        self.perf_dock_widget.setWidget(PerfPanel(self))
+        self.addDockWidget(Qt.RightDockWidgetArea, self.perf_dock_widget)
+
         splitter2 = QSplitter(Qt.Vertical, parent=self)
         splitter2.addWidget(self.splitter1)
         splitter2.addWidget(self.bottom)
@@ -113,6 +160,12 @@ class VisualApp(QMainWindow):
 
         self.update_status(qthreads.STATUS_READY)
 
+        self.poll_rate_label = QLabel()
+        self.statusBar().addPermanentWidget(self.poll_rate_label)
+
+        self.cycle_label = QLabel()
+        self.statusBar().addPermanentWidget(self.cycle_label)
+
         self.setWindowTitle(APP_TITLE)
 
         self.setAttribute(Qt.WA_DeleteOnClose)
@@ -132,49 +185,90 @@ class VisualApp(QMainWindow):
     def update_status(self, status):
         self.statusBar().showMessage(status)
 
+    # show achieved samples/sec at status bar
+    def update_poll_rates(self, rates):
+        if (len(rates) == 0):
+            self.poll_rate_label.setText("")
+            return
+        total = sum(rates.values())
+        slowest = min(rates.values())
+        self.poll_rate_label.setText("Polling {:.0f} samples/s ({:.1f}/s per device min)".format(total, slowest))
+
+    # show learner cycle overruns and worst jitter at status bar
+    def update_cycle_stats(self, stats):
+        self.cycle_label.setText("Cycle {:.0f} ms, {} overruns, max jitter {:.1f} ms".format(
+            stats['period_ms'], stats['overruns'], stats['max_jitter_ms']))
+
     # disable connect button
     def disable_btn_connect(self):
         self.bottom.btn_connect.setEnabled(False)
 
     # clear all actuators and sensors
     def clear_sensor_actuator_list(self):
-        self.topright.actuators = []
-        self.topright.sensors = []
+        self.topright.clear_layout()
+        self.topright.clear_list()
 
     # update actuator/sensor tab
     def update_tab_physical(self):
         self.topright.tab_physical.setWidget(self.topright.tab_physical_content)
+        self.topright.heatmap.set_table(qthreads.runtime.device_table)
 
     # add sensor to layout
-    def add_sensor(self, node, port, addr, type, row, col, colspan):
+    def add_sensor(self, table, i, row, col, colspan):
+        if (qthreads.config['sensor_grid']):
+            trace = self.topright.sensor_grid.add_sensor(table, i)
+            self.topright.sensor_index[trace.key] = trace
+            return
+
         layout = self.topright.tab_physical_content.layout()
-        sensor = Sensor(node, port, addr, type, self.topright.tab_physical)
+        sensor = Sensor(table, i, self.topright.tab_physical)
         layout.addWidget(sensor, row, col, 1, colspan)
 
         self.topright.sensors.append(sensor)
+        self.topright.sensor_index[sensor.key] = sensor
 
     # add actuator to layout
-    def add_actuator(self, node, port, addr, type, row, col):
+    def add_actuator(self, table, i, row, col):
         layout = self.topright.tab_physical_content.layout()
-        actuator = Actuator(node, port, addr, type, self.topright.tab_physical)
+        actuator = Actuator(table, i, self.topright.tab_physical)
         layout.addWidget(actuator, row, col)
 
         self.topright.actuators.append(actuator)
+        self.topright.actuator_index[actuator.key] = actuator
+
+    # remove the widget (or grid trace) of a device that is gone, the others stay as they are
+    def remove_device(self, key):
+        self.renderer.dirty.discard(key)
+        actuator = self.topright.actuator_index.pop(key, None)
+        if (actuator is not None):
+            self.topright.actuators.remove(actuator)
+            self.topright.remove_widget(actuator)
+        sensor = self.topright.sensor_index.pop(key, None)
+        if (isinstance(sensor, GridTrace)):
+            self.topright.sensor_grid.remove_sensor(key)
+        elif (sensor is not None):
+            self.topright.sensors.remove(sensor)
+            self.topright.remove_widget(sensor)
 
     # update value of actuator slider
-    def update_actuator_slider(self, byte_str, val):
-        for actuator in self.topright.actuators:
-            if (actuator.byte_str == byte_str):
-                actuator.slider.setValue(val)
-
-    # update value of sensor plot
-    def update_sensor_plot(self, byte_str, val):
-        for sensor in self.topright.sensors:
-            if (sensor.byte_str == byte_str):
-                sensor.data.append(val)
-                sensor.y[:] = sensor.data
-                if(sensor.curve is not None):
-                    sensor.curve.setData(sensor.x, sensor.y)
+    def update_actuator_slider(self, key, val):
+        actuator = self.topright.actuator_index.get(key)
+        if (actuator is not None):
+            actuator.slider.setValue(val)
+
+    # update all actuator sliders of a cycle
+    def update_actuator_sliders(self, vals):
+        for key, val in vals.items():
+            self.update_actuator_slider(key, val)
+
+    # mark a sensor plot for redraw, the render scheduler draws it on its next frame
+    def update_sensor_plot(self, key, val):
+        self.renderer.mark_dirty(key)
+
+    # update all sensor plots that changed since the last tick
+    def update_sensor_plots(self, vals):
+        for key in vals.keys():
+            self.renderer.mark_dirty(key)
 
 class Configuration(QWidget):
     def __init__(self, main=None):
@@ -299,6 +393,27 @@ class Configuration(QWidget):
         cycle_time.setFont(QFont(FONT_ARIAL, FONT_SIZE_CONFIG))
         cycle_time.textEdited.connect(self.cycle_time_changed)
 
+        replay_session = QLineEdit(str(qthreads.config['replay_session']))
+        replay_session.setFont(QFont(FONT_ARIAL, FONT_SIZE_CONFIG))
+        replay_session.textEdited.connect(self.replay_session_changed)
+
+        replay_speed = QLineEdit(str(qthreads.config['replay_speed']))
+        replay_speed.setValidator(QDoubleValidator())
+        replay_speed.setFont(QFont(FONT_ARIAL, FONT_SIZE_CONFIG))
+        replay_speed.textEdited.connect(self.replay_speed_changed)
+
+        learner_groups = QComboBox()
+        learner_groups.setFont(QFont(FONT_ARIAL, FONT_SIZE_CONFIG))
+        for text, mode in LEARNER_GROUP_MODES:
+            learner_groups.addItem(text, mode)
+        learner_groups.setCurrentIndex([mode for text, mode in LEARNER_GROUP_MODES].index(qthreads.config['learner_groups']))
+        learner_groups.currentIndexChanged.connect(self.learner_groups_changed)
+
+        sim_nodes = QLineEdit(str(qthreads.config['sim_nodes']))
+        sim_nodes.setValidator(QIntValidator(0, 255))
+        sim_nodes.setFont(QFont(FONT_ARIAL, FONT_SIZE_CONFIG))
+        sim_nodes.textEdited.connect(self.sim_nodes_changed)
+
         label_cbla_plot = QLabel("CBLA Plot")
         label_cbla_plot.setFont(QFont(FONT_ARIAL, FONT_SIZE_SUBTITLE, QFont.Bold))
 
@@ -317,8 +432,8 @@ class Configuration(QWidget):
         layout.addRow(title)
 
         layout.addRow(label_connection)
-        layout.addRow("COM Port", com_port)
-        layout.addRow("Teensy Serial Number", serial_number)
+        layout.addRow("COM Port(s)", com_port)
+        layout.addRow("Teensy Serial Number(s)", serial_number)
 
         layout.addRow(label_learner)
         layout.addRow("Exploring Rate", exploring_rate)
@@ -343,6 +458,10 @@ class Configuration(QWidget):
 
         layout.addRow(label_execution)
         layout.addRow("Cycle Time (ms)", cycle_time)
+        layout.addRow("Learner Processes", learner_groups)
+        layout.addRow("Replay Session", replay_session)
+        layout.addRow("Replay Speed (0 = max)", replay_speed)
+        layout.addRow("Simulated Nodes (0 = off)", sim_nodes)
 
         layout.addRow(label_cbla_plot)
         layout.addRow(plot_prediction_error)
@@ -423,6 +542,18 @@ class Configuration(QWidget):
     def cycle_time_changed(self, val):
         qthreads.config['cycle_time'] = val
 
+    def learner_groups_changed(self, index):
+        qthreads.config['learner_groups'] = LEARNER_GROUP_MODES[index][1]
+
+    def replay_session_changed(self, val):
+        qthreads.config['replay_session'] = val
+
+    def replay_speed_changed(self, val):
+        qthreads.config['replay_speed'] = val
+
+    def sim_nodes_changed(self, val):
+        qthreads.config['sim_nodes'] = val if val else 0
+
     def plot_prediction_error_changed(self, checkbox):
         plot_prediction_error = checkbox.isChecked()
         if (plot_prediction_error and qthreads.CBLAPlots.plot_prediction_error not in qthreads.cbla_plots):
@@ -450,6 +581,9 @@ class SensorActuator(QWidget):
         self.init_sensor_actuator_widget()
         self.actuators = []
         self.sensors = []
+        # key -> widget, for O(1) dispatch of incoming values
+        self.actuator_index = {}
+        self.sensor_index = {}
         self.main = main
 
     def init_sensor_actuator_widget(self):
@@ -464,11 +598,16 @@ class SensorActuator(QWidget):
         self.tab_physical_content = QWidget()
         self.tab_physical_content.setLayout(QGridLayout())
 
+        self.sensor_grid = SensorGrid()
+        self.heatmap = Heatmap()
+
         self.tab_virtual = QScrollArea(tab_widget) 
         tab_virtual_content = VirtualBehavior()
         self.tab_virtual.setWidget(tab_virtual_content)
 
         tab_widget.addTab(self.tab_physical, "Physical")
+        tab_widget.addTab(self.sensor_grid, "Sensors")
+        tab_widget.addTab(self.heatmap, "Heatmap")
         tab_widget.addTab(self.tab_virtual, "Virtual")
 
         layout.addWidget(label_sens_act)
@@ -479,15 +618,26 @@ class SensorActuator(QWidget):
     def clear_list(self):
         self.actuators = []
         self.sensors = []
-
-    def clear_layout(self):
-        layout = self.tab_physical.widget().layout()
+        # cleared in place, the render scheduler holds a reference to the sensor index
+        self.actuator_index.clear()
+        self.sensor_index.clear()
+        self.sensor_grid.clear()
+
+    # remove every widget of the physical tab, nested layouts included
+    def clear_layout(self, layout=None):
+        if (layout is None):
+            layout = self.tab_physical_content.layout()
         while (layout.count() > 0):
             child = layout.takeAt(0)
             if (child.widget() is not None):
                 child.widget().deleteLater()
             elif (child.layout() is not None):
-                clear_layout(child.layout())
+                self.clear_layout(child.layout())
+
+    # remove one sensor or actuator widget from the physical tab
+    def remove_widget(self, widget):
+        self.tab_physical_content.layout().removeWidget(widget)
+        widget.deleteLater()
 
 class VirtualBehavior(QWidget):
     def __init__(self, parent=None):
@@ -495,21 +645,21 @@ class VirtualBehavior(QWidget):
         pass
 
 class Sensor(QWidget):
-    def __init__(self, node, port, addr, type, parent=None):
+    # table: device_registry.DeviceTable, i: the sensor's row in it
+    def __init__(self, table, i, parent=None):
         super(Sensor, self).__init__(parent)
 
-        self.node = node
-        self.port = port
-        self.addr = addr
-        self.type = type
+        self.node = table.node_of[i]
+        self.port = int(table.ports[i])
+        self.addr = int(table.addresses[i])
+        self.type = int(table.types[i])
 
-        self.byte_str = self.addr.to_bytes(1,byteorder='big') + self.type.to_bytes(1,byteorder='big') + \
-            self.port.to_bytes(1,byteorder='big')
+        self.byte_str = table.byte_strs[i]
+        # sample store key, node is the teensy serial number
+        self.key = table.keys[i]
 
         self.curve = None
-        self.x = np.linspace(0.0, 10.0, MAX_SENSOR_DATA_NUM)
-        self.y = np.zeros(MAX_SENSOR_DATA_NUM, dtype=np.float)
-        self.data = collections.deque([0.0]*MAX_SENSOR_DATA_NUM, MAX_SENSOR_DATA_NUM)
+        self.view = None
 
         self.init_sensor_widget()
 
@@ -539,14 +689,18 @@ class Sensor(QWidget):
 
         plot = pg.PlotWidget(title="Sensor Reading")
 
-        plot.setLabel("bottom", text="Sample")
+        # seconds before the newest reading
+        plot.setLabel("bottom", text="Time (s)")
         plot.setLabel("left", text="Sensor Value")
-        plot.setXRange(0, 10)
+        plot.setXRange(-float(qthreads.config['plot_span']), 0)
         plot.setYRange(0, 5000)
 
         plot.showGrid(x=True, y=True)
 
-        self.curve = plot.plot(self.x, self.y, pen=(255,0,0))
+        self.curve = plot.plot(pen=(255,0,0))
+        self.view = plot.getViewBox()
+        # zooming or panning picks the pyramid level of the new range
+        self.view.sigXRangeChanged.connect(lambda view, x_range: self.render())
 
         layout.addWidget(self.toggleButton)
 
@@ -572,17 +726,590 @@ class Sensor(QWidget):
         self.toggleButton.setArrowType(arrow)
         self.toggleButton.setText(text)
 
+    # True if the plot is expanded and at least partly inside the scroll area viewport
+    def is_plot_visible(self):
+        return self.subwidget.isVisible() and not self.subwidget.visibleRegion().isEmpty()
+
+    # redraw the curve from the min/max pyramid level with about one entry per pixel
+    # of the visible time range, the cost does not grow with the length of the history
+    def render(self):
+        now = qthreads.plot_history.latest_time(self.key)
+        if (self.curve is None or now is None):
+            return
+        x_min, x_max = self.view.viewRange()[0]
+        x, y = qthreads.plot_history.envelope_line(self.key, now + x_min, max(1, int(self.view.width())))
+        self.curve.setData(x - now, y)
+
+'''
+    one sensor's cell in a SensorGrid, takes the place of a Sensor widget in the render scheduler
+'''
+class GridTrace(object):
+    def __init__(self, grid, table, i, cell):
+        self.grid = grid
+        self.cell = cell
+        self.node = table.node_of[i]
+        self.port = int(table.ports[i])
+        self.addr = int(table.addresses[i])
+        self.key = table.keys[i]
+
+    def is_plot_visible(self):
+        return self.grid.is_cell_visible(self.cell)
+
+    # the grid redraws all visible traces at once, see SensorGrid.flush
+    def render(self):
+        self.grid.stale = True
+
+'''
+    traces of all sensors drawn in one GraphicsLayout
+    every sensor gets a cell of a grid laid out in the data coordinates of a single plot,
+    so axes, view box and cell frames are shared; the traces of the visible cells are
+    joined into one curve, one path per redraw however many sensors there are. a scroll
+    bar pages through the rows, and a cell's label is only created once it is scrolled
+    into view
+'''
+class SensorGrid(QWidget):
+    def __init__(self, parent=None):
+        super(SensorGrid, self).__init__(parent)
+
+        self.traces = []
+        # cell -> label, created lazily
+        self.labels = {}
+        self.visible_cells = range(0)
+        # set when a trace changed or the view moved, cleared by flush
+        self.stale = False
+
+        self.init_grid_widget()
+
+    def init_grid_widget(self):
+        layout = QHBoxLayout()
+
+        self.plot_window = pg.GraphicsLayoutWidget()
+        self.plot = self.plot_window.addPlot()
+        self.plot.hideAxis('left')
+        self.plot.hideAxis('bottom')
+        self.plot.setMouseEnabled(x=False, y=False)
+        self.plot.hideButtons()
+        # row 0 at the top
+        self.plot.invertY(True)
+        self.plot.setXRange(-GRID_GAP / 2, GRID_COLUMNS * (1 + GRID_GAP) - GRID_GAP / 2, padding=0)
+
+        self.frames = self.plot.plot(pen=(150,150,150))
+        self.curve = self.plot.plot(pen=(255,0,0))
+
+        self.scroll = QScrollBar(Qt.Vertical)
+        self.scroll.valueChanged.connect(self.scroll_to)
+
+        layout.addWidget(self.plot_window)
+        layout.addWidget(self.scroll)
+        self.setLayout(layout)
+
+        self.scroll_to(0)
+
+    def num_rows(self):
+        return (len(self.traces) + GRID_COLUMNS - 1) // GRID_COLUMNS
+
+    # top left corner of a cell in plot coordinates
+    def cell_origin(self, cell):
+        return (cell % GRID_COLUMNS) * (1 + GRID_GAP), (cell // GRID_COLUMNS) * (1 + GRID_GAP)
+
+    def add_sensor(self, table, i):
+        trace = GridTrace(self, table, i, len(self.traces))
+        self.traces.append(trace)
+        self.scroll.setMaximum(max(0, self.num_rows() - GRID_VISIBLE_ROWS))
+        self.draw_frames()
+        self.update_visible_cells()
+        return trace
+
+    # remove a sensor's trace, the traces after it move up one cell
+    def remove_sensor(self, key):
+        self.traces = [trace for trace in self.traces if trace.key != key]
+        for cell, trace in enumerate(self.traces):
+            trace.cell = cell
+        # labels are recreated at the new cells as they come into view
+        for label in self.labels.values():
+            self.plot.removeItem(label)
+        self.labels = {}
+        self.scroll.setMaximum(max(0, self.num_rows() - GRID_VISIBLE_ROWS))
+        self.draw_frames()
+        self.update_visible_cells()
+
+    def clear(self):
+        for label in self.labels.values():
+            self.plot.removeItem(label)
+        self.labels = {}
+        self.traces = []
+        self.scroll.setMaximum(0)
+        self.frames.setData([], [])
+        self.curve.setData([], [])
+        self.update_visible_cells()
+
+    # outlines of all cells as one path
+    def draw_frames(self):
+        num = len(self.traces)
+        x0, y0 = self.cell_origin(np.arange(num))
+        corners_x = np.array([0, 1, 1, 0, 0, np.nan])
+        corners_y = np.array([0, 0, 1, 1, 0, np.nan])
+        x = (x0[:, None] + corners_x).ravel()
+        y = (y0[:, None] + corners_y).ravel()
+        self.frames.setData(x, y, connect='finite')
+
+    def scroll_to(self, row):
+        top = row * (1 + GRID_GAP) - GRID_GAP / 2
+        self.plot.setYRange(top, top + GRID_VISIBLE_ROWS * (1 + GRID_GAP), padding=0)
+        self.update_visible_cells()
+
+    def update_visible_cells(self):
+        row = self.scroll.value()
+        first = row * GRID_COLUMNS
+        self.visible_cells = range(first, min(len(self.traces), first + GRID_VISIBLE_ROWS * GRID_COLUMNS))
+        for cell in self.visible_cells:
+            if (cell not in self.labels):
+                trace = self.traces[cell]
+                label = pg.TextItem("Node: {} Port: {} Address: {}".format(trace.node, trace.port, trace.addr),
+                    color=(200,200,200), anchor=(0, 0))
+                label.setPos(*self.cell_origin(cell))
+                self.plot.addItem(label)
+                self.labels[cell] = label
+        self.stale = True
+
+    def is_cell_visible(self, cell):
+        return self.isVisible() and cell in self.visible_cells
+
+    # redraw the visible traces as one curve if any of them changed, called every frame
+    def flush(self):
+        if (not self.stale or not self.isVisible()):
+            return
+        self.stale = False
+        start = time.perf_counter()
+        history = qthreads.plot_history
+        span = float(qthreads.config['plot_span'])
+        # one envelope entry per pixel of a cell
+        width = max(1, int(self.plot.getViewBox().width() / (GRID_COLUMNS * (1 + GRID_GAP))))
+        traces = [self.traces[cell] for cell in self.visible_cells]
+        latest = [history.latest_time(trace.key) for trace in traces]
+        latest = [t for t in latest if t is not None]
+        if (len(latest) == 0):
+            return
+        # all cells share the time axis, ending at the newest reading of any of them
+        now = max(latest)
+        xs = []
+        ys = []
+        for trace in traces:
+            x, y = history.envelope_line(trace.key, now - span, width)
+            if (len(x) == 0):
+                continue
+            x0, y0 = self.cell_origin(trace.cell)
+            xs.append(x0 + np.clip((x - now + span) / span, 0, 1))
+            ys.append(y0 + 1 - np.clip(y / ADC_MAX, 0, 1))
+            xs.append([np.nan])
+            ys.append([np.nan])
+        if (len(xs) == 0):
+            return
+        self.curve.setData(np.concatenate(xs), np.concatenate(ys), connect='finite')
+        perf_stats.record('grid_redraw', start)
+
+'''
+    every sensor's latest value and every actuator's level in one image
+    one pixel row per port of every node, its actuators on the left and its sensors on
+    the right of an empty column, like the physical tab; the pixel of every device is
+    computed once per device table, so a frame is one vectorized pass from the sample
+    store's latest values into the image
+'''
+class Heatmap(QWidget):
+    def __init__(self, parent=None):
+        super(Heatmap, self).__init__(parent)
+
+        self.table = None
+        # pixel (flat index of the image) of every sensor and actuator row of the table
+        self.sensor_pixels = np.zeros(0, dtype=np.intp)
+        self.actuator_pixels = np.zeros(0, dtype=np.intp)
+        # actuator key -> position in actuator_pixels
+        self.actuator_index = {}
+        self.levels = np.zeros(0, dtype=np.float64)
+        self.calibration = SensorCalibration([])
+        # sample store keys the store rows were mapped for, and the table row of every store row
+        self.store_keys = None
+        self.store_rows = np.zeros(0, dtype=np.intp)
+        self.store_sensors = np.zeros(0, dtype=np.intp)
+        # (rows, columns) color indices
+        self.image = np.zeros((0, 0), dtype=np.uint8)
+
+        # 0 is an empty pixel, 1..255 the value from low to high (blue to red)
+        ramp = np.linspace(0.0, 1.0, 255)
+        colors = np.stack([255 * ramp, 255 * (1 - np.abs(2 * ramp - 1)), 255 * (1 - ramp)], axis=1)
+        self.lut = np.vstack([[40, 40, 40], colors]).astype(np.uint8)
+
+        self.init_heatmap_widget()
+
+    def init_heatmap_widget(self):
+        layout = QVBoxLayout()
+
+        self.plot_window = pg.GraphicsLayoutWidget()
+        self.plot = self.plot_window.addPlot()
+        self.plot.hideAxis('bottom')
+        self.plot.invertY(True)
+        self.plot.setAspectLocked(True)
+        self.image_item = pg.ImageItem()
+        self.plot.addItem(self.image_item)
+
+        layout.addWidget(self.plot_window)
+        self.setLayout(layout)
+
+    # lay out the devices of a new device table
+    def set_table(self, table):
+        if (table is self.table):
+            return
+        self.table = table
+
+        # (node, port, actuator rows, sensor rows) of every image row
+        ports = []
+        for node in table.nodes:
+            for port, rows in table.port_rows(node):
+                ports.append((node, port, rows[~table.is_sensor[rows]], rows[table.is_sensor[rows]]))
+        act_width = max([len(p[2]) for p in ports] + [0])
+        width = act_width + 1 + max([len(p[3]) for p in ports] + [0])
+
+        # pixel of every table row, a flat index into the (rows, columns) image
+        pixels = np.zeros(len(table), dtype=np.intp)
+        for y, (node, port, acts, sens) in enumerate(ports):
+            pixels[acts] = y * width + np.arange(len(acts))
+            pixels[sens] = y * width + act_width + 1 + np.arange(len(sens))
+        self.sensor_pixels = pixels[table.sensor_rows]
+        self.actuator_pixels = pixels[table.actuator_rows]
+        self.actuator_index = {key: i for i, key in enumerate(table.actuator_keys)}
+        self.levels = np.zeros(len(table.actuator_rows), dtype=np.float64)
+        self.calibration = SensorCalibration(table.types[table.sensor_rows], qthreads.config['sensor_calibration'])
+        self.store_keys = None
+        self.image = np.zeros((len(ports), width), dtype=np.uint8)
+
+        self.plot.getAxis('left').setTicks([[(y + 0.5, "{} P{}".format(node, port)) for y, (node, port, _, _) in enumerate(ports)]])
+        self.plot.setRange(xRange=(0, width), yRange=(0, len(ports)), padding=0.02)
+
+    # actuator commands of a cycle, {key: value}
+    def update_actuators(self, vals):
+        for key, val in vals.items():
+            i = self.actuator_index.get(key)
+            if (i is not None):
+                self.levels[i] = val
+
+    # map the rows of the sample store to the table's sensors, when its keys changed
+    def map_store(self, store):
+        keys = store.keys
+        if (keys == self.store_keys):
+            return
+        self.store_keys = keys
+        sensor_index = {key: i for i, key in enumerate(self.table.sensor_keys)}
+        rows = [(r, sensor_index[key]) for r, key in enumerate(keys) if key in sensor_index]
+        self.store_rows = np.array([r for r, _ in rows], dtype=np.intp)
+        self.store_sensors = np.array([s for _, s in rows], dtype=np.intp)
+
+    # redraw the image from the latest values, called every frame
+    def flush(self):
+        if (self.table is None or self.image.size == 0 or not self.isVisible()):
+            return
+        start = time.perf_counter()
+        store = qthreads.runtime.sample_store
+        self.map_store(store)
+
+        image = self.image.reshape(-1)
+        image[:] = 0
+        latest = store.latest_all()
+        sensor_vals = np.full(len(self.sensor_pixels), np.nan)
+        # sensors that came or went after the rows were mapped are mapped again next frame
+        if (len(latest) > 0 and len(latest) == len(self.store_keys)):
+            sensor_vals[self.store_sensors] = latest[self.store_rows]
+        read = np.isfinite(sensor_vals)
+        norm = self.calibration.normalize(np.where(read, sensor_vals, 0))
+        image[self.sensor_pixels[read]] = 1 + (np.clip(norm[read], 0, 1) * 254).astype(np.uint8)
+        image[self.actuator_pixels] = 1 + (np.clip(self.levels / MAX_ACTUATOR_VAL, 0, 1) * 254).astype(np.uint8)
+
+        # ImageItem takes images indexed [x, y]
+        self.image_item.setImage(self.image.T, lut=self.lut, levels=(0, 255), autoLevels=False)
+        perf_stats.record('heatmap_redraw', start)
+
+'''
+    redraws sensor plots from a single QTimer
+    curves are only drawn when they changed since the last frame and are visible,
+    hidden or scrolled off curves stay dirty until they are shown again
+'''
+class RenderScheduler(QObject):
+    def __init__(self, sensor_index, fps, parent=None):
+        super(RenderScheduler, self).__init__(parent)
+
+        self.sensor_index = sensor_index
+        self.dirty = set()
+        # views drawing many sensors at once, flushed once per frame after the dirty sensors
+        self.batched = []
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.render_frame)
+        self.set_fps(fps)
+
+    # cap the redraw rate at fps frames per second
+    def set_fps(self, fps):
+        self.fps = max(1, int(fps))
+        self.timer.setInterval(int(1000 / self.fps))
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def mark_dirty(self, key):
+        self.dirty.add(key)
+
+    def add_batched(self, view):
+        self.batched.append(view)
+
+    def render_frame(self):
+        if (len(self.dirty) > 0):
+            start = time.perf_counter()
+            drawn = []
+            for key in self.dirty:
+                sensor = self.sensor_index.get(key)
+                if (sensor is None):
+                    drawn.append(key)
+                elif (sensor.is_plot_visible()):
+                    sensor.render()
+                    drawn.append(key)
+            self.dirty.difference_update(drawn)
+            perf_stats.record('plot_redraw', start)
+        # batched views draw the sensors marked above in one go
+        for view in self.batched:
+            view.flush()
+
+'''
+    GUI-side view of the learner metrics
+    reads qthreads.runtime.cbla_metrics on its own timer so the learner never waits on rendering
+'''
+class CBLAPlotModel(QObject):
+    def __init__(self, curves, metrics, fps, parent=None):
+        super(CBLAPlotModel, self).__init__(parent)
+
+        self.curves = curves
+        self.metrics = metrics
+        self.version = -1
+
+        self.x = np.linspace(0.0, 50.0, metrics.capacity)
+        # one preallocated buffer per plotted metric
+        self.y = {plot: np.zeros(metrics.capacity, dtype=np.float64) for plot in curves}
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.setInterval(int(1000 / max(1, int(fps))))
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def refresh(self):
+        if (self.metrics.version == self.version):
+            return
+        self.version = self.metrics.version
+        start = time.perf_counter()
+        for plot, curve in self.curves.items():
+            y = self.y[plot]
+            n = self.metrics.read(plot.value - 1, y)
+            curve.setData(self.x[len(y) - n:], y[len(y) - n:])
+        perf_stats.record('cbla_redraw', start)
+
+'''
+    live table of the per-stage latencies and throughput counters in perf.stats
+'''
+class PerfPanel(QWidget):
+    def __init__(self, main=None):
+        super(PerfPanel, self).__init__()
+        self.main = main
+        self.initUI()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(PERF_REFRESH_MS)
+
+    def initUI(self):
+        layout = QVBoxLayout()
+
+        self.table = QTableWidget(0, 6)
+        self.table.setHorizontalHeaderLabels(["Stage", "Count", "Rate (/s)", "p50 (ms)", "p99 (ms)", "Max (ms)"])
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+
+        btn_layout = QHBoxLayout()
+
+        btn_reset = QPushButton("Reset")
+        btn_reset.clicked.connect(self.reset)
+
+        btn_csv = QPushButton("Export CSV")
+        btn_csv.clicked.connect(self.export_csv)
+
+        btn_json = QPushButton("Export JSON")
+        btn_json.clicked.connect(self.export_json)
+
+        btn_layout.addWidget(btn_reset)
+        btn_layout.addStretch(1)
+        btn_layout.addWidget(btn_csv)
+        btn_layout.addWidget(btn_json)
+
+        layout.addWidget(self.table)
+        layout.addLayout(btn_layout)
+
+        self.setLayout(layout)
+
+    def refresh(self):
+        if (not self.isVisible()):
+            return
+        rows = perf_stats.snapshot()
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            cells = [row['stage'], str(row['count']), "{:.1f}".format(row['rate'])]
+            for field in ('p50_ms', 'p99_ms', 'max_ms'):
+                cells.append("" if row[field] == '' else "{:.3f}".format(row[field]))
+            for j, text in enumerate(cells):
+                self.table.setItem(i, j, QTableWidgetItem(text))
+
+    def reset(self):
+        perf_stats.reset()
+        self.refresh()
+
+    def export_csv(self):
+        path = QFileDialog.getSaveFileName(self, "Export Performance Data", "perf.csv", "CSV (*.csv)")
+        if (path):
+            perf_stats.export_csv(path)
+
+    def export_json(self):
+        path = QFileDialog.getSaveFileName(self, "Export Performance Data", "perf.json", "JSON (*.json)")
+        if (path):
+            perf_stats.export_json(path)
+
+'''
+    zoomable timeline of a whole recorded session
+    the learner metrics and one chosen device share the time axis; after every pan or
+    zoom the curves are redrawn from the visible range only, read through the session's
+    time index, so overnight sessions are never loaded into memory as a whole
+'''
+class TimelineWindow(QWidget):
+    def __init__(self, path, parent=None):
+        super(TimelineWindow, self).__init__(parent)
+        self.session = TimelineSession(path)
+        # (TimelineSeries, curve) of every drawn series
+        self.curves = []
+        self.device_series = None
+
+        self.redraw_timer = QTimer(self)
+        self.redraw_timer.setSingleShot(True)
+        self.redraw_timer.setInterval(TIMELINE_REDRAW_MS)
+        self.redraw_timer.timeout.connect(self.redraw)
+
+        self.initUI()
+        self.show_all()
+
+    def initUI(self):
+        layout = QVBoxLayout()
+
+        top_layout = QHBoxLayout()
+
+        label_session = QLabel(self.session.path)
+        label_session.setFont(QFont(FONT_ARIAL, FONT_SIZE_SUBTITLE, QFont.Bold))
+
+        self.combo_device = QComboBox()
+        self.combo_device.addItem("No Device")
+        for node, byte_str in self.session.device_keys:
+            kind = "Sensor" if (byte_str[1] % 2 == 0) else "Actuator"
+            self.combo_device.addItem("{} Node: {} Port: {} Address: {}".format(kind, node, byte_str[2], byte_str[0]))
+        self.combo_device.currentIndexChanged.connect(self.device_changed)
+
+        btn_all = QPushButton("Show All")
+        btn_all.clicked.connect(self.show_all)
+
+        btn_reload = QPushButton("Reload")
+        btn_reload.clicked.connect(self.reload)
+
+        top_layout.addWidget(label_session)
+        top_layout.addStretch(1)
+        top_layout.addWidget(self.combo_device)
+        top_layout.addWidget(btn_all)
+        top_layout.addWidget(btn_reload)
+
+        self.plot_window = pg.GraphicsLayoutWidget()
+        self.first_plot = None
+        for row, (column, title) in enumerate(TIMELINE_METRICS):
+            plot = self.add_plot(row, title)
+            self.curves.append((self.session.series('cbla', column), plot.plot(pen=(255,0,0))))
+
+        self.device_plot = self.add_plot(len(TIMELINE_METRICS), "Device Value")
+        self.device_curve = self.device_plot.plot(pen=(0,0,255))
+
+        self.first_plot.getViewBox().sigXRangeChanged.connect(lambda view, x_range: self.redraw_timer.start())
+
+        layout.addLayout(top_layout)
+        layout.addWidget(self.plot_window)
+        self.setLayout(layout)
+
+        self.setWindowTitle("{} - {}".format(TIMELINE_TITLE, self.session.path))
+        self.resize(900, 700)
+
+    # plot on the shared time axis
+    def add_plot(self, row, title):
+        plot = self.plot_window.addPlot(row=row, col=0, title=title)
+        plot.setLabel("bottom", text="Time since start (s)")
+        plot.showGrid(x=True, y=True)
+        plot.enableAutoRange('y', True)
+        if (self.first_plot is None):
+            self.first_plot = plot
+        else:
+            plot.setXLink(self.first_plot)
+        return plot
+
+    def device_changed(self, index):
+        if (index <= 0):
+            self.device_series = None
+            self.device_curve.setData([], [])
+        else:
+            key = self.session.device_keys[index - 1]
+            table = 'sensors' if (key[1][1] % 2 == 0) else 'actuators'
+            self.device_series = self.session.series(table, 'value', key)
+        self.redraw()
+
+    def show_all(self):
+        t0, t1 = self.session.time_range()
+        started = self.session.reader.started
+        self.first_plot.setXRange(t0 - started, max(t1, t0 + 1) - started, padding=0)
+        self.redraw()
+
+    # pick up the rows recorded since the session was opened
+    def reload(self):
+        self.session.reload()
+        self.redraw()
+
+    def redraw(self):
+        start = time.perf_counter()
+        view = self.first_plot.getViewBox()
+        x_min, x_max = view.viewRange()[0]
+        started = self.session.reader.started
+        width = max(1, int(view.width()))
+        curves = list(self.curves)
+        if (self.device_series is not None):
+            curves.append((self.device_series, self.device_curve))
+        for series, curve in curves:
+            x, y = series.envelope_line(started + x_min, started + x_max, width)
+            curve.setData(x, y)
+        perf_stats.record('timeline_redraw', start)
+
 class Actuator(QWidget):
-    def __init__(self, node, port, addr, type, parent = None):
+    # table: device_registry.DeviceTable, i: the actuator's row in it
+    def __init__(self, table, i, parent = None):
         super(Actuator, self).__init__(parent)
 
-        self.node = node
-        self.port = port
-        self.addr = addr
-        self.type = type
+        self.node = table.node_of[i]
+        self.port = int(table.ports[i])
+        self.addr = int(table.addresses[i])
+        self.type = int(table.types[i])
 
-        self.byte_str = self.addr.to_bytes(1,byteorder='big') + self.type.to_bytes(1,byteorder='big') + \
-            self.port.to_bytes(1,byteorder='big')
+        self.byte_str = table.byte_strs[i]
+        self.key = table.keys[i]
 
         self.init_actuator_widget()
 
@@ -597,12 +1324,10 @@ class Actuator(QWidget):
         self.setPalette(palette)
 
         if (self.palette().color(QPalette.Foreground).name() == COLOR_ACTIVE.name()):
-            if (self.byte_str in qthreads.devices_inactive):
-                qthreads.devices_inactive.remove(self.byte_str)
+            qthreads.runtime.set_inactive(self.key, False)
         if (self.palette().color(QPalette.Foreground).name() == COLOR_INACTIVE.name()):
-            if (self.byte_str not in qthreads.devices_inactive):
-                qthreads.devices_inactive.append(self.byte_str)
-        print(qthreads.devices_inactive)
+            qthreads.runtime.set_inactive(self.key, True)
+        print(qthreads.runtime.devices_inactive)
 
     def init_actuator_widget(self):
         layout = QVBoxLayout()
@@ -633,7 +1358,7 @@ class Actuator(QWidget):
 
         self.slider = QSlider(Qt.Horizontal)
         self.slider.setMinimum(0)
-        self.slider.setMaximum(255)
+        self.slider.setMaximum(MAX_ACTUATOR_VAL)
         self.slider.setValue(INIT_ACTUATOR_VAL)
         self.slider.setTickPosition(QSlider.TicksBelow)
         self.slider.valueChanged.connect(self.slider_value_changed)
@@ -697,6 +1422,13 @@ class Bottom(QWidget):
         self.btn_run = QPushButton("Run")
         self.btn_run.clicked.connect(self.run)
 
+        self.btn_record = QPushButton("Record")
+        self.btn_record.setCheckable(True)
+        self.btn_record.toggled.connect(self.record)
+
+        self.btn_timeline = QPushButton(TIMELINE_TITLE)
+        self.btn_timeline.clicked.connect(self.timeline)
+
         self.btn_cancel = QPushButton("Cancel")
 
         btn_layout.addWidget(self.btn_clear)
@@ -704,6 +1436,8 @@ class Bottom(QWidget):
         btn_layout.addWidget(self.btn_connect)
         btn_layout.addWidget(self.btn_disconnect)
         btn_layout.addWidget(self.btn_run)
+        btn_layout.addWidget(self.btn_record)
+        btn_layout.addWidget(self.btn_timeline)
         btn_layout.addWidget(self.btn_cancel)
 
         self.layout.addWidget(self.log)
@@ -721,16 +1455,43 @@ class Bottom(QWidget):
     def connect(self):
         self.main.connect_teensy.emit()
 
+    # start/stop recording the session to disk
+    def record(self, checked):
+        time_stamp = datetime.datetime.now().strftime(qthreads.TIME_FORMAT)
+        if (checked):
+            path = qthreads.runtime.start_recording()
+            self.btn_record.setText("Stop Recording")
+            self.main.message("{} Recording session to {}".format(time_stamp, path))
+        else:
+            qthreads.runtime.stop_recording()
+            self.btn_record.setText("Record")
+            self.main.message("{} Recording stopped".format(time_stamp))
+
+    # open a recorded session in a timeline window
+    def timeline(self):
+        path = QFileDialog.getExistingDirectory(self, "Open Recorded Session", qthreads.config['record_dir'])
+        if (not path):
+            return
+        try:
+            window = TimelineWindow(path)
+        except (OSError, ValueError) as err:
+            time_stamp = datetime.datetime.now().strftime(qthreads.TIME_FORMAT)
+            self.main.message("{} Cannot open session {}: {}".format(time_stamp, path, err))
+            return
+        # top level window, kept alive by the main window
+        self.main.timeline_windows.append(window)
+        window.show()
+
     def run(self):
         self.btn_run.setEnabled(False)
         self.main.run_cbla.emit()
 
-        self.main.cblathread.dock_widget = QDockWidget(PLOT_TITLE)
-        self.main.cblathread.curves = {}
+        self.main.cbla_dock_widget = QDockWidget(PLOT_TITLE)
+        curves = {}
         if (len(qthreads.cbla_plots) > 0):
-            self.main.cblathread.plot_window = pg.GraphicsWindow()
-            self.main.cblathread.dock_widget.setWidget(self.main.cblathread.plot_window)
-            self.main.addDockWidget(Qt.RightDockWidgetArea, self.main.cblathread.dock_widget)
+            self.main.cbla_plot_window = pg.GraphicsWindow()
+            self.main.cbla_dock_widget.setWidget(self.main.cbla_plot_window)
+            self.main.addDockWidget(Qt.RightDockWidgetArea, self.main.cbla_dock_widget)
         for plot in qthreads.cbla_plots:
             title = None
             if (plot == qthreads.CBLAPlots.plot_expert_number):
@@ -739,6 +1500,10 @@ class Bottom(QWidget):
                 title = "Learning Progress"
             elif (plot == qthreads.CBLAPlots.plot_max_action_value):
                 title = "Max Action Value"
-            graph = self.main.cblathread.plot_window.addPlot(title=title)
+            graph = self.main.cbla_plot_window.addPlot(title=title)
             graph.enableAutoRange('xy', True)
-            self.main.cblathread.curves[plot] = graph.plot()
+            curves[plot] = graph.plot()
+
+        # curves are refreshed from qthreads.runtime.cbla_metrics by the GUI thread
+        self.main.cbla_plot_model = CBLAPlotModel(curves, qthreads.runtime.cbla_metrics, qthreads.config['render_fps'], self.main)
+        self.main.cbla_plot_model.start()
@@ -1,19 +1,34 @@
+import argparse
 import sys
 
-import qtgui
-from PyQt4.QtGui import *
-from PyQt4.QtCore import *
+from runtime import config
 
+# the GUI modules are imported in main() only: the acquisition and learner processes are
+# spawned, which imports this module again in every child, and they have to stay free of Qt
 def main():
+    parser = argparse.ArgumentParser(description='Visualize sensor/actuator values and CBLA progress.')
+    parser.add_argument('--attach', action='store_true', help='View a running daemon (daemon.py) instead of the Teensy nodes')
+    parser.add_argument('--host', help='Address of the daemon [{}]'.format(config['daemon_host']))
+    parser.add_argument('--port', type=int, help='Port of the daemon [{}]'.format(config['daemon_port']))
+    args, qt_args = parser.parse_known_args()
+    if (args.attach):
+        config['attach'] = True
+    if (args.host is not None):
+        config['daemon_host'] = args.host
+    if (args.port is not None):
+        config['daemon_port'] = args.port
+
+    import qtgui
+    from PyQt4.QtGui import QApplication
 
     app = None
     if (QApplication.instance()):
         app = QApplication.instance()
     else:
-        app = QApplication([])
+        app = QApplication(sys.argv[:1] + qt_args)
     win = qtgui.VisualApp()
 
-    win.showMaximized()  
+    win.showMaximized()
 
     win.bottom.btn_cancel.clicked.connect(app.quit)
 
@@ -23,4 +38,3 @@ def main():
 
 if __name__=='__main__':
     main()
-
@@ -1,80 +1,37 @@
 import collections
 import datetime
+import log_config
 import logging
 import numpy as np
 import pyqtgraph as pg
 import threading
+import time
 
-import simpleTeensyComs
-
-from enum import Enum
 from PyQt4.QtCore import *
 
-from cbla_learner import Learner
+from acquisition import (EVENT_CONNECTED, EVENT_DEVICES, EVENT_MESSAGE, EVENT_RATES, EVENT_STATUS,
+    STATUS_CONNECTION_FAIL, STATUS_CONNECTION_SUCCESS, TIME_FORMAT)
+from decimation import PlotHistory, history_levels
+from learning import CBLALoop
+from perf import stats as perf_stats
+from remote import EVENT_ACTUATORS, EVENT_CBLA, EVENT_CYCLE_STATS
+from runtime import MAX_CBLA_DATA_NUM, QUEUE_SIZE, CBLAPlots, Runtime, config
 
 STATUS_READY = "Ready"
 STATUS_RUN = "Running"
 STATUS_FINSH = "Finished"
-STATUS_CONNECTION_FAIL = "Disconnected"
-STATUS_CONNECTION_SUCCESS = "Connected"
-
-TIME_FORMAT = "%Y-%m-%d-%H:%M:%S"
 
-''' Enum object for types of plots of CBLA '''
-class CBLAPlots(Enum):
-    plot_expert_number = 1
-    plot_prediction_error = 2
-    plot_max_action_value = 3
 cbla_plots = [CBLAPlots.plot_expert_number, CBLAPlots.plot_prediction_error]
 
-config = {
-            'exploring_rate': 0.1,
-            'exploring_rate_range': (0.4, 0.01),
-            'exploring_reward_range': (-0.03, 0.004),
-            'adapt_exploring_rate': False,
-            'reward_smoothing': 1,
-            'split_threshold': 40,
-            'split_threshold_growth_rate': 1.0,
-            'split_lock_count_threshold': 1,
-            'split_quality_threshold': 0.0,
-            'split_quality_decay': 1.0,
-            'mean_error_threshold': 0.0,
-            'mean_error': 1.0,
-            'action_value': 0.0,
-            'learning_rate': 0.25,
-            'kga_delta': 10,
-            'kga_tau': 30,
-            'max_training_data_num': 500,
-            'cycle_time': 100,
-            'serial_number': 141960,
-            'com_port': 'COM7',
-            'com_serial': 22222
-        }
-
-queue_dict = {}
-QUEUE_SIZE = 100
-
-devices = None
-devices_inactive = []
-
-fade_commands = []
-
-lock = threading.RLock()
-
-MAX_CBLA_DATA_NUM = 50
-x = np.linspace(0.0, 50.0, MAX_CBLA_DATA_NUM)
-y1 = np.ones(MAX_CBLA_DATA_NUM, dtype=np.int)
-y2 = np.zeros(MAX_CBLA_DATA_NUM, dtype=np.float)
-y3 = np.zeros(MAX_CBLA_DATA_NUM, dtype=np.float)
-
-# thread debugging
-logging.basicConfig(level=logging.DEBUG, format='(%(threadName)-10s) %(message)s',)
-
-''' data object in queue '''
-class DataObject(object):
-    def __init__(self, byte_str, val):
-        self.byte_str = byte_str
-        self.val = val
+# sample store, device registry, recorder and learner metrics shared by the threads below
+runtime = Runtime(config)
+
+# min/max history of every sensor for the plots, fed by SensorPlotThread
+plot_history = PlotHistory(levels=history_levels(config['plot_span'], config['poll_period']))
+
+# per-subsystem loggers, records are formatted and written by a background listener
+log_config.setup_logging(config['log_levels'])
+plot_log = logging.getLogger(log_config.PLOT)
 
 # TO DOs
 ''' represent CBLA internal states '''
@@ -82,7 +39,9 @@ class DataObject(object):
 
 ''' 
     thread is started on connect to Teensy
-    continuously send commands and receive data from Teensy
+    owns the acquisition of all configured Teensy nodes (in this or a separate process,
+    or an attached daemon) and turns its events into signals; keeps the device registry
+    the other threads read
 '''
 class BackgroundThread(QThread):
     ''' define pyqt signals to communicate with other threads '''
@@ -90,11 +49,16 @@ class BackgroundThread(QThread):
     teensy_message = pyqtSignal(str)
     device_ready = pyqtSignal()
     disable_btn_connect = pyqtSignal()
+    # achieved samples/sec per (teensy serial number, byte string), object for the tuple keys
+    poll_rates = pyqtSignal(object)
+    # learner output of an attached daemon, see CBLAThread (object for the tuple keys)
+    update_actuator_vals = pyqtSignal(object)
+    cycle_stats = pyqtSignal(dict)
 
     def __init__(self, main):
         super(BackgroundThread, self).__init__()
 
-        self.teensyComms = None
+        runtime.create_acquisition()
 
         main.connect_teensy.connect(self.connect_to_teensy)
         main.disconnect_teensy.connect(self.disconnect_from_teensy)
@@ -104,190 +68,160 @@ class BackgroundThread(QThread):
 
     @pyqtSlot()
     def connect_to_teensy(self):
-        logging.debug("Connecting Teensy")
-        self.com_port = config['com_port']
-        self.com_serial = config['com_serial']
-        self.teensy_serial = config['serial_number']
-        if (self.teensyComms is None):
-            try:
-                self.teensyComms = simpleTeensyComs.initializeComms(self.com_port)
-                self.status.emit(STATUS_CONNECTION_SUCCESS)
-                time_stamp = datetime.datetime.now().strftime(TIME_FORMAT)
-                msg = "{} Connected to port {}".format(time_stamp, self.com_port)
-                self.teensy_message.emit(msg)
-                self.disable_btn_connect.emit()
-            except Exception as inst:
-                self.status.emit(STATUS_CONNECTION_FAIL)
-                time_stamp = datetime.datetime.now().strftime(TIME_FORMAT)
-                desc = "{} Failed to open port {}\n{} {}".format(time_stamp, self.com_port, 
-                    "".ljust(len(time_stamp)), inst.args[0])
-                self.teensy_message.emit(desc)
-        else:
-            if (self.teensyComms.is_open == False):
-                self.teensyComms.open()
-                self.status.emit(STATUS_CONNECTION_SUCCESS)
-                time_stamp = datetime.datetime.now().strftime(TIME_FORMAT)
-                msg = "{} Reopened port {}".format(time_stamp, self.com_port)
-                self.teensy_message.emit(msg)
-                self.disable_btn_connect.emit()
+        runtime.acquisition.connect()
 
     @pyqtSlot()
     def disconnect_from_teensy(self):
-        logging.debug("disconnect signal triggered")
-        if (self.teensyComms is not None and self.teensyComms.is_open):
-            self.teensyComms.close()
-            time_stamp = datetime.datetime.now().strftime(TIME_FORMAT)
-            msg = "{} Disconnected from port {}".format(time_stamp, self.com_port)
-            self.teensy_message.emit(msg)
-            self.status.emit(STATUS_CONNECTION_FAIL)
+        runtime.acquisition.disconnect()
 
     def run(self):
-        global queue_dict, devices, fade_commands
-
+        runtime.start_acquisition()
         while(True):
-            # sleep for 50 ms
-            self.msleep(50)
-            logging.debug("768")
-            # sleep 500 ms if teensy connection is not established
-            while(self.teensyComms is None):
-                self.msleep(500)
-
-            if (self.teensyComms.is_open and devices is None):
-                self.get_devices()
-
-            lock.acquire()
-            if (len(fade_commands) > 0):
-                for fade_command in fade_commands:
-                    self.fade_value(fade_command[0], fade_command[1])
-                fade_commands = []
-            lock.release()
-
-            if (self.teensyComms.is_open and devices is not None):
-                for i in range(0,len(devices)):
-                    dev = devices[i]
-                    port = dev.port
-                    if dev.type % 2 == 0:
-                        byte_str = dev.genByteStr()
-                        val = self.read_value(byte_str)
-                        data = DataObject(byte_str, val)
-                        lock.acquire()
-                        if (byte_str in queue_dict):
-                            if (len(queue_dict[byte_str]) == QUEUE_SIZE):
-                                queue_dict[byte_str].pop(0)
-                            queue_dict[byte_str].append(data)
-                        else:
-                            queue_dict[byte_str] = [data]
-                        logging.debug("current queue size: {}, appending value: {}".format(len(queue_dict[byte_str]), val))
-                        lock.release()
-
-    # read sensor/actuator value given peripheral byte string             
-    def read_value(self, peripheral_byte_str):
-        try:
-            logging.debug("reading {}".format(peripheral_byte_str))
-            result = simpleTeensyComs.Read(self.teensyComms, self.teensy_serial, self.com_serial, peripheral_byte_str, 0)
-            logging.debug("reading success with {}".format(result))
-            return result
-        except:
-            return
-
-    # set actuator value
-    def fade_value(self, peripheral_byte_str, val):
-        try:
-            logging.debug("fading {} with {}".format(peripheral_byte_str, val))
-            result = simpleTeensyComs.Fade(self.teensyComms, self.teensy_serial, self.com_serial, peripheral_byte_str, val, 0)
-            logging.debug("fading success with {}".format(result))
-            return result
-        except:
-            return
-
-    # get the device list
-    def get_devices(self):
-        global devices
-        devList = None
-        try:
-            devList = simpleTeensyComs.QueryIDs(self.teensyComms, self.teensy_serial, self.com_serial)
-        except ConnectionError as err:
-            time_stamp = datetime.datetime.now().strftime(TIME_FORMAT)
-            desc = "{} {}".format(time_stamp, err.args[0])
-            self.teensy_message.emit(desc)
-            self.teensyComms.close()
-        if (devList is not None):
-            lock.acquire()
-            devices = devList
-            lock.release()
+            event = runtime.acquisition.next_event(0.5)
+            if (event is not None):
+                self.dispatch(*event)
+
+    def dispatch(self, event, teensy_serial, payload):
+        if (event == EVENT_STATUS):
+            self.status.emit(payload)
+        elif (event == EVENT_MESSAGE):
+            self.teensy_message.emit(payload)
+        elif (event == EVENT_CONNECTED):
+            self.disable_btn_connect.emit()
+        elif (event == EVENT_DEVICES):
+            runtime.register_node(teensy_serial, payload)
             self.device_ready.emit()
+        elif (event == EVENT_RATES and len(payload) > 0):
+            self.poll_rates.emit(payload)
+        elif (event == EVENT_ACTUATORS):
+            self.update_actuator_vals.emit(payload)
+        elif (event == EVENT_CYCLE_STATS):
+            self.cycle_stats.emit(payload)
+        elif (event == EVENT_CBLA):
+            runtime.cbla_metrics.push(payload)
 
 # performing background plots (plotting sensor/actuator values)
 class SensorPlotThread(QThread):
     ''' define pyqt signals to communicate with other threads '''
-    add_sensor = pyqtSignal(int, int, int, int, int, int, int)
-    add_actuator = pyqtSignal(int, int, int, int, int, int)
+    # device table, table row, grid row, grid column (, column span)
+    add_sensor = pyqtSignal(object, int, int, int, int)
+    add_actuator = pyqtSignal(object, int, int, int)
+    # key of a sensor or actuator that is gone
+    remove_device = pyqtSignal(object)
     clear_sensor_actuator_list = pyqtSignal()
     update_tab_physical = pyqtSignal()
-    update_sensor_plot = pyqtSignal(bytes, int)
+    # all sensor values changed since the last tick, {key: value}; object since a dict
+    # signal crossing threads becomes a QVariantMap, which only takes string keys
+    update_sensor_plots = pyqtSignal(object)
     
     # main should be the main GUI
     def __init__(self, main):
         super(SensorPlotThread, self).__init__()
 
+        # key -> timestamp of the last value sent to the GUI
+        self.last_sent = {}
+
+        # keys of the devices in the physical tab
+        self.shown = set()
+        # (node, port) -> grid row of its actuators, its sensors are on the row below
+        self.port_rows = {}
+        # grid row -> next free column
+        self.next_col = {}
+
     def __del__(self):
         self.wait()
 
     # continuously update sensor/actuator list
     def run(self):
-        global devices, queue_dict
-
         while (True):
             # sleep for 100 ms
             self.msleep(100)
 
             # sleep 500 ms if device list is not ready
-            while(devices is None):
+            while(runtime.devices is None):
                 self.msleep(500)
 
-            for key, vals in queue_dict.items():
-                if (len(vals) > 0):
-                    data = queue_dict[key][len(vals) - 1]
-                    self.update_sensor_plot.emit(data.byte_str, data.val)
-                    logging.debug("Updating sensor value: {}".format(data.val))
+            sample_store = runtime.sample_store
+            index = runtime.device_table.index
+            changed = {}
+            start = time.perf_counter()
+            for key in sample_store.keys:
+                # readings of a device that is gone may still be in the store
+                if (key not in index):
+                    continue
+                times = sample_store.latest_times(key)
+                vals = sample_store.latest_n(key)
+                n = min(len(times), len(vals))
+                if (n == 0):
+                    continue
+                # readings since the last tick go into the plot history
+                times = times[len(times) - n:]
+                first = np.searchsorted(times, self.last_sent.get(key, 0.0), side='right')
+                if (first < n):
+                    plot_history.extend(key, times[first:], vals[len(vals) - n + first:])
+                    self.last_sent[key] = times[-1]
+                    changed[key] = int(vals[-1])
+            perf_stats.record('plot_history', start)
+
+            # one signal per tick instead of one per sensor
+            if (len(changed) > 0):
+                start = time.perf_counter()
+                self.update_sensor_plots.emit(changed)
+                perf_stats.record('emit_sensor_values', start)
+                plot_log.debug("Updating %d sensor values", len(changed))
 
     @pyqtSlot()        
     def update_sensor_actuator_list(self):
-        global devices
-        peripherals = {0:{}}
-
-        for i in range(0,len(devices)):
-            dev = devices[i]
-            port = dev.port
-            if (port not in peripherals[0].keys()):
-                peripherals[0][port] = {}
-            peripherals[0][port][dev.address] = dev.type
-
-        row = 0
-        col = 0
-        for n, ports in peripherals.items():
-            node = n
-            for p, a in ports.items():
-                port = p
-                num_sens = sum(t % 2 == 0 for t in a.values())
-                num_acts = len(a.values()) - num_sens
-                for addr, type in a.items():
-                    if (type % 2 != 0):
-                        self.add_actuator.emit(node, port, addr, type, row, col)
-                        col = col + 1
-
-                row = row + 1
-                col = 0
-                for addr, type in a.items():
-                    if (type % 2 == 0):
-                        self.add_sensor.emit(node, port, addr, type, row, col, int(num_acts/num_sens))
-                        col = col + 1
-                row = row + 1
-                col = 0
+        table = runtime.device_table
+        if (len(table) == 0):
+            # every node is gone, start over
+            self.clear_sensor_actuator_list.emit()
+            self.shown = set()
+            self.port_rows = {}
+            self.next_col = {}
+            return
+
+        # nodes report their devices one at a time and again when they change,
+        # only the devices that came or went are added or removed
+        for key in [key for key in self.shown if key not in table.index]:
+            self.remove_device.emit(key)
+            self.shown.discard(key)
+
+        # one row of actuators above one row of sensors per port of every node,
+        # ports seen for the first time get new rows at the bottom
+        for node in table.nodes:
+            for port, rows in table.port_rows(node):
+                row = self.port_rows.get((node, port))
+                if (row is None):
+                    row = 2 * len(self.port_rows)
+                    self.port_rows[(node, port)] = row
+                sensors = rows[table.is_sensor[rows]]
+                actuators = rows[~table.is_sensor[rows]]
+                for i in actuators:
+                    if (table.keys[i] not in self.shown):
+                        self.add_actuator.emit(table, int(i), row, self.take_col(row))
+                        self.shown.add(table.keys[i])
+                for i in sensors:
+                    if (table.keys[i] not in self.shown):
+                        self.add_sensor.emit(table, int(i), row + 1, self.take_col(row + 1), int(len(actuators)/len(sensors)))
+                        self.shown.add(table.keys[i])
         self.update_tab_physical.emit()
 
+    # next free column of a grid row
+    def take_col(self, row):
+        col = self.next_col.get(row, 0)
+        self.next_col[row] = col + 1
+        return col
+
+'''
+    runs the CBLA learning cycle (learning.CBLALoop) once Run is pressed
+    idle when attached to a daemon, whose learner output arrives through BackgroundThread
+'''
 class CBLAThread(QThread):
-    update_actuator_val = pyqtSignal(bytes, int)
+    # all actuator commands of a cycle, {key: value}, keyed by tuples like update_sensor_plots
+    update_actuator_vals = pyqtSignal(object)
+    # DeadlineScheduler statistics of the learning cycle
+    cycle_stats = pyqtSignal(dict)
 
     def __init__(self, main):
         super(CBLAThread, self).__init__()
@@ -298,103 +232,7 @@ class CBLAThread(QThread):
         self.wait()
 
     def run(self):
-        global devices, queue_dict, fade_commands, x, y1, y2, y3
-
-        # sleep 500 ms if device list is not ready
-        while(devices is None):
-            self.msleep(500)
-
-        numActs = 0
-        ActsList = []
-        numSens = 0
-        SensList = []
-        sensValues = []
-        actValues = []
-
-        for i in range(0,len(devices)):
-            logging.debug(devices[i].pr())
-            if devices[i].type%2 == 0:
-                numSens += 1
-                SensList.append(devices[i])
-                sensValues.append(0)
-            else:
-                numActs += 1
-                ActsList.append(devices[i])
-                actValues.append(0)
-
-        lrnr = Learner(tuple([0]*numSens),tuple([0]*numActs), **config)
-
-        iterNum = 0
-        expert_number = 1
-        while (True):
-            self.msleep(config['cycle_time'])
-            if iterNum > 0:
-                lock.acquire()
-                fade_commands = []
-                for i in range(0,len(ActsList)):
-                    if (ActsList[i].genByteStr() not in devices_inactive):
-                        fade_val = int(actValues[i])
-                    else:
-                        fade_val = 0
-                    self.update_actuator_val.emit(ActsList[i].genByteStr(), fade_val)
-                    fade_command = (ActsList[i].genByteStr(), fade_val)
-                    fade_commands.append(fade_command)
-                    logging.debug("Command Actuator {} to Value {}".format(i, int(actValues[i])))
-       
-                lock.release()
-
-            #Sense:  Read all the sensors
-            lock.acquire()
-            for i in range(0,len(SensList)):
-                sens_byte_str = SensList[i].genByteStr()
-
-                if (len(queue_dict[sens_byte_str]) > 0):
-                    data = queue_dict[sens_byte_str][len(queue_dict[sens_byte_str]) - 1]
-                    sensValues[i] = data.val
-                    logging.debug("reading sensor {} value: {}".format(i, data.val))
-            lock.release()
-
-            #Learn:
-            lrnr.learn(tuple(self.normalize_sens(sensValues,SensList)),tuple(actValues))
-
-            #Select Next action to perform
-            actValues = lrnr.select_action()
-
-            numExperts = lrnr.expert.get_num_experts()
-
-            reduced_mean_error = lrnr.expert.rewards_history
-
-            if numExperts > 1:
-                expert_number = expert_number + 1
-                logging.debug("------------------------------")
-                logging.debug("increased expert number")
-
-            if (self.curves is not None and CBLAPlots.plot_expert_number in self.curves):
-                y1 = np.append(y1[1:MAX_CBLA_DATA_NUM], expert_number)
-                self.curves[CBLAPlots.plot_expert_number].setData(x, y1)
-
-            if (self.curves is not None and CBLAPlots.plot_prediction_error in self.curves):
-                if (reduced_mean_error is not None):
-                    y2 = np.append(y2[1:MAX_CBLA_DATA_NUM], reduced_mean_error)
-                self.curves[CBLAPlots.plot_prediction_error].setData(x, y2)
-
-            if (self.curves is not None and CBLAPlots.plot_max_action_value in self.curves):
-                max_action_val = lrnr.expert.get_largest_action_value()
-                if (max_action_val is not None):
-                    y3 = np.append(y3[1:MAX_CBLA_DATA_NUM], max_action_val)
-                self.curves[CBLAPlots.plot_max_action_value].setData(x, y3)
-
-            #Report the action value and the number of experts currently in the system
-            #print('Current max action value is ', lrnr.expert.get_largest_action_value())
-            #print('Current number of experts is', lrnr.expert.get_num_experts())
-
-            iterNum += 1
-
-    def normalize_sens(self, sensValues,SensList):
-        normValues = []
-        for i in range(0,len(SensList)):
-            #for now, scale everything the same, this function can be extended to scale
-            #separately based on the device type in the sensors list
-            normValues.append(sensValues[i]/1023)
-
-        return normValues
\ No newline at end of file
+        if (config['attach']):
+            return
+        loop = CBLALoop(runtime, self.update_actuator_vals.emit, self.cycle_stats.emit)
+        loop.run()
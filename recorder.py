@@ -0,0 +1,385 @@
+import datetime
+import json
+import numpy as np
+import os
+import queue
+import threading
+import time
+
+CHUNK_ROWS = 4096
+# rows summarized by one block of the time index
+INDEX_ROWS = 1024
+FLUSH_INTERVAL = 1.0
+META_FILE = "meta.json"
+SESSION_FORMAT = "%Y-%m-%d-%H%M%S"
+
+# columns of every recorded table, device ids index into meta['devices']
+TABLES = {
+    'sensors': [('time', 'f8'), ('device', 'i4'), ('value', 'f4')],
+    'actuators': [('time', 'f8'), ('device', 'i4'), ('value', 'f4')],
+    'cbla': [('time', 'f8'), ('expert_number', 'f8'), ('prediction_error', 'f8'), ('max_action_value', 'f8')],
+}
+
+# file holding one column of a table
+def column_path(path, table, column):
+    return os.path.join(path, "{}.{}.bin".format(table, column))
+
+# file holding the time index of a table
+def index_path(path, table):
+    return os.path.join(path, "{}.index.bin".format(table))
+
+# columns summarized by min/max in the time index
+def value_columns(columns):
+    return [(column, dtype) for column, dtype in columns if column not in ('time', 'device')]
+
+# one record per block of INDEX_ROWS rows and device (-1 in tables without devices):
+# rows [row, row + rows) of the table hold count readings of the device between
+# time_min and time_max, with every value column between its _min and _max
+def index_dtype(columns):
+    fields = [('row', 'i8'), ('rows', 'i4'), ('device', 'i4'), ('count', 'i4'), ('time_min', 'f8'), ('time_max', 'f8')]
+    for column, _ in value_columns(columns):
+        fields += [(column + '_min', 'f8'), (column + '_max', 'f8')]
+    return np.dtype(fields)
+
+# number of complete rows of a recorded table
+def table_rows(path, table, columns):
+    rows = None
+    for column, dtype in columns:
+        file_path = column_path(path, table, column)
+        size = os.path.getsize(file_path) // np.dtype(dtype).itemsize if os.path.exists(file_path) else 0
+        rows = size if rows is None else min(rows, size)
+    return rows or 0
+
+# json friendly form of a (teensy serial number, byte string) device key
+def encode_key(key):
+    return [key[0], key[1].hex()]
+
+def decode_key(item):
+    return (item[0], bytes.fromhex(item[1]))
+
+'''
+    append-only column buffer of one table
+    rows are collected into preallocated chunks; full chunks are put on the writer's queue
+    as (table name, chunk) while the lock is held, so a chunk is always queued before the
+    rows that follow it can be taken (see SessionRecorder.flush)
+'''
+class ColumnTable(object):
+    def __init__(self, name, columns, out, chunk_rows=CHUNK_ROWS):
+        self.name = name
+        self.columns = columns
+        self.out = out
+        self.chunk_rows = chunk_rows
+        self.lock = threading.Lock()
+        self.new_chunk()
+
+    def new_chunk(self):
+        self.chunk = {name: np.empty(self.chunk_rows, dtype=dtype) for name, dtype in self.columns}
+        self.fill = 0
+
+    # append rows given as {column: scalar or array}
+    def append(self, num, cols):
+        with self.lock:
+            done = 0
+            while (done < num):
+                n = min(num - done, self.chunk_rows - self.fill)
+                for name, _ in self.columns:
+                    val = cols[name]
+                    if (np.ndim(val) == 0):
+                        self.chunk[name][self.fill:self.fill + n] = val
+                    else:
+                        self.chunk[name][self.fill:self.fill + n] = val[done:done + n]
+                self.fill += n
+                done += n
+                if (self.fill == self.chunk_rows):
+                    self.out.put((self.name, self.chunk))
+                    self.new_chunk()
+
+    # take the partially filled chunk, None if empty; the caller holds self.lock
+    def take(self):
+        if (self.fill == 0):
+            return None
+        chunk = {name: arr[:self.fill] for name, arr in self.chunk.items()}
+        self.new_chunk()
+        return chunk
+
+'''
+    builds the time index of one table from its rows in write order
+    rows are summarized in blocks of block_rows; the rows of an unfinished block wait
+    for the next chunk and are left to the reader to scan
+'''
+class TimeIndexer(object):
+    def __init__(self, columns, first_row=0, block_rows=INDEX_ROWS):
+        self.columns = columns
+        self.values = [column for column, _ in value_columns(columns)]
+        self.has_device = any(column == 'device' for column, _ in columns)
+        self.dtype = index_dtype(columns)
+        self.block_rows = block_rows
+        # first row of the pending rows
+        self.row = first_row
+        self.pending = {column: np.zeros(0, dtype=dtype) for column, dtype in columns}
+
+    # add rows given as {column: array}, returns the index records of the completed blocks
+    def add(self, chunk):
+        cols = {column: np.concatenate((self.pending[column], chunk[column])) for column, _ in self.columns}
+        n = len(cols['time'])
+        done = (n // self.block_rows) * self.block_rows
+        records = [self.block(self.row + start, {column: arr[start:start + self.block_rows] for column, arr in cols.items()})
+            for start in range(0, done, self.block_rows)]
+        self.pending = {column: arr[done:].copy() for column, arr in cols.items()}
+        self.row += done
+        if (len(records) == 0):
+            return np.zeros(0, dtype=self.dtype)
+        return np.concatenate(records)
+
+    # records of one block, one per device in it
+    def block(self, row, cols):
+        rows = len(cols['time'])
+        if (self.has_device):
+            order = np.argsort(cols['device'], kind='stable')
+            devices = cols['device'][order]
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(devices)) + 1))
+        else:
+            order = np.arange(rows)
+            devices = np.full(1, -1, dtype=np.int32)
+            starts = np.zeros(1, dtype=np.intp)
+
+        records = np.zeros(len(starts), dtype=self.dtype)
+        records['row'] = row
+        records['rows'] = rows
+        records['device'] = devices[starts]
+        records['count'] = np.diff(np.append(starts, rows))
+        times = cols['time'][order]
+        records['time_min'] = np.minimum.reduceat(times, starts)
+        records['time_max'] = np.maximum.reduceat(times, starts)
+        for column in self.values:
+            vals = cols[column][order].astype(np.float64)
+            records[column + '_min'] = np.minimum.reduceat(vals, starts)
+            records[column + '_max'] = np.maximum.reduceat(vals, starts)
+        return records
+
+# write the time index of a session recorded without one
+def index_session(path, chunk_rows=CHUNK_ROWS):
+    reader = SessionReader(path)
+    for table, columns in reader.meta['tables'].items():
+        indexer = TimeIndexer(columns)
+        cols = reader.table(table)
+        with open(index_path(path, table), 'wb') as f:
+            for start in range(0, reader.num_rows(table), chunk_rows):
+                indexer.add({column: np.asarray(arr[start:start + chunk_rows]) for column, arr in cols.items()}).tofile(f)
+
+'''
+    records a session to append-only columnar files
+    readings, actuator commands and learner metrics are buffered in chunks
+    and written by a background thread; files are raw arrays readable with np.memmap,
+    every table also gets a time index (see TimeIndexer) written along with its rows
+'''
+class SessionRecorder(threading.Thread):
+    def __init__(self, root, name=None, chunk_rows=CHUNK_ROWS, flush_interval=FLUSH_INTERVAL):
+        super(SessionRecorder, self).__init__(name="SessionRecorder")
+        self.daemon = True
+
+        if (name is None):
+            name = datetime.datetime.now().strftime(SESSION_FORMAT)
+        self.path = os.path.join(root, name)
+        os.makedirs(self.path, exist_ok=True)
+
+        self.flush_interval = flush_interval
+        self.chunks = queue.Queue()
+        self.tables = {table: ColumnTable(table, columns, self.chunks, chunk_rows) for table, columns in TABLES.items()}
+        self.running = True
+
+        # device key -> id
+        self.device_ids = {}
+        self.device_keys = []
+        self.device_lock = threading.Lock()
+        self.meta_dirty = True
+        self.started = time.time()
+
+        self.files = {}
+        self.indexers = {}
+        for table, columns in TABLES.items():
+            # a resumed session is indexed from its first new row
+            self.indexers[table] = TimeIndexer(columns, table_rows(self.path, table, columns))
+            for column, _ in columns:
+                self.files[(table, column)] = open(column_path(self.path, table, column), 'ab')
+            self.files[(table, None)] = open(index_path(self.path, table), 'ab')
+
+    # id of a device key, registering it on first use
+    def device_id(self, key):
+        dev_id = self.device_ids.get(key)
+        if (dev_id is None):
+            with self.device_lock:
+                dev_id = self.device_ids.get(key)
+                if (dev_id is None):
+                    dev_id = len(self.device_keys)
+                    self.device_keys.append(key)
+                    self.device_ids[key] = dev_id
+                    self.meta_dirty = True
+        return dev_id
+
+    def append(self, table, num, cols):
+        self.tables[table].append(num, cols)
+
+    # record one sweep of readings
+    def record_sensors(self, keys, vals, timestamp=None):
+        if (len(keys) == 0):
+            return
+        if (timestamp is None):
+            timestamp = time.time()
+        ids = np.fromiter((self.device_id(key) for key in keys), dtype=np.int32, count=len(keys))
+        self.append('sensors', len(keys), {'time': timestamp, 'device': ids, 'value': np.asarray(vals)})
+
+    # record the actuator commands of one cycle
+    def record_actuators(self, keys, vals, timestamp=None):
+        if (len(keys) == 0):
+            return
+        if (timestamp is None):
+            timestamp = time.time()
+        ids = np.fromiter((self.device_id(key) for key in keys), dtype=np.int32, count=len(keys))
+        self.append('actuators', len(keys), {'time': timestamp, 'device': ids, 'value': np.asarray(vals)})
+
+    # record the learner metrics of one cycle
+    def record_cbla(self, expert_number, prediction_error, max_action_value, timestamp=None):
+        if (timestamp is None):
+            timestamp = time.time()
+        self.append('cbla', 1, {'time': timestamp, 'expert_number': expert_number,
+            'prediction_error': prediction_error, 'max_action_value': max_action_value})
+
+    def run(self):
+        while (self.running):
+            try:
+                table, chunk = self.chunks.get(timeout=self.flush_interval)
+                self.write_chunk(table, chunk)
+            except queue.Empty:
+                self.flush()
+        self.flush()
+        for f in self.files.values():
+            f.close()
+
+    def write_chunk(self, table, chunk):
+        for column, arr in chunk.items():
+            arr.tofile(self.files[(table, column)])
+        self.indexers[table].add(chunk).tofile(self.files[(table, None)])
+
+    # write queued and partially filled chunks and the metadata
+    # a table's partial chunk is taken together with the chunks queued before it, under the
+    # lock its producers queue full chunks with, so its rows reach the files in time order;
+    # the files are written after the lock is released
+    def flush(self):
+        for table in self.tables.values():
+            with table.lock:
+                chunks = []
+                while (not self.chunks.empty()):
+                    chunks.append(self.chunks.get_nowait())
+                partial = table.take()
+            if (partial is not None):
+                chunks.append((table.name, partial))
+            for name, chunk in chunks:
+                self.write_chunk(name, chunk)
+        for f in self.files.values():
+            f.flush()
+        if (self.meta_dirty):
+            self.write_meta()
+
+    def write_meta(self):
+        with self.device_lock:
+            meta = {
+                'started': self.started,
+                'tables': {table: columns for table, columns in TABLES.items()},
+                'devices': [encode_key(key) for key in self.device_keys],
+            }
+            self.meta_dirty = False
+        tmp = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+    # stop recording after writing everything buffered
+    def close(self, timeout=None):
+        self.running = False
+        self.join(timeout)
+
+'''
+    read access to a recorded session
+    columns are memory-mapped, nothing is loaded until it is indexed
+'''
+class SessionReader(object):
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.started = self.meta['started']
+        self.device_keys = [decode_key(item) for item in self.meta['devices']]
+        self.device_ids = {key: i for i, key in enumerate(self.device_keys)}
+
+    # number of complete rows of a table
+    def num_rows(self, table):
+        return table_rows(self.path, table, self.meta['tables'][table])
+
+    def has_index(self):
+        return all(os.path.exists(index_path(self.path, table)) for table in self.meta['tables'])
+
+    # time index records of a table (see index_dtype), memory-mapped
+    def index(self, table):
+        dtype = index_dtype(self.meta['tables'][table])
+        path = index_path(self.path, table)
+        num = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+        if (num == 0):
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(num,))
+
+    # index records of the blocks overlapping [t0, t1], only those of one device if given
+    def index_range(self, table, t0, t1, key=None):
+        index = self.index(table)
+        mask = (index['time_max'] >= t0) & (index['time_min'] <= t1)
+        if (key is not None):
+            mask &= (index['device'] == self.device_ids.get(key, -2))
+        return index[mask]
+
+    # first row not covered by the time index, rows from here on are scanned
+    def indexed_rows(self, table):
+        index = self.index(table)
+        return int(index['row'][-1] + index['rows'][-1]) if (len(index) > 0) else 0
+
+    # {column: array} of the rows between t0 and t1 (of one device if given)
+    # only the indexed blocks overlapping the range and the unindexed tail are read
+    def window(self, table, t0, t1, key=None):
+        cols = self.table(table)
+        blocks = self.index_range(table, t0, t1, key)
+        tail = self.indexed_rows(table)
+        parts = []
+        if (len(blocks) > 0):
+            parts.append((int(blocks['row'].min()), int((blocks['row'] + blocks['rows']).max())))
+        parts.append((tail, self.num_rows(table)))
+
+        window = {}
+        for column, arr in cols.items():
+            window[column] = np.concatenate([np.asarray(arr[start:end]) for start, end in parts])
+        mask = (window['time'] >= t0) & (window['time'] <= t1)
+        if (key is not None):
+            mask &= (window['device'] == self.device_ids.get(key, -2))
+        return {column: arr[mask] for column, arr in window.items()}
+
+    # time range of a table, (started, started) if it is empty
+    def time_range(self, table):
+        times = self.table(table)['time']
+        if (len(times) == 0):
+            return self.started, self.started
+        return float(times[0]), float(times[-1])
+
+    # {column: memmap} of a table
+    def table(self, table):
+        rows = self.num_rows(table)
+        cols = {}
+        for column, dtype in self.meta['tables'][table]:
+            if (rows == 0):
+                cols[column] = np.zeros(0, dtype=dtype)
+            else:
+                cols[column] = np.memmap(column_path(self.path, table, column), dtype=dtype, mode='r', shape=(rows,))
+        return cols
+
+    # times and values of one device in a sensors/actuators table
+    def device_series(self, table, key):
+        cols = self.table(table)
+        mask = cols['device'] == self.device_ids[key]
+        return cols['time'][mask], cols['value'][mask]
@@ -0,0 +1,321 @@
+import ipaddress
+import log_config
+import logging
+import numpy as np
+import os
+import queue
+import secrets
+import socket
+import threading
+import time
+
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from acquisition import (CMD_CONNECT, CMD_DISCONNECT, CMD_RECORD_START, CMD_RECORD_STOP, EVENT_DEVICES,
+    EVENT_MESSAGE, EVENT_STATUS, STATUS_CONNECTION_FAIL, RemoteRecorder, device_from_record, device_record, time_stamp)
+from device_registry import DeviceTable
+from sample_store import SampleStoreGroup
+
+# daemon to client events, besides the acquisition events
+# new readings as {key: (times, values)}, actuator commands {key: value},
+# DeadlineScheduler statistics and learner metrics of one cycle
+EVENT_SAMPLES = 'samples'
+EVENT_ACTUATORS = 'actuators'
+EVENT_CYCLE_STATS = 'cycle_stats'
+EVENT_CBLA = 'cbla'
+
+# client to daemon commands, besides the acquisition commands
+CMD_SET_INACTIVE = 'set_inactive'
+
+# seconds between two sample batches sent to a client
+STREAM_INTERVAL = 0.05
+# events kept for a client that does not keep up, older ones are dropped
+CLIENT_QUEUE_SIZE = 1000
+
+remote_log = logging.getLogger(log_config.DAEMON)
+
+def daemon_address(config):
+    return (config['daemon_host'], int(config['daemon_port']))
+
+# environment variable that sets the authkey instead of config['daemon_authkey']
+AUTHKEY_ENV = 'CBLA_DAEMON_AUTHKEY'
+
+# authkey set explicitly in the config or the environment, None if neither is
+def explicit_authkey(config):
+    key = config['daemon_authkey'] or os.environ.get(AUTHKEY_ENV, '')
+    return str(key).encode() if key else None
+
+def key_file(config):
+    return os.path.expanduser(config['daemon_key_file'])
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+# authkey of a client: the explicit one, else the key the daemon wrote to the key file
+def daemon_authkey(config):
+    key = explicit_authkey(config)
+    if (key is None):
+        try:
+            with open(key_file(config), 'rb') as f:
+                key = f.read().strip()
+        except OSError:
+            raise ValueError("No daemon authkey, set {} or start the daemon on this host first".format(AUTHKEY_ENV))
+    return key
+
+# authkey of the daemon
+# clients send pickled commands, so without an explicit key the daemon only listens on
+# loopback, with a random key written to the key file that only the user can read
+def server_authkey(config):
+    key = explicit_authkey(config)
+    if (key is not None):
+        return key
+    if (not is_loopback(config['daemon_host'])):
+        raise ValueError("Listening on {} needs an authkey, set {}".format(config['daemon_host'], AUTHKEY_ENV))
+    key = secrets.token_hex(32).encode()
+    path = key_file(config)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    # O_CREAT keeps the mode of an existing file
+    os.chmod(path, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+'''
+    one attached client of a DaemonServer
+    a sender thread streams the queued events and every new reading, a receiver
+    thread hands the client's commands to the server
+'''
+class ClientSession(object):
+    def __init__(self, server, conn):
+        self.server = server
+        self.conn = conn
+        self.outbox = queue.Queue(CLIENT_QUEUE_SIZE)
+        self.running = True
+        # key -> timestamp of the last reading sent
+        self.last_sent = {}
+
+    def start(self):
+        for target, name in ((self.send_loop, "ClientSender"), (self.receive_loop, "ClientReceiver")):
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+
+    def post(self, event):
+        try:
+            self.outbox.put_nowait(event)
+        except queue.Full:
+            pass
+
+    # readings recorded since the last batch, {key: (times, values)}
+    def new_samples(self):
+        store = self.server.runtime.sample_store
+        samples = {}
+        for key in store.keys:
+            times = np.array(store.latest_times(key))
+            vals = np.array(store.latest_n(key))
+            n = min(len(times), len(vals))
+            first = np.searchsorted(times[len(times) - n:], self.last_sent.get(key, 0.0), side='right')
+            if (first < n):
+                samples[key] = (times[len(times) - n + first:], vals[len(vals) - n + first:])
+                self.last_sent[key] = times[-1]
+        return samples
+
+    def send_loop(self):
+        try:
+            while (self.running):
+                time.sleep(STREAM_INTERVAL)
+                while (not self.outbox.empty()):
+                    self.conn.send(self.outbox.get_nowait())
+                samples = self.new_samples()
+                if (len(samples) > 0):
+                    self.conn.send((EVENT_SAMPLES, None, samples))
+        except (OSError, EOFError):
+            pass
+        self.close()
+
+    def receive_loop(self):
+        try:
+            while (self.running):
+                cmd, args = self.conn.recv()
+                self.server.handle(cmd, args)
+        except (OSError, EOFError):
+            pass
+        self.close()
+
+    def close(self):
+        if (self.running):
+            self.running = False
+            self.conn.close()
+            self.server.remove(self)
+
+'''
+    lets GUI clients attach to a headless daemon over a local socket
+    every client gets the device lists on attach, then the acquisition and learner
+    events and all new readings; clients may connect/disconnect the nodes,
+    start/stop recording and (de)activate actuators
+'''
+class DaemonServer(object):
+    def __init__(self, runtime, address, authkey):
+        self.runtime = runtime
+        self.listener = Listener(address, authkey=authkey)
+        self.clients = []
+        self.running = True
+
+    def start(self):
+        thread = threading.Thread(target=self.accept_loop, name="DaemonServer")
+        thread.daemon = True
+        thread.start()
+
+    def accept_loop(self):
+        while (self.running):
+            try:
+                conn = self.listener.accept()
+            except (AuthenticationError, EOFError):
+                # a client without the key is turned away before anything it sends is unpickled
+                remote_log.warning("Rejected a client that failed to authenticate")
+                continue
+            except OSError:
+                if (not self.running):
+                    return
+                continue
+            session = ClientSession(self, conn)
+            devices = self.runtime.devices
+            if (devices is not None):
+                for teensy_serial, devList in devices.items():
+                    session.post((EVENT_DEVICES, teensy_serial, [device_record(dev) for dev in devList]))
+            # copy-on-write so broadcast never iterates a changing list
+            self.clients = self.clients + [session]
+            session.start()
+            remote_log.info("Client attached from %s", self.listener.last_accepted)
+
+    def remove(self, session):
+        self.clients = [client for client in self.clients if client is not session]
+        remote_log.info("Client detached")
+
+    def broadcast(self, event):
+        if (event[0] == EVENT_DEVICES):
+            event = (event[0], event[1], [device_record(dev) for dev in event[2]])
+        for client in self.clients:
+            client.post(event)
+
+    # command of a client
+    def handle(self, cmd, args):
+        runtime = self.runtime
+        if (cmd == CMD_CONNECT):
+            runtime.acquisition.connect()
+        elif (cmd == CMD_DISCONNECT):
+            runtime.acquisition.disconnect()
+        elif (cmd == CMD_RECORD_START):
+            # recorded under the daemon's record_dir with the client's session name
+            runtime.start_recording(args[1])
+        elif (cmd == CMD_RECORD_STOP):
+            runtime.stop_recording()
+        elif (cmd == CMD_SET_INACTIVE):
+            runtime.set_inactive(*args)
+
+    def close(self):
+        self.running = False
+        self.listener.close()
+        for client in self.clients:
+            client.close()
+
+'''
+    acquisition backend of a GUI attached to a daemon, same interface as Acquisition
+    readings streamed by the daemon are appended to a local store with their original
+    timestamps; the daemon's learner drives the actuators, so there are no fade channels
+'''
+class DaemonClient(object):
+    def __init__(self, config, capacity):
+        self.config = config
+        self.address = daemon_address(config)
+        self.store = SampleStoreGroup(capacity)
+        self.conn = None
+        self.send_lock = threading.Lock()
+        self.pending = []
+        self.recorder = None
+        # teensy serial number -> DeviceTable of the node's last device list
+        self.node_tables = {}
+
+    def start(self):
+        try:
+            self.conn = Client(self.address, authkey=daemon_authkey(self.config))
+        except (OSError, EOFError, ValueError, AuthenticationError) as err:
+            self.fail("{} Failed to attach to daemon at {}:{} {}".format(time_stamp(), self.address[0], self.address[1], err))
+            return
+        self.pending.append((EVENT_MESSAGE, None, "{} Attached to daemon at {}:{}".format(
+            time_stamp(), self.address[0], self.address[1])))
+
+    def fail(self, msg):
+        self.conn = None
+        self.pending.append((EVENT_STATUS, None, STATUS_CONNECTION_FAIL))
+        self.pending.append((EVENT_MESSAGE, None, msg))
+
+    # send a command, also the queue interface RemoteRecorder expects
+    def put(self, item):
+        if (self.conn is None):
+            return
+        with self.send_lock:
+            try:
+                self.conn.send(item)
+            except OSError:
+                pass
+
+    def connect(self):
+        self.put((CMD_CONNECT, None))
+
+    def disconnect(self):
+        self.put((CMD_DISCONNECT, None))
+
+    def fade_channel(self, teensy_serial):
+        return None
+
+    def set_inactive(self, key, inactive):
+        self.put((CMD_SET_INACTIVE, (key, inactive)))
+
+    def next_event(self, timeout):
+        if (len(self.pending) > 0):
+            return self.pending.pop(0)
+        if (self.conn is None):
+            time.sleep(timeout)
+            return None
+        try:
+            if (not self.conn.poll(timeout)):
+                return None
+            event, teensy_serial, payload = self.conn.recv()
+        except (OSError, EOFError):
+            self.fail("{} Lost the connection to the daemon".format(time_stamp()))
+            return None
+
+        if (event == EVENT_SAMPLES):
+            for key, (times, vals) in payload.items():
+                for timestamp, val in zip(times, vals):
+                    self.store.append(key, val, timestamp)
+            return None
+        if (event == EVENT_DEVICES):
+            payload = [device_from_record(record) for record in payload]
+            table = DeviceTable([(teensy_serial, payload)])
+            previous = self.node_tables.get(teensy_serial)
+            if (previous is not None):
+                self.store.unregister(table.changes(previous)[1])
+            self.node_tables[teensy_serial] = table
+            self.store.register(table.sensor_keys)
+        return (event, teensy_serial, payload)
+
+    # the daemon records the session, the path is on the daemon's host
+    def start_recording(self, root, name=None):
+        self.recorder = RemoteRecorder(self, root, name)
+        return self.recorder
+
+    def stop_recording(self):
+        if (self.recorder is not None):
+            self.recorder.close()
+            self.recorder = None
+
+    def close(self):
+        if (self.conn is not None):
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,125 @@
+import numpy as np
+import time
+
+from recorder import SessionReader
+
+REPLAY_PORT_PREFIX = "replay:"
+
+''' device entry with the interface of the simpleTeensyComs device objects '''
+class ReplayDevice(object):
+    def __init__(self, address, type, port):
+        self.address = address
+        self.type = type
+        self.port = port
+
+    def genByteStr(self):
+        return self.address.to_bytes(1,byteorder='big') + self.type.to_bytes(1,byteorder='big') + \
+            self.port.to_bytes(1,byteorder='big')
+
+    def pr(self):
+        return "address: {} type: {} port: {} (replay)".format(self.address, self.type, self.port)
+
+# device entry for a recorded (teensy serial number, byte string) key
+def device_from_key(key):
+    byte_str = key[1]
+    return ReplayDevice(byte_str[0], byte_str[1], byte_str[2])
+
+'''
+    replayed connection of one node, holds the playback clock
+    speed > 0 plays back in recorded time scaled by speed,
+    speed == 0 advances one recorded sweep per bulk read (max speed)
+'''
+class ReplayConnection(object):
+    def __init__(self, source, teensy_serial):
+        self.source = source
+        self.teensy_serial = teensy_serial
+        self.is_open = True
+
+        self.series = {}
+        for key in source.sensor_keys(teensy_serial):
+            self.series[key[1]] = source.reader.device_series('sensors', key)
+
+        sweep_times = [times for times, _ in self.series.values()]
+        self.sweep_times = np.unique(np.concatenate(sweep_times)) if (len(sweep_times) > 0) else np.zeros(1)
+        self.sweep_index = 0
+        self.wall_start = time.time()
+        self.commands = {}
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    # recorded time currently being played back
+    def now(self):
+        if (self.source.speed > 0):
+            return self.sweep_times[0] + (time.time() - self.wall_start) * self.source.speed
+        return self.sweep_times[min(self.sweep_index, len(self.sweep_times) - 1)]
+
+    # True once the recording is played back entirely
+    def finished(self):
+        if (self.source.speed > 0):
+            return self.now() > self.sweep_times[-1]
+        return self.sweep_index >= len(self.sweep_times)
+
+    def advance(self):
+        if (self.source.speed == 0):
+            self.sweep_index += 1
+            if (self.source.loop and self.finished()):
+                self.sweep_index = 0
+        elif (self.source.loop and self.finished()):
+            self.wall_start = time.time()
+
+    # recorded value of a sensor at the playback time
+    def value(self, byte_str):
+        series = self.series.get(byte_str)
+        if (series is None):
+            return None
+        times, vals = series
+        i = np.searchsorted(times, self.now(), side='right') - 1
+        if (i < 0):
+            return None
+        return int(vals[i])
+
+'''
+    stands in for the simpleTeensyComs module and plays back a recorded session
+    nodes use "replay:<serial number>" as their port
+'''
+class ReplaySource(object):
+    def __init__(self, path, speed=1.0, loop=False):
+        self.reader = SessionReader(path)
+        self.speed = float(speed)
+        self.loop = loop
+        self.max_speed = (self.speed == 0)
+
+        actuator_ids = np.unique(np.asarray(self.reader.table('actuators')['device']))
+        self.actuator_keys = set(self.reader.device_keys[i] for i in actuator_ids)
+
+    # (teensy serial number, port) of every recorded node
+    def get_nodes(self):
+        serials = sorted(set(key[0] for key in self.reader.device_keys))
+        return [(sn, REPLAY_PORT_PREFIX + str(sn)) for sn in serials]
+
+    def sensor_keys(self, teensy_serial):
+        return [key for key in self.reader.device_keys
+            if key[0] == teensy_serial and key not in self.actuator_keys]
+
+    def initializeComms(self, port):
+        return ReplayConnection(self, int(port[len(REPLAY_PORT_PREFIX):]))
+
+    def QueryIDs(self, comms, teensy_serial, com_serial):
+        return [device_from_key(key) for key in self.reader.device_keys if key[0] == teensy_serial]
+
+    def Read(self, comms, teensy_serial, com_serial, byte_str, num):
+        return comms.value(byte_str)
+
+    def ReadMany(self, comms, teensy_serial, com_serial, byte_strs, num):
+        vals = [comms.value(byte_str) for byte_str in byte_strs]
+        comms.advance()
+        return vals
+
+    # commands are kept so the replayed learner output can be inspected
+    def Fade(self, comms, teensy_serial, com_serial, byte_str, val, num):
+        comms.commands[byte_str] = val
+        return val
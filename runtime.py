@@ -0,0 +1,194 @@
+import threading
+import time
+
+from enum import Enum
+
+from acquisition import Acquisition, AcquisitionProcess
+from device_registry import DeviceTable
+from recorder import SessionRecorder
+from remote import DaemonClient
+from sample_store import MetricsRing, SampleStoreGroup
+
+''' Enum object for types of plots of CBLA '''
+class CBLAPlots(Enum):
+    plot_expert_number = 1
+    plot_prediction_error = 2
+    plot_max_action_value = 3
+
+config = {
+            'exploring_rate': 0.1,
+            'exploring_rate_range': (0.4, 0.01),
+            'exploring_reward_range': (-0.03, 0.004),
+            'adapt_exploring_rate': False,
+            'reward_smoothing': 1,
+            'split_threshold': 40,
+            'split_threshold_growth_rate': 1.0,
+            'split_lock_count_threshold': 1,
+            'split_quality_threshold': 0.0,
+            'split_quality_decay': 1.0,
+            'mean_error_threshold': 0.0,
+            'mean_error': 1.0,
+            'action_value': 0.0,
+            'learning_rate': 0.25,
+            'kga_delta': 10,
+            'kga_tau': 30,
+            'max_training_data_num': 500,
+            # learner period in ms, rounded to whole poll periods; 0 = as fast as possible
+            'cycle_time': 100,
+            'serial_number': 141960,
+            'com_port': 'COM7',
+            'com_serial': 22222,
+            'sample_depth': 100,
+            'poll_period': 50,
+            # seconds between re-enumerations of a node's devices (hot-plug), 0 = only on connect
+            'rescan_period': 5.0,
+            'learner_phase': 0.5,
+            # '' runs one learner in CBLAThread, 'node' or 'port' one learner process per group
+            'learner_groups': '',
+            # sensor device type -> calibration.CALIBRATIONS name, e.g. {2: 'ir_distance'};
+            # other types are scaled linearly over the ADC range
+            'sensor_calibration': {},
+            # read all sensors of a node in one exchange where the source has a ReadMany
+            # (teensy_sim); simpleTeensyComs has none, so real nodes are read device by device
+            'bulk_read': True,
+            # send a node's changed fade targets in one frame where the source has a FadeMany;
+            # simpleTeensyComs has none, real nodes get one Fade per changed actuator
+            'bulk_fade': True,
+            'render_fps': 20,
+            # draw all sensor traces in one canvas (SensorGrid) instead of one plot widget per sensor
+            'sensor_grid': True,
+            # seconds of history a sensor plot shows until zoomed, see decimation.PlotHistory
+            'plot_span': 60,
+            'record_dir': 'sessions',
+            'replay_session': '',
+            'replay_speed': 1.0,
+            'sim_nodes': 0,
+            'sim_sensors': 8,
+            'sim_actuators': 8,
+            'sim_latency': 2.0,
+            'sim_jitter': 0.5,
+            'sim_failure_rate': 0.0,
+            # logger name -> level, e.g. {'cbla.acquisition.samples': 'DEBUG'}
+            'log_levels': {},
+            # poll the nodes in a separate process publishing to a shared memory sample bus
+            'acquisition_process': True,
+            # prefix of the bus name, every acquisition process appends its pid
+            'bus_name': 'cbla_samples',
+            'bus_sensors': 512,
+            # view a headless daemon (daemon.py) instead of polling and learning in the GUI process
+            'attach': False,
+            # the daemon only listens on other addresses with an explicit authkey, see remote.server_authkey
+            'daemon_host': '127.0.0.1',
+            'daemon_port': 6510,
+            # '' = CBLA_DAEMON_AUTHKEY, else a random key the daemon writes to daemon_key_file
+            'daemon_authkey': '',
+            'daemon_key_file': '~/.cbla_daemon_key'
+        }
+
+QUEUE_SIZE = 100
+
+MAX_CBLA_DATA_NUM = 50
+
+'''
+    state shared by acquisition, learning and the views, free of Qt
+    the GUI threads (qthreads) and the headless daemon (daemon.py) each work on one Runtime
+'''
+class Runtime(object):
+    def __init__(self, config):
+        self.config = config
+
+        # reading history of every sensor, depth is configurable beyond QUEUE_SIZE
+        # one shard per node, each written only by that node's poller; replaced by the
+        # store of the acquisition backend once it is started
+        self.sample_store = SampleStoreGroup(max(QUEUE_SIZE, config['sample_depth']))
+
+        # Acquisition, AcquisitionProcess or DaemonClient, see create_acquisition
+        self.acquisition = None
+
+        # teensy serial number -> device list, filled in as the nodes report their devices
+        # replaced as a whole (copy-on-write) so readers can iterate it without locking
+        self.devices = None
+        # descriptor table of all devices in self.devices, rebuilt with it
+        self.device_table = DeviceTable()
+        # (teensy serial number, byte string) keys of deactivated actuators, kept over table rebuilds
+        self.devices_inactive = set()
+
+        # teensy serial number -> fade command channel of the node's poller, see Acquisition.fade_channel
+        # each batch is a list of (byte string, value) of the actuators whose target changed
+        self.fade_commands = {}
+
+        # common time origin of the acquisition and learner deadlines, keeps their ticks aligned
+        self.cycle_epoch = time.time()
+
+        # SessionRecorder (or RemoteRecorder) while a recording is running
+        self.recorder = None
+
+        # only serializes node registration (device lists, command channels), never the sample path
+        self.registry_lock = threading.Lock()
+
+        # learner metrics history, one row per CBLAPlots member (row = value - 1)
+        self.cbla_metrics = MetricsRing(MAX_CBLA_DATA_NUM, len(CBLAPlots))
+
+    # acquisition backend chosen by the config: attached to a daemon, in a separate process or in-process
+    def create_acquisition(self):
+        capacity = max(QUEUE_SIZE, self.config['sample_depth'])
+        if (self.config['attach']):
+            self.acquisition = DaemonClient(self.config, capacity)
+        elif (self.config['acquisition_process']):
+            self.acquisition = AcquisitionProcess(self.config, capacity, self.cycle_epoch)
+        else:
+            self.acquisition = Acquisition(self.config, self.sample_store, self.cycle_epoch)
+        return self.acquisition
+
+    def start_acquisition(self):
+        self.acquisition.start()
+        self.sample_store = self.acquisition.store
+
+    # publish a node's device list and command channel in the shared registry
+    def register_node(self, teensy_serial, devList):
+        self.registry_lock.acquire()
+        channels = dict(self.fade_commands)
+        channels[teensy_serial] = self.acquisition.fade_channel(teensy_serial)
+        self.fade_commands = channels
+        node_devices = dict(self.devices) if (self.devices is not None) else {}
+        node_devices[teensy_serial] = devList
+        # the table is published before the device lists, whoever sees the devices sees their table
+        self.device_table = DeviceTable(node_devices.items(), self.devices_inactive)
+        self.devices = node_devices
+        self.registry_lock.release()
+
+    # (de)activate an actuator, deactivated actuators are faded to 0
+    def set_inactive(self, key, inactive):
+        self.registry_lock.acquire()
+        if (inactive):
+            self.devices_inactive.add(key)
+        else:
+            self.devices_inactive.discard(key)
+        self.device_table.set_active(key, not inactive)
+        self.registry_lock.release()
+        # a daemon client forwards the change to the daemon's learner
+        forward = getattr(self.acquisition, 'set_inactive', None)
+        if (forward is not None):
+            forward(key, inactive)
+
+    # start recording readings, actuator commands and learner metrics to config['record_dir']
+    # the session is named after the current time unless name is given
+    def start_recording(self, name=None):
+        if (self.recorder is None):
+            if (self.acquisition is not None):
+                # sensors are recorded by the node pollers, wherever they run
+                self.recorder = self.acquisition.start_recording(self.config['record_dir'], name)
+            else:
+                self.recorder = SessionRecorder(self.config['record_dir'], name)
+                self.recorder.start()
+        return self.recorder.path
+
+    # stop recording and write out everything buffered
+    def stop_recording(self):
+        if (self.recorder is not None):
+            rec = self.recorder
+            self.recorder = None
+            if (self.acquisition is not None):
+                self.acquisition.stop_recording()
+            else:
+                rec.close()
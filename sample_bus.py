@@ -0,0 +1,332 @@
+import numpy as np
+import os
+import threading
+import time
+
+from multiprocessing import resource_tracker, shared_memory
+
+DEFAULT_BUS_NAME = "cbla_samples"
+DEFAULT_MAX_SENSORS = 512
+# seconds without a heartbeat after which an existing bus counts as left behind by a crashed writer
+STALE_AFTER = 5.0
+# torn reads of a row between two checks of the writer's heartbeat
+READ_SPINS = 100
+
+BUS_MAGIC = 0x43424c41
+# header slots: magic, capacity, max sensors, published keys, writer heartbeat (ms),
+# number of times a published key was removed or came back
+HEADER_LEN = 8
+H_MAGIC = 0
+H_CAPACITY = 1
+H_MAX_SENSORS = 2
+H_NUM_KEYS = 3
+H_HEARTBEAT = 4
+H_KEYS_VERSION = 5
+# key table columns: teensy serial number, byte string as integer, byte string length,
+# 1 while the sensor is registered, 0 once its node dropped it
+KEY_COLS = 4
+KT_LIVE = 3
+
+# int64 and float64 arrays of one bus, in the order they are laid out in the segment
+def bus_layout(capacity, max_sensors):
+    return [
+        ('header', np.int64, (HEADER_LEN,)),
+        ('key_table', np.int64, (max_sensors, KEY_COLS)),
+        ('seq', np.int64, (max_sensors,)),
+        ('cursor', np.int64, (max_sensors,)),
+        ('count', np.int64, (max_sensors,)),
+        ('values', np.float64, (max_sensors, 2 * capacity)),
+        ('times', np.float64, (max_sensors, 2 * capacity)),
+    ]
+
+def bus_size(capacity, max_sensors):
+    return sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for _, dtype, shape in bus_layout(capacity, max_sensors))
+
+def encode_byte_str(byte_str):
+    return int.from_bytes(byte_str, byteorder='big'), len(byte_str)
+
+def decode_byte_str(code, length):
+    return int(code).to_bytes(int(length), byteorder='big')
+
+# bus name of the calling writer process, so every GUI or daemon publishes its own bus;
+# readers learn the name from the writer (see acquisition.EVENT_READY)
+def unique_bus_name(prefix=DEFAULT_BUS_NAME):
+    return "{}_{}".format(prefix, os.getpid())
+
+# True if shm holds a sample bus whose writer beat within STALE_AFTER seconds
+def writer_alive(shm):
+    if (shm.size < HEADER_LEN * 8):
+        return False
+    header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+    alive = (header[H_MAGIC] == BUS_MAGIC and time.time() - header[H_HEARTBEAT] / 1000.0 < STALE_AFTER)
+    del header
+    return bool(alive)
+
+'''
+    sensor history in a named shared memory segment, one writer process and any number of readers
+    same mirrored ring layout as sample_store.SampleStore, with a fixed number of rows;
+    each row has its own sequence number, odd while the writer updates it, so readers
+    copy a consistent history without a lock; the key table is append-only and a key
+    becomes visible once the published key count includes it, a removed key keeps its
+    row with a tombstone that readers honor and gets it back if it is registered again
+'''
+class SampleBus(object):
+    # child_writer: the writer is a child of this process and shares its resource tracker,
+    # which has to keep the segment registered until the writer unlinks it
+    def __init__(self, name=DEFAULT_BUS_NAME, capacity=None, max_sensors=DEFAULT_MAX_SENSORS, create=False, child_writer=False):
+        self.name = name
+        self.owner = create
+        if (create):
+            # a segment left behind by a crashed writer is replaced, one with a live writer is not
+            try:
+                stale = shared_memory.SharedMemory(name=name)
+            except FileNotFoundError:
+                stale = None
+            if (stale is not None):
+                if (writer_alive(stale)):
+                    # opening registered it with this process' resource tracker, which must not unlink it
+                    resource_tracker.unregister(stale._name, 'shared_memory')
+                    stale.close()
+                    raise FileExistsError("Sample bus {} has a live writer".format(name))
+                stale.close()
+                stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=bus_size(int(capacity), max_sensors))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            if (not child_writer):
+                # the segment belongs to the writer, keep this process from unlinking it at exit
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+            header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=self.shm.buf)
+            if (header[H_MAGIC] != BUS_MAGIC):
+                self.shm.close()
+                raise ValueError("{} is not a sample bus".format(name))
+            capacity = int(header[H_CAPACITY])
+            max_sensors = int(header[H_MAX_SENSORS])
+            del header
+
+        self.capacity = int(capacity)
+        self.max_sensors = max_sensors
+        self.map_arrays()
+
+        if (create):
+            self.header[:] = 0
+            self.seq[:] = 0
+            self.cursor[:] = 0
+            self.count[:] = 0
+            self.header[H_CAPACITY] = self.capacity
+            self.header[H_MAX_SENSORS] = self.max_sensors
+            self.header[H_MAGIC] = BUS_MAGIC
+        else:
+            # readers attach read-only
+            for arr in self.arrays:
+                arr.flags.writeable = False
+
+        # key (teensy serial number, sensor byte string) -> row index, of every published key
+        self.slots = {}
+        self.keys_version = 0
+        # registered keys only: key -> row index, keys in row order and their rows
+        self.rows = {}
+        self.key_list = []
+        self.key_rows = np.zeros(0, dtype=np.intp)
+        # only serializes key registration between the writer's node threads
+        self.register_lock = threading.Lock()
+
+    def map_arrays(self):
+        self.arrays = []
+        offset = 0
+        for attr, dtype, shape in bus_layout(self.capacity, self.max_sensors):
+            arr = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            setattr(self, attr, arr)
+            self.arrays.append(arr)
+            offset += arr.nbytes
+
+    # pick up keys the writer published, removed or registered again since the last call
+    def refresh_keys(self):
+        num = int(self.header[H_NUM_KEYS])
+        version = int(self.header[H_KEYS_VERSION])
+        if (num > len(self.slots) or version != self.keys_version):
+            slots = dict(self.slots)
+            for row in range(len(slots), num):
+                serial, code, length = self.key_table[row, :KT_LIVE]
+                slots[(int(serial), decode_byte_str(code, length))] = row
+            self.slots = slots
+            self.keys_version = version
+            self.update_live()
+
+    # rebuild the registered keys from the tombstones of the key table
+    # slots are added in row order, so are the keys; copy-on-write like the slots
+    def update_live(self):
+        live = (self.key_table[:len(self.slots), KT_LIVE] != 0)
+        keys = [key for key, alive in zip(self.slots, live) if alive]
+        key_rows = np.flatnonzero(live)
+        self.rows = dict(zip(keys, key_rows.tolist()))
+        self.key_rows = key_rows
+        self.key_list = keys
+
+    def row(self, key):
+        row = self.rows.get(key)
+        if (row is None and not self.owner):
+            self.refresh_keys()
+            row = self.rows.get(key)
+        return row
+
+    @property
+    def keys(self):
+        if (not self.owner):
+            self.refresh_keys()
+        return self.key_list
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return self.row(key) is not None
+
+    # writer side: register sensors, returns False if the bus is full
+    # a sensor that was removed gets its old row back
+    def register(self, keys):
+        with self.register_lock:
+            added = [key for key in keys if key not in self.rows]
+            if (len(added) == 0):
+                return True
+            full = False
+            for key in added:
+                row = self.slots.get(key)
+                if (row is not None):
+                    self.key_table[row, KT_LIVE] = 1
+                    self.header[H_KEYS_VERSION] += 1
+                    continue
+                row = len(self.slots)
+                if (row >= self.max_sensors):
+                    full = True
+                    break
+                code, length = encode_byte_str(key[1])
+                self.key_table[row] = (key[0], code, length, 1)
+                slots = dict(self.slots)
+                slots[key] = row
+                self.slots = slots
+                # publish the row after its key is written
+                self.header[H_NUM_KEYS] = row + 1
+            self.update_live()
+        return not full
+
+    # writer side: drop sensors that are gone, only their node's reader may call this
+    # the rows of the shared key table stay, they are tombstoned and emptied, so a sensor
+    # that comes back starts with a new history like any other
+    def unregister(self, keys):
+        with self.register_lock:
+            removed = [self.rows[key] for key in keys if key in self.rows]
+            if (len(removed) == 0):
+                return True
+            for row in removed:
+                self.key_table[row, KT_LIVE] = 0
+                self.seq[row] += 1
+                self.cursor[row] = 0
+                self.count[row] = 0
+                self.seq[row] += 1
+            self.header[H_KEYS_VERSION] += 1
+            self.update_live()
+        return True
+
+    # writer side: append one reading, each row written by a single thread
+    def append(self, key, val, timestamp=None):
+        row = self.rows.get(key)
+        if (row is None):
+            if (not self.register([key])):
+                return
+            row = self.rows[key]
+        if (timestamp is None):
+            timestamp = time.time()
+
+        self.seq[row] += 1
+        pos = self.cursor[row]
+        self.values[row, pos] = val
+        self.values[row, pos + self.capacity] = val
+        self.times[row, pos] = timestamp
+        self.times[row, pos + self.capacity] = timestamp
+        self.cursor[row] = (pos + 1) % self.capacity
+        if (self.count[row] < self.capacity):
+            self.count[row] += 1
+        self.seq[row] += 1
+
+    # writer side: mark the writer alive, readers compare it with their clock
+    def beat(self):
+        self.header[H_HEARTBEAT] = int(time.time() * 1000)
+
+    # seconds since the writer last called beat()
+    def heartbeat_age(self):
+        return time.time() - self.header[H_HEARTBEAT] / 1000.0
+
+    # copy the latest n values or timestamps of a row, retried while the writer is in the row
+    # a writer that dies in append() leaves the row's sequence number odd for good: every
+    # READ_SPINS retries the reader yields, and once the writer has stopped beating the copy
+    # is returned as is, nothing changes it anymore
+    def read_row(self, row, arr, n):
+        spins = 0
+        while (True):
+            seq = self.seq[row]
+            end = self.cursor[row] + self.capacity
+            num = self.count[row] if n is None else min(int(n), self.count[row])
+            out = arr[row, end - num:end].copy()
+            if (seq % 2 == 0 and self.seq[row] == seq):
+                return out
+            spins += 1
+            if (spins % READ_SPINS == 0):
+                if (self.heartbeat_age() > STALE_AFTER):
+                    return out
+                time.sleep(0)
+
+    def size(self, key):
+        row = self.row(key)
+        if (row is None):
+            return 0
+        return int(self.count[row])
+
+    # latest value of a sensor, None if nothing was recorded yet
+    def latest(self, key):
+        row = self.row(key)
+        if (row is None):
+            return None
+        vals = self.read_row(row, self.values, 1)
+        return vals[0] if (len(vals) > 0) else None
+
+    # copy of the latest n values (oldest first)
+    def latest_n(self, key, n=None):
+        row = self.row(key)
+        if (row is None):
+            return np.zeros(0)
+        return self.read_row(row, self.values, n)
+
+    # copy of the timestamps matching latest_n
+    def latest_times(self, key, n=None):
+        row = self.row(key)
+        if (row is None):
+            return np.zeros(0)
+        return self.read_row(row, self.times, n)
+
+    # latest value of every registered sensor as one array, in the order of keys (NaN if empty)
+    # gathered for all rows at once and checked against their sequence numbers in one pass,
+    # only rows the writer was in meanwhile are read again one by one
+    def latest_all(self):
+        if (not self.owner):
+            self.refresh_keys()
+        rows = self.key_rows
+        seq = self.seq[rows]
+        vals = self.values[rows, self.cursor[rows] + self.capacity - 1]
+        empty = (self.count[rows] == 0)
+        for i in np.flatnonzero((seq % 2 != 0) | (self.seq[rows] != seq)):
+            latest = self.read_row(rows[i], self.values, 1)
+            empty[i] = (len(latest) == 0)
+            if (len(latest) > 0):
+                vals[i] = latest[0]
+        vals[empty] = np.nan
+        return vals
+
+    def close(self):
+        # the mapped arrays must be released before the segment can be closed
+        self.arrays = []
+        for attr, _, _ in bus_layout(self.capacity, self.max_sensors):
+            setattr(self, attr, None)
+        self.shm.close()
+        if (self.owner):
+            self.shm.unlink()
@@ -0,0 +1,276 @@
+import numpy as np
+import threading
+import time
+
+DEFAULT_NUM_SENSORS = 16
+
+'''
+    preallocated ring buffer holding the reading history of every sensor
+    one row per sensor; values and timestamps live in two (num_sensors, 2 * capacity)
+    arrays and every sample is written twice (at cursor and cursor + capacity),
+    so the latest n samples of a sensor are always one contiguous slice
+'''
+class SampleStore(object):
+    def __init__(self, capacity, num_sensors=DEFAULT_NUM_SENSORS, dtype=np.float64):
+        self.capacity = int(capacity)
+        self.dtype = dtype
+
+        # key (teensy serial number, sensor byte string) -> row index
+        self.rows = {}
+        self.keys = []
+
+        self.values = np.zeros((num_sensors, 2 * self.capacity), dtype=dtype)
+        self.times = np.zeros((num_sensors, 2 * self.capacity), dtype=np.float64)
+        # next write position and number of valid samples per row
+        self.cursor = np.zeros(num_sensors, dtype=np.int64)
+        self.count = np.zeros(num_sensors, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    # number of sensor rows currently allocated
+    def num_rows(self):
+        return self.values.shape[0]
+
+    # register a sensor and return its row, growing the arrays if needed
+    def add_sensor(self, key):
+        row = self.rows.get(key)
+        if (row is not None):
+            return row
+
+        row = len(self.keys)
+        if (row == self.num_rows()):
+            self.grow(max(1, 2 * self.num_rows()))
+        self.rows[key] = row
+        self.keys.append(key)
+        return row
+
+    # drop a sensor, the last sensor moves into its row (one row copied)
+    def remove_sensor(self, key):
+        row = self.rows.get(key)
+        if (row is None):
+            return
+        last = len(self.keys) - 1
+        last_key = self.keys[last]
+        if (row != last):
+            self.values[row] = self.values[last]
+            self.times[row] = self.times[last]
+            self.cursor[row] = self.cursor[last]
+            self.count[row] = self.count[last]
+        self.cursor[last] = 0
+        self.count[last] = 0
+
+        # copy-on-write so readers never see a key without its row
+        rows = dict(self.rows)
+        del rows[key]
+        keys = self.keys[:last]
+        if (row != last):
+            rows[last_key] = row
+            keys[row] = last_key
+        self.rows = rows
+        self.keys = keys
+
+    # reallocate arrays for num_rows sensors, keeping the recorded history
+    def grow(self, num_rows):
+        old_rows = self.num_rows()
+        if (num_rows <= old_rows):
+            return
+
+        values = np.zeros((num_rows, 2 * self.capacity), dtype=self.dtype)
+        times = np.zeros((num_rows, 2 * self.capacity), dtype=np.float64)
+        values[:old_rows] = self.values
+        times[:old_rows] = self.times
+        self.values = values
+        self.times = times
+
+        self.cursor = np.concatenate((self.cursor, np.zeros(num_rows - old_rows, dtype=np.int64)))
+        self.count = np.concatenate((self.count, np.zeros(num_rows - old_rows, dtype=np.int64)))
+
+    # append one reading in O(1)
+    def append(self, key, val, timestamp=None):
+        row = self.rows.get(key)
+        if (row is None):
+            row = self.add_sensor(key)
+        if (timestamp is None):
+            timestamp = time.time()
+
+        pos = self.cursor[row]
+        self.values[row, pos] = val
+        self.values[row, pos + self.capacity] = val
+        self.times[row, pos] = timestamp
+        self.times[row, pos + self.capacity] = timestamp
+
+        self.cursor[row] = (pos + 1) % self.capacity
+        if (self.count[row] < self.capacity):
+            self.count[row] += 1
+
+    # number of samples held for a sensor
+    def size(self, key):
+        row = self.rows.get(key)
+        if (row is None):
+            return 0
+        return int(self.count[row])
+
+    # latest value of a sensor, None if nothing was recorded yet
+    def latest(self, key):
+        row = self.rows.get(key)
+        if (row is None or self.count[row] == 0):
+            return None
+        return self.values[row, self.cursor[row] + self.capacity - 1]
+
+    # zero-copy view of the latest n values (oldest first)
+    def latest_n(self, key, n=None):
+        row = self.rows.get(key)
+        if (row is None):
+            return self.values[0, 0:0]
+        end = self.cursor[row] + self.capacity
+        n = self.count[row] if n is None else min(int(n), self.count[row])
+        return self.values[row, end - n:end]
+
+    # zero-copy view of the timestamps matching latest_n
+    def latest_times(self, key, n=None):
+        row = self.rows.get(key)
+        if (row is None):
+            return self.times[0, 0:0]
+        end = self.cursor[row] + self.capacity
+        n = self.count[row] if n is None else min(int(n), self.count[row])
+        return self.times[row, end - n:end]
+
+    # latest value of every registered sensor as one array (NaN if empty)
+    def latest_all(self):
+        num = len(self.keys)
+        cols = self.cursor[:num] + self.capacity - 1
+        vals = self.values[np.arange(num), cols].astype(np.float64)
+        vals[self.count[:num] == 0] = np.nan
+        return vals
+
+    # drop all recorded samples, keeping the registered sensors
+    def clear(self):
+        self.cursor[:] = 0
+        self.count[:] = 0
+
+'''
+    sample store split into one SampleStore per node, keyed by teensy serial number
+    each node reader is the only writer of its own shard, so appends never take a lock;
+    readers see either the previous or the new sample of a sensor
+'''
+class SampleStoreGroup(object):
+    def __init__(self, capacity, num_sensors=DEFAULT_NUM_SENSORS):
+        self.capacity = int(capacity)
+        self.num_sensors = num_sensors
+        self.shards = {}
+        # only taken when a node is added, never on append or read
+        self.shard_lock = threading.Lock()
+
+    # shard of a node, created on first use by that node's reader
+    def shard(self, node):
+        store = self.shards.get(node)
+        if (store is None):
+            with self.shard_lock:
+                store = self.shards.get(node)
+                if (store is None):
+                    store = SampleStore(self.capacity, self.num_sensors)
+                    # copy-on-write so concurrent readers never iterate a changing dict
+                    shards = dict(self.shards)
+                    shards[node] = store
+                    self.shards = shards
+        return store
+
+    @property
+    def keys(self):
+        return [key for store in self.shards.values() for key in store.keys]
+
+    def __len__(self):
+        return sum(len(store) for store in self.shards.values())
+
+    def __contains__(self, key):
+        store = self.shards.get(key[0])
+        return store is not None and key in store
+
+    # register sensors ahead of their first reading, same interface as sample_bus.SampleBus
+    def register(self, keys):
+        for key in keys:
+            self.shard(key[0]).add_sensor(key)
+        return True
+
+    # drop sensors that are gone, only their node's reader may call this
+    def unregister(self, keys):
+        for key in keys:
+            store = self.shards.get(key[0])
+            if (store is not None):
+                store.remove_sensor(key)
+        return True
+
+    def append(self, key, val, timestamp=None):
+        self.shard(key[0]).append(key, val, timestamp)
+
+    def size(self, key):
+        store = self.shards.get(key[0])
+        return 0 if store is None else store.size(key)
+
+    def latest(self, key):
+        store = self.shards.get(key[0])
+        return None if store is None else store.latest(key)
+
+    def latest_n(self, key, n=None):
+        store = self.shards.get(key[0])
+        return np.zeros(0) if store is None else store.latest_n(key, n)
+
+    def latest_times(self, key, n=None):
+        store = self.shards.get(key[0])
+        return np.zeros(0) if store is None else store.latest_times(key, n)
+
+    # latest value of every sensor, in the order of keys
+    def latest_all(self):
+        vals = [store.latest_all() for store in self.shards.values()]
+        return np.concatenate(vals) if (len(vals) > 0) else np.zeros(0)
+
+    def clear(self):
+        for store in self.shards.values():
+            store.clear()
+
+'''
+    ring of learner metrics, one column per cycle, for one writer and any number of readers
+    the learner pushes a row of all metrics per cycle, the GUI copies the
+    history into its own preallocated arrays at its own refresh rate;
+    version is odd while a push is in progress, readers retry instead of locking
+'''
+class MetricsRing(object):
+    def __init__(self, capacity, num_metrics):
+        self.capacity = int(capacity)
+        self.num_metrics = num_metrics
+
+        self.values = np.zeros((num_metrics, 2 * self.capacity), dtype=np.float64)
+        self.cursor = 0
+        self.count = 0
+        # incremented before and after every push, lets readers skip unchanged frames
+        self.version = 0
+
+    # write one value per metric, no allocation
+    def push(self, vals):
+        self.version += 1
+        pos = self.cursor
+        self.values[:, pos] = vals
+        self.values[:, pos + self.capacity] = vals
+        self.cursor = (pos + 1) % self.capacity
+        if (self.count < self.capacity):
+            self.count += 1
+        self.version += 1
+
+    # copy the history of a metric into out (oldest first), returns the number of values copied
+    # while a push is in progress the reader yields to the writer instead of spinning
+    def read(self, metric, out):
+        while (True):
+            version = self.version
+            if (version % 2 != 0):
+                time.sleep(0)
+                continue
+            n = min(self.count, len(out))
+            end = self.cursor + self.capacity
+            out[len(out) - n:] = self.values[metric, end - n:end]
+            if (self.version == version):
+                return n
+            time.sleep(0)
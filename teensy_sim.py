@@ -0,0 +1,159 @@
+import argparse
+import math
+import random
+import time
+
+from replay import ReplayDevice
+
+SIM_PORT_PREFIX = "sim:"
+FIRST_SIM_SERIAL = 900000
+DEVICES_PER_PORT = 64
+
+SENSOR_TYPES = (2, 4)
+ACTUATOR_TYPES = (1, 3)
+MAX_SENSOR_VAL = 1023
+
+''' simulated connection to one node '''
+class SimulatedConnection(object):
+    def __init__(self, sim, teensy_serial):
+        self.sim = sim
+        self.teensy_serial = teensy_serial
+        self.is_open = True
+        self.started = time.time()
+
+        self.devices = sim.make_devices()
+        self.sensors = [dev for dev in self.devices if dev.type % 2 == 0]
+        self.phase = {dev.genByteStr(): random.uniform(0, 2 * math.pi) for dev in self.sensors}
+        # current level of every actuator, per port
+        self.levels = {}
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    # sensor reading: slow wave plus the mean actuator level on the same port
+    def value(self, byte_str):
+        phase = self.phase.get(byte_str)
+        if (phase is None):
+            return None
+        port_levels = self.levels.get(byte_str[2])
+        drive = sum(port_levels.values()) / len(port_levels) if port_levels else 0.0
+        t = time.time() - self.started
+        val = 300 + 200 * math.sin(0.5 * t + phase) + 2 * drive + random.gauss(0, self.sim.noise)
+        return int(min(MAX_SENSOR_VAL, max(0, val)))
+
+'''
+    in-process stand-in for the simpleTeensyComs module
+    simulates any number of nodes with configurable device counts, serial latency,
+    jitter and failure injection; nodes use "sim:<serial number>" as their port
+'''
+class TeensySimulator(object):
+    def __init__(self, num_nodes=1, num_sensors=8, num_actuators=8, latency=2.0, jitter=0.5,
+                 byte_time=0.05, failure_rate=0.0, noise=5.0, bulk_read=True):
+        self.num_nodes = num_nodes
+        self.num_sensors = num_sensors
+        self.num_actuators = num_actuators
+        # milliseconds per exchange, random jitter and per-device cost of a bulk frame
+        self.latency = latency
+        self.jitter = jitter
+        self.byte_time = byte_time
+        self.failure_rate = failure_rate
+        self.noise = noise
+        self.max_speed = False
+
+        # firmware without bulk read support
+        if (not bulk_read):
+            self.ReadMany = None
+
+        self.exchanges = 0
+        self.failures = 0
+
+    # (teensy serial number, port) of every simulated node
+    def get_nodes(self):
+        return [(FIRST_SIM_SERIAL + i, SIM_PORT_PREFIX + str(FIRST_SIM_SERIAL + i)) for i in range(self.num_nodes)]
+
+    def make_devices(self):
+        devices = []
+        for i in range(self.num_sensors + self.num_actuators):
+            if (i < self.num_sensors):
+                type = SENSOR_TYPES[i % len(SENSOR_TYPES)]
+            else:
+                type = ACTUATOR_TYPES[i % len(ACTUATOR_TYPES)]
+            devices.append(ReplayDevice(i % DEVICES_PER_PORT, type, i // DEVICES_PER_PORT + 1))
+        return devices
+
+    # wait for one simulated serial exchange, raising on injected failures
+    def exchange(self, comms, num_devices=1):
+        if (not comms.is_open):
+            raise ConnectionError("Simulated port is closed")
+        self.exchanges += 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter) + self.byte_time * num_devices
+        if (delay > 0):
+            time.sleep(delay / 1000.0)
+        if (self.failure_rate > 0 and random.random() < self.failure_rate):
+            self.failures += 1
+            raise TimeoutError("Simulated read timeout")
+
+    def initializeComms(self, port):
+        return SimulatedConnection(self, int(port[len(SIM_PORT_PREFIX):]))
+
+    def QueryIDs(self, comms, teensy_serial, com_serial):
+        self.exchange(comms)
+        return list(comms.devices)
+
+    def Read(self, comms, teensy_serial, com_serial, byte_str, num):
+        self.exchange(comms)
+        return comms.value(byte_str)
+
+    def ReadMany(self, comms, teensy_serial, com_serial, byte_strs, num):
+        self.exchange(comms, len(byte_strs))
+        return [comms.value(byte_str) for byte_str in byte_strs]
+
+    def Fade(self, comms, teensy_serial, com_serial, byte_str, val, num):
+        self.exchange(comms)
+        comms.levels.setdefault(byte_str[2], {})[byte_str] = val
+        return val
+
+# poll one simulated node for a while and report the achieved sweep and sample rates
+def benchmark(sim, duration, bulk):
+    teensy_serial, port = sim.get_nodes()[0]
+    comms = sim.initializeComms(port)
+    byte_strs = [dev.genByteStr() for dev in sim.QueryIDs(comms, teensy_serial, 0) if dev.type % 2 == 0]
+
+    sweeps = 0
+    samples = 0
+    start = time.time()
+    while (time.time() - start < duration):
+        try:
+            if (bulk):
+                vals = sim.ReadMany(comms, teensy_serial, 0, byte_strs, 0)
+            else:
+                vals = []
+                for byte_str in byte_strs:
+                    try:
+                        vals.append(sim.Read(comms, teensy_serial, 0, byte_str, 0))
+                    except TimeoutError:
+                        pass
+        except TimeoutError:
+            continue
+        sweeps += 1
+        samples += len(vals)
+    elapsed = time.time() - start
+    return sweeps / elapsed, samples / elapsed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure polling throughput against a simulated Teensy.')
+    parser.add_argument('--sensors', type=int, default=100, help='Sensors on the node [100]')
+    parser.add_argument('--latency', type=float, default=2.0, help='Milliseconds per serial exchange [2.0]')
+    parser.add_argument('--jitter', type=float, default=0.5, help='Random latency jitter in milliseconds [0.5]')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Probability of an exchange failing [0]')
+    parser.add_argument('--duration', type=float, default=3.0, help='Seconds per measurement [3]')
+    args = parser.parse_args()
+
+    sim = TeensySimulator(num_sensors=args.sensors, num_actuators=0, latency=args.latency,
+        jitter=args.jitter, failure_rate=args.failure_rate)
+    for bulk in (False, True):
+        sweep_rate, sample_rate = benchmark(sim, args.duration, bulk)
+        print('{:<10} {:8.1f} sweeps/s {:10.1f} samples/s'.format('bulk' if bulk else 'per-device', sweep_rate, sample_rate))
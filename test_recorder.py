@@ -0,0 +1,48 @@
+import numpy as np
+import queue
+import threading
+
+from recorder import SessionReader, SessionRecorder
+
+KEY = (141960, bytes((1, 2, 1)))
+
+'''
+    chunk queue that runs a producer right after flush finds it drained, the moment a
+    full chunk could be queued behind the partial chunk flush is about to take
+'''
+class RacingQueue(queue.Queue):
+    def __init__(self):
+        super(RacingQueue, self).__init__()
+        self.producer = None
+
+    def empty(self):
+        empty = super(RacingQueue, self).empty()
+        if (empty and self.producer is not None):
+            producer, self.producer = self.producer, None
+            producer.start()
+            # a producer held off by the table lock finishes after flush
+            producer.join(0.5)
+        return empty
+
+# rows appended while flush runs reach the files in time order
+def test_rows_stay_in_time_order_while_flushing(tmp_path):
+    rec = SessionRecorder(str(tmp_path), 'session', chunk_rows=7)
+    chunks = RacingQueue()
+    rec.chunks = chunks
+    for table in rec.tables.values():
+        table.out = chunks
+
+    for i in range(3):
+        rec.record_sensors([KEY], [i], timestamp=float(i))
+    # fills the partial chunk, queues it and starts a new one
+    producer = threading.Thread(target=lambda: [rec.record_sensors([KEY], [i], timestamp=float(i)) for i in range(3, 13)])
+    chunks.producer = producer
+    rec.flush()
+    producer.join()
+    # stops the writer without its thread: the final flush and closing the files
+    rec.running = False
+    rec.run()
+
+    times = np.asarray(SessionReader(rec.path).table('sensors')['time'])
+    assert len(times) == 13
+    assert np.all(np.diff(times) >= 0)
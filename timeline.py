@@ -0,0 +1,78 @@
+import numpy as np
+
+from decimation import bucket_envelope, envelope_line
+from recorder import SessionReader, index_session
+
+# a visible range with more readings than this many per pixel is drawn from the time index
+RAW_POINTS_PER_PIXEL = 8
+
+'''
+    one recorded series of a session, drawn by the timeline viewer
+    a column of the cbla table, or the value of one device in the sensors/actuators table
+'''
+class TimelineSeries(object):
+    def __init__(self, session, table, column, key=None):
+        self.session = session
+        self.table = table
+        self.column = column
+        self.key = key
+
+    # (times, lo, hi) of the series between t0 and t1 in at most max_points buckets
+    # zoomed in, the rows of the range are read and decimated; zoomed out, the block
+    # summaries of the time index stand in for their rows, so only the index is read
+    def envelope(self, t0, t1, max_points):
+        reader = self.session.reader
+        blocks = reader.index_range(self.table, t0, t1, self.key)
+        # blocks partly outside the range are read row by row to keep its edges exact
+        inside = blocks[(blocks['time_min'] >= t0) & (blocks['time_max'] <= t1)]
+        if (int(inside['count'].sum()) <= RAW_POINTS_PER_PIXEL * max_points):
+            rows = reader.window(self.table, t0, t1, self.key)
+            vals = rows[self.column]
+            return bucket_envelope(rows['time'], vals, vals, t0, t1, max_points)
+
+        times = [inside['time_min']]
+        lo = [inside[self.column + '_min']]
+        hi = [inside[self.column + '_max']]
+        # edge blocks and the rows not indexed yet
+        edge_start = float(inside['time_min'].min())
+        edge_end = float(inside['time_max'].max())
+        for start, end in ((t0, np.nextafter(edge_start, -np.inf)), (np.nextafter(edge_end, np.inf), t1)):
+            if (start <= end):
+                rows = reader.window(self.table, start, end, self.key)
+                times.append(rows['time'])
+                lo.append(rows[self.column])
+                hi.append(rows[self.column])
+        return bucket_envelope(np.concatenate(times), np.concatenate(lo), np.concatenate(hi), t0, t1, max_points)
+
+    # envelope as one polyline, times relative to the session start
+    def envelope_line(self, t0, t1, max_points):
+        times, lo, hi = self.envelope(t0, t1, max_points)
+        return envelope_line(times - self.session.reader.started, lo, hi)
+
+'''
+    a recorded session opened for the timeline viewer
+    sessions recorded without a time index are indexed once on open; reload picks up
+    the rows written since, so a session still being recorded can be followed
+'''
+class TimelineSession(object):
+    def __init__(self, path):
+        self.path = path
+        self.reader = SessionReader(path)
+        if (not self.reader.has_index()):
+            index_session(path)
+        self.reload()
+
+    def reload(self):
+        self.reader = SessionReader(self.path)
+
+    @property
+    def device_keys(self):
+        return self.reader.device_keys
+
+    # time range covered by any table, absolute times
+    def time_range(self):
+        ranges = [self.reader.time_range(table) for table in self.reader.meta['tables']]
+        return min(r[0] for r in ranges), max(r[1] for r in ranges)
+
+    def series(self, table, column, key=None):
+        return TimelineSeries(self, table, column, key)
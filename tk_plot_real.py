@@ -5,6 +5,8 @@ from serial.tools import list_ports
 
 import simpleTeensyComs
 from pymongo import MongoClient
+from calibration import CALIBRATIONS
+from db_writer import BatchedWriter
 
 import numpy as np
 
@@ -43,6 +45,8 @@ parser.add_argument('comp_serial', type=int, help='The computers serial number f
                    default=simpleTeensyComs.cbla_pc_id, nargs='?' )
 parser.add_argument('grasshopper_serial', type=int, help='The Grasshopper nodes serial number for the purposes of simulation [33333]',
                    default=simpleTeensyComs.udp_node_id, nargs='?' )
+parser.add_argument('--distance-table', dest='distance_table', action='store_true',
+                   help='Look distances up in the ir_distance calibration table (10 to 80 cm) instead of the power law')
 
 args = parser.parse_args()
 
@@ -187,7 +191,9 @@ class Proximity:
         self.actuators = {}
         self.sensors = {}
         self.db = None
+        self.db_writer = None
         self.loop_count = 0
+        self.distance_table = args.distance_table
         self.simple_logger_setup(args)
 
     def simple_logger_setup(self, args):
@@ -220,6 +226,9 @@ class Proximity:
         # Set up the database
         client = MongoClient()
         self.db = client.USBStressTest
+        # readings are written in batches off the control loop
+        self.db_writer = BatchedWriter(self.db.readings)
+        self.db_writer.start()
 
     def map_ports(self, serials):
         '''Map ports to serial number listings
@@ -242,6 +251,9 @@ class Proximity:
         for sn in self.teensyComms:
             for self.actuator in self.actuators[sn]:
                 simpleTeensyComs.Fade(self.teensyComms[sn], sn, self.origin, self.actuator.genByteStr(), 0, 0)
+        if (self.db_writer is not None):
+            self.db_writer.close()
+            print('DB writer: ' + str(self.db_writer.get_stats()))
 
     def simple_logger_loop(self, act_vals = None):
         values = []
@@ -252,7 +264,7 @@ class Proximity:
             for sensor in self.sensors[sn]:
                 self.sensors[sn][sensor] = simpleTeensyComs.Read(self.teensyComms[sn], sn, self.origin, sensor.genByteStr(), 0)
 
-                self.db.readings.insert_one({
+                self.db_writer.put({
                     'datetime': datetime.now(),
                     'teensy_serial': sn,
                     'address': sensor.address,
@@ -277,7 +289,7 @@ class Proximity:
                     self.actuators[sn][actuator] = act_vals[0]
                 simpleTeensyComs.Fade(self.teensyComms[sn], sn, self.origin, actuator.genByteStr(), int(self.actuators[sn][actuator]),0)
 
-                self.db.readings.insert_one({
+                self.db_writer.put({
                     'datetime': datetime.now(),
                     'teensy_serial': sn,
                     'address': actuator.address,
@@ -289,6 +301,8 @@ class Proximity:
                 values.append(self.actuators[sn][actuator])
 
         print('Acts: ' + str(values))
+        if (self.db_writer.is_backpressured()):
+            print('DB writer backpressured: ' + str(self.db_writer.get_stats()))
         return [self.loop_count, readings[0]] + values
     
     def port_serial_type(self, port_serial_string):
@@ -297,7 +311,11 @@ class Proximity:
         
         return (serial, port,)
 
+    # distance in cm from the power law, or from the tabulated IR curve with --distance-table,
+    # which clamps to the sensor's 10 to 80 cm range
     def get_distance(self, val):
+        if (self.distance_table):
+            return float(CALIBRATIONS['ir_distance'].to_units(val))
         volt = val * 0.0048828125
         return 65 * math.pow(volt, -1.10)
  